@@ -0,0 +1,160 @@
+"""
+Linha de comando do almoxarifado, sem interface gráfica:
+
+    python -m almoxarifado entrada --codigo 12 --qtd 5
+    python -m almoxarifado saida --codigo 12 --qtd 2 --solicitante JOAO
+    python -m almoxarifado lote comandos.txt
+
+No modo lote, cada linha do arquivo (ou da entrada padrão, com "-") é um comando com os mesmos
+argumentos, sem o "python -m almoxarifado"; linhas vazias e iniciadas por "#" são ignoradas.
+Todos os comandos do arquivo são gravados juntos (veja operacoes.executar_comandos).
+"""
+import sys
+import time
+import shlex
+import argparse
+import operacoes
+from armazenamento import obter_armazenamento
+
+
+def _montar_parser(classe=argparse.ArgumentParser):
+    parser = classe(prog="python -m almoxarifado", description="Operações do almoxarifado sem interface gráfica.")
+    comandos = parser.add_subparsers(dest="operacao", required=True, parser_class=classe)
+
+    cadastrar = comandos.add_parser("cadastrar", help="Cadastra um produto no estoque")
+    cadastrar.add_argument("--descricao", required=True)
+    cadastrar.add_argument("--qtd", dest="quantidade", required=True)
+    cadastrar.add_argument("--valor", dest="valor_un", required=True)
+    cadastrar.add_argument("--localizacao", default="")
+
+    entrada = comandos.add_parser("entrada", help="Registra a entrada de um produto")
+    entrada.add_argument("--codigo", required=True)
+    entrada.add_argument("--qtd", dest="quantidade", required=True)
+    entrada.add_argument("--operador", dest="operador_id", default="")
+
+    saida = comandos.add_parser("saida", help="Registra a saída de um produto")
+    saida.add_argument("--codigo", required=True)
+    saida.add_argument("--qtd", dest="quantidade", required=True)
+    saida.add_argument("--solicitante", required=True)
+    saida.add_argument("--operador", dest="operador_id", default="")
+
+    epi = comandos.add_parser("epi", help="Registra um EPI ou soma a quantidade a um EPI existente")
+    epi.add_argument("--ca", default="")
+    epi.add_argument("--descricao", default="")
+    epi.add_argument("--qtd", dest="quantidade", required=True)
+
+    retirada = comandos.add_parser("retirada", help="Registra a retirada de um EPI por um colaborador")
+    retirada.add_argument("--colaborador", required=True)
+    retirada.add_argument("--epi", dest="identificador", required=True, help="CA ou descrição do EPI")
+    retirada.add_argument("--qtd", dest="quantidade", required=True)
+
+    lote = comandos.add_parser("lote", help="Executa os comandos de um arquivo, um por linha")
+    lote.add_argument("arquivo", help='Arquivo de comandos ("-" para a entrada padrão)')
+    return parser
+
+
+class _ErroLinha(Exception):
+    pass
+
+
+class _ParserLinha(argparse.ArgumentParser):
+    """
+    Parser das linhas do modo lote: um erro na linha vira exceção em vez de encerrar o programa.
+    """
+
+    def error(self, message):
+        raise _ErroLinha(message)
+
+
+def _comando(argumentos):
+    dados = vars(argumentos).copy()
+    return dados.pop("operacao"), dados
+
+
+def _ler_comandos(parser, arquivo):
+    """
+    Lê os comandos do arquivo. Retorna (comandos, erros), com o número da linha de cada um:
+    [(linha, (operacao, dados))] e [(linha, mensagem)].
+    """
+    linhas = sys.stdin if arquivo == "-" else open(arquivo, "r", encoding="utf-8-sig")
+    comandos, erros = [], []
+    try:
+        for numero, linha in enumerate(linhas, start=1):
+            linha = linha.strip()
+            if not linha or linha.startswith("#"):
+                continue
+            try:
+                argumentos = parser.parse_args(shlex.split(linha))
+                if argumentos.operacao == "lote":
+                    raise _ErroLinha("um lote não pode conter outro lote")
+                comandos.append((numero, _comando(argumentos)))
+            except (_ErroLinha, ValueError) as e:
+                erros.append((numero, str(e)))
+    finally:
+        if linhas is not sys.stdin:
+            linhas.close()
+    return comandos, erros
+
+
+def _descrever(operacao, resultado):
+    if operacao == "cadastrar":
+        return f"Produto cadastrado: {resultado['descricao']} Código: {resultado['codigo']}"
+    if operacao in ("entrada", "saida"):
+        return f"{operacao.capitalize()} registrada: {resultado['descricao']} | Quantidade: {resultado['quantidade']}"
+    if operacao == "epi":
+        return f"EPI {'registrado' if resultado['novo'] else 'atualizado'}: {resultado['identificador']} | Quantidade: {resultado['quantidade']}"
+    return f"Retirada registrada: {resultado['descricao']} | Quantidade restante: {resultado['quantidade']}"
+
+
+def main(argv=None):
+    """
+    Executa a linha de comando e retorna o código de saída (0 se tudo foi registrado).
+    """
+    argumentos = _montar_parser().parse_args(argv)
+    repositorio = obter_armazenamento()
+    with repositorio.travar():
+        repositorio.criar()
+
+    if argumentos.operacao != "lote":
+        comandos, erros = [(0, _comando(argumentos))], []
+    else:
+        try:
+            comandos, erros = _ler_comandos(_montar_parser(_ParserLinha), argumentos.arquivo)
+        except OSError as e:
+            print(f"Erro ao ler o arquivo: {e}", file=sys.stderr)
+            return 1
+    total = len(comandos) + len(erros)
+
+    inicio = time.perf_counter()
+    try:
+        respostas = operacoes.executar_comandos(repositorio, [comando for _, comando in comandos])
+    except TimeoutError as e:
+        print(f"Outra estação está usando as planilhas. Tente novamente.\n{e}", file=sys.stderr)
+        return 1
+    except (operacoes.ErroOperacao, ValueError, OSError) as e:
+        print(f"Erro ao registrar os comandos: {e}", file=sys.stderr)
+        return 1
+    duracao = time.perf_counter() - inicio
+
+    registrados, mantidos = 0, 0
+    for (numero, (operacao, _)), (resultado, erro) in zip(comandos, respostas):
+        if erro is not None:
+            erros.append((numero, erro))
+        else:
+            registrados += 1
+            mantidos += operacao in ("cadastrar", "epi")
+            if argumentos.operacao != "lote":
+                print(_descrever(operacao, resultado))
+
+    for numero, erro in sorted(erros):
+        print(f"Erro: Linha {numero}: {erro}" if numero else f"Erro: {erro}", file=sys.stderr)
+    if erros and mantidos:
+        print(f"{mantidos} cadastro(s) e registro(s) de EPI sem erro foram gravados e mantidos.", file=sys.stderr)
+    if argumentos.operacao == "lote":
+        por_segundo = registrados / duracao if duracao else 0
+        print(f"{registrados} de {total} comando(s) registrado(s) em {duracao:.2f} s ({por_segundo:.0f} por segundo).")
+    return 1 if erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
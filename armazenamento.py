@@ -0,0 +1,1132 @@
+import io
+import os
+import csv
+import sqlite3
+import shutil
+import threading
+import contextlib
+import pandas as pd
+import configuracao
+from diario import ArmazenamentoComDiario
+from eventos import ArmazenamentoComEventos
+from sequencia import SequenciaCodigos
+from travas import TravaArquivo
+from versoes import comparar_versoes, nova_versao, versao_produto
+from colunar import HistoricoColunar
+from paginacao import FonteCSVPaginada, FonteSQLitePaginada
+from esquema import FORMATO_DATA_ISO, aplicar_esquema, data_iso, montar_esquema, preparar_gravacao, tipos_leitura
+from particoes import PlanilhaParticionada, acrescentar_data_iso, datas_movimento, filtrar_periodo, inicio_recente, ultima_linha_csv
+
+
+arquivos = {
+    "estoque": "Planilhas/Estoque.csv",
+    "entrada": "Planilhas/Entrada.csv",
+    "saida": "Planilhas/Saida.csv"
+}
+
+arquivo_epis = "Planilhas/Epis.csv"
+
+colunas = {
+    "estoque": ["CODIGO", "DESCRICAO", "VALOR UN", "VALOR TOTAL", "QUANTIDADE", "DATA", "LOCALIZACAO", "VERSAO"],
+    "entrada": ["CODIGO", "DESCRICAO", "QUANTIDADE", "VALOR UN", "VALOR TOTAL", "DATA", "ID", "DATA ISO"],
+    "saida": ["CODIGO", "DESCRICAO", "QUANTIDADE", "SOLICITANTE", "DATA", "ID", "DATA ISO"],
+    "epis": ["CA", "DESCRICAO", "QUANTIDADE"]
+}
+
+# Tipo de cada coluna de cada tabela (veja esquema.py)
+esquema = montar_esquema(colunas)
+
+
+def caminho_tabela(nome):
+    """
+    Retorna o caminho do arquivo CSV de uma tabela (estoque, entrada, saida ou epis).
+    """
+    if nome == "epis":
+        return arquivo_epis
+    return arquivos[nome]
+
+
+def planilhas_movimento(tabela):
+    """
+    Retorna os arquivos CSV de uma planilha de movimentos: as partições mensais, se existirem,
+    ou o arquivo único.
+    """
+    pasta = os.path.splitext(arquivos[tabela])[0]
+    if configuracao.PARTICOES and os.path.isdir(pasta):
+        return sorted(os.path.join(pasta, nome) for nome in os.listdir(pasta) if nome.endswith(".csv"))
+    return [arquivos[tabela]]
+
+
+def _colunas_leitura(nome, campos, inicio, fim):
+    """
+    Retorna as colunas a ler e se a leitura deve ser filtrada por período.
+    O filtro por período só vale para as planilhas de movimentos e precisa da coluna DATA ISO.
+    """
+    periodo = nome in ("entrada", "saida") and (inicio is not None or fim is not None)
+    if periodo and campos and "DATA ISO" not in campos:
+        return [*campos, "DATA ISO"], True
+    return campos, periodo
+
+
+def completar_movimentos(tabela, linhas):
+    """
+    Completa com a DATA ISO as linhas de movimentos montadas sem ela (por exemplo, as
+    gravadas no diário antes da coluna existir).
+    """
+    posicao = colunas[tabela].index("DATA")
+    return [
+        [*linha, data_iso(linha[posicao])] if len(linha) == len(colunas[tabela]) - 1 else linha
+        for linha in linhas
+    ]
+
+
+def acrescentar_versao(caminho):
+    """
+    Acrescenta a coluna VERSAO (0) a um Estoque.csv gravado antes dela. Só o cabeçalho é lido
+    quando a coluna já existe. Retorna True se o arquivo foi alterado.
+    """
+    try:
+        with open(caminho, "r", newline="", encoding="utf-8") as f:
+            cabecalho = next(csv.reader(f), None)
+            if cabecalho is None or "VERSAO" in cabecalho:
+                return False
+
+            anteriores = len(colunas["estoque"]) - 1
+            temporario = caminho + ".tmp"
+            with open(temporario, "w", newline="", encoding="utf-8") as novo:
+                writer = csv.writer(novo)
+                writer.writerow(colunas["estoque"])
+                writer.writerows((linha + [""] * anteriores)[:anteriores] + ["0"] for linha in csv.reader(f) if linha)
+    except FileNotFoundError:
+        return False
+    os.replace(temporario, caminho)
+    return True
+
+
+class Armazenamento:
+    """
+    Operações comuns a todos os tipos de armazenamento.
+    """
+
+    sequencia = None
+    trava_planilhas = None
+
+    @contextlib.contextmanager
+    def travar(self):
+        """
+        Obtém a trava entre estações da pasta Planilhas (veja travas.py). Toda leitura seguida
+        de alteração deve ser feita dentro dela: "with repositorio.travar():". Se outra estação
+        teve a trava desde a última vez, os dados guardados em memória são descartados.
+        Lança TimeoutError se a trava não for obtida em configuracao.TRAVA_TEMPO_LIMITE segundos.
+        """
+        if self.trava_planilhas is None:
+            self.trava_planilhas = TravaArquivo(
+                configuracao.ARQUIVO_TRAVA, configuracao.TRAVA_TEMPO_LIMITE, configuracao.TRAVA_VALIDADE,
+                configuracao.TRAVA_AVISO, configuracao.ARQUIVO_LOG_TRAVAS, geracao=True
+            )
+        with self.trava_planilhas as trava:
+            if trava.nivel == 1 and trava.outra_estacao:
+                self.descartar_caches()
+            yield trava
+
+    def descartar_caches(self):
+        """
+        Descarta os dados das planilhas guardados em memória, que podem ter sido alterados por outra estação.
+        """
+
+    def proximo_codigo(self):
+        """
+        Reserva e retorna o próximo código disponível para um novo produto.
+        """
+        return self.reservar_codigos(1)[0]
+
+    def reservar_codigos(self, quantidade):
+        """
+        Reserva um bloco de códigos para cadastros em lote.
+        """
+        if self.sequencia is None:
+            self.sequencia = SequenciaCodigos(configuracao.ARQUIVO_SEQUENCIA, self.maior_codigo)
+        return self.sequencia.reservar(quantidade)
+
+    @staticmethod
+    def _maior(codigos):
+        maior = None
+        for codigo in codigos:
+            try:
+                codigo = int(float(codigo))
+            except ValueError:
+                continue
+            if maior is None or codigo > maior:
+                maior = codigo
+        return maior
+
+    def movimentar(self, tabela, linha, codigo, nova_quantidade, versao=None):
+        """
+        Registra uma entrada ou saída e atualiza a quantidade do produto no estoque,
+        na mesma transação quando o armazenamento tem suporte a transações.
+        Com versao (a VERSAO do produto quando ele foi lido), lança ConflitoVersao, sem gravar
+        nada, se outra estação alterou o produto nesse meio tempo (veja versoes.py).
+        """
+        with comparar_versoes(self, None if versao is None else {codigo: versao}), self.transacao():
+            self.registrar_movimento(tabela, linha)
+            self.atualizar_estoque(codigo, nova_quantidade)
+
+    def movimentar_lote(self, tabela, movimentos, versoes=None):
+        """
+        Registra várias entradas ou saídas de uma vez: as linhas são acrescentadas à planilha
+        de movimentos em uma única gravação e o estoque é atualizado uma única vez.
+        movimentos é uma lista de (linha, codigo, nova_quantidade); versoes ({codigo: versão lida})
+        funciona como em movimentar.
+        """
+        with comparar_versoes(self, versoes), self.transacao():
+            self.registrar_movimentos(tabela, [linha for linha, _, _ in movimentos])
+            self.atualizar_estoque_varios({codigo: nova_quantidade for _, codigo, nova_quantidade in movimentos})
+
+    def registrar_movimento(self, tabela, linha):
+        """
+        Adiciona uma linha à planilha de entrada ou de saída.
+        """
+        self.registrar_movimentos(tabela, [linha])
+
+    def atualizar_estoque(self, codigo, nova_quantidade):
+        """
+        Atualiza a quantidade e o valor total de um produto no estoque (e aumenta a versão dele).
+        Lança ValueError se os valores numéricos do produto forem inválidos.
+        """
+        self.atualizar_estoque_varios({codigo: nova_quantidade})
+
+    def repor_epi(self, identificador, quantidade):
+        """
+        Soma uma quantidade ao EPI com o CA ou a descrição informados e retorna a nova quantidade.
+        """
+        return self._somar_epi(identificador, quantidade)
+
+    def retirar_epi(self, identificador, quantidade):
+        """
+        Subtrai uma quantidade do EPI com o CA ou a descrição informados e retorna a nova quantidade.
+        """
+        return self._somar_epi(identificador, -quantidade)
+
+    def retirar_epis(self, retiradas):
+        """
+        Subtrai as quantidades de vários EPIs ([(identificador, quantidade)]) lendo e gravando
+        a planilha de EPIs uma única vez. Retorna a nova quantidade de cada item, na mesma ordem.
+        Lança KeyError, sem alterar nada, se algum EPI não for encontrado.
+        """
+        return self._somar_epis([(identificador, -quantidade) for identificador, quantidade in retiradas])
+
+    def _somar_epi(self, identificador, quantidade):
+        return self._somar_epis([(identificador, quantidade)])[0]
+
+    def _somar_epis(self, alteracoes):
+        with self.transacao():
+            df_epis = self.ler_tabela("epis", dtype={"CA": str})
+            df_epis["CA"] = df_epis["CA"].fillna("").astype(str).str.strip().str.upper()
+            df_epis["DESCRICAO"] = df_epis["DESCRICAO"].fillna("").astype(str).str.strip().str.upper()
+
+            novas_quantidades = []
+            for identificador, quantidade in alteracoes:
+                filtro = (df_epis["CA"] == identificador) | (df_epis["DESCRICAO"] == identificador)
+                if not filtro.any():
+                    raise KeyError(f"EPI '{identificador}' não encontrado.")
+
+                nova_quantidade = float(df_epis.loc[filtro, "QUANTIDADE"].iloc[0]) + quantidade
+                df_epis.loc[filtro, "QUANTIDADE"] = nova_quantidade
+                novas_quantidades.append(nova_quantidade)
+            self.salvar_tabela("epis", df_epis)
+        return novas_quantidades
+
+
+class IndiceProdutos:
+    """
+    Mantém as linhas do Estoque.csv em memória, indexadas por CODIGO.
+    O arquivo só é relido quando sua data de modificação ou tamanho mudam;
+    as escritas feitas pelo próprio sistema atualizam o índice diretamente.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.trava = threading.RLock()
+        self.assinatura = None
+        self.cabecalho = None
+        self.linhas = []
+        self.posicoes = {}
+
+    def _ler_assinatura(self):
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def carregar(self):
+        """
+        Relê o arquivo se ele foi alterado fora do sistema desde a última leitura.
+        """
+        with self.trava:
+            assinatura = self._ler_assinatura()
+            if assinatura is not None and assinatura == self.assinatura:
+                return
+
+            self.cabecalho, self.linhas, self.posicoes = None, [], {}
+            if assinatura is not None:
+                with open(self.caminho, "r", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    self.cabecalho = next(reader, None)
+                    self.linhas = list(reader)
+                for posicao, linha in enumerate(self.linhas):
+                    if linha:
+                        self.posicoes.setdefault(linha[0], []).append(posicao)
+            self.assinatura = assinatura
+
+    def confirmar_escrita(self):
+        """
+        Registra que o arquivo foi gravado pelo próprio sistema a partir do conteúdo do índice.
+        """
+        with self.trava:
+            self.assinatura = self._ler_assinatura()
+
+    def invalidar(self):
+        """
+        Força a releitura do arquivo na próxima consulta.
+        """
+        with self.trava:
+            self.assinatura = None
+
+    def buscar(self, codigo):
+        """
+        Retorna uma cópia da primeira linha com o CODIGO informado, ou None.
+        """
+        with self.trava:
+            self.carregar()
+            posicoes = self.posicoes.get(codigo)
+            if not posicoes:
+                return None
+            return list(self.linhas[posicoes[0]])
+
+    def codigos(self):
+        with self.trava:
+            self.carregar()
+            return list(self.posicoes)
+
+    def adicionar(self, linha):
+        with self.trava:
+            linha = [str(valor) for valor in linha]
+            self.posicoes.setdefault(linha[0], []).append(len(self.linhas))
+            self.linhas.append(linha)
+
+
+class ArmazenamentoCSV(Armazenamento):
+    """
+    Armazena os dados diretamente nos arquivos CSV da pasta Planilhas.
+    As consultas ao estoque usam um índice em memória (IndiceProdutos).
+    Com configuracao.PARTICOES, entradas e saídas ficam em um arquivo por mês (PlanilhaParticionada).
+    """
+
+    def __init__(self):
+        self.indice = IndiceProdutos(arquivos["estoque"])
+        self.fontes = {}
+        self.historicos = {}
+        self.particionadas = {}
+        for tabela in ("entrada", "saida"):
+            pasta_colunar = None
+            if configuracao.COLUNAR:
+                pasta_colunar = os.path.join(configuracao.PASTA_COLUNAR, tabela.capitalize())
+            if configuracao.PARTICOES:
+                self.particionadas[tabela] = PlanilhaParticionada(
+                    os.path.splitext(arquivos[tabela])[0], colunas[tabela], pasta_colunar, esquema[tabela]
+                )
+            elif pasta_colunar:
+                self.historicos[tabela] = HistoricoColunar(pasta_colunar, arquivos[tabela], colunas[tabela])
+
+    def criar(self):
+        """
+        Cria os arquivos CSV necessários para o funcionamento do sistema, caso não existam.
+        Planilhas de movimentos gravadas antes da coluna DATA ISO ganham a coluna, e o estoque, a coluna VERSAO.
+        Na primeira execução com partições, as planilhas únicas de entrada e saída são divididas por mês.
+        """
+        os.makedirs("Planilhas", exist_ok=True)
+
+        for nome in colunas:
+            arquivo = caminho_tabela(nome)
+            if nome not in self.particionadas and not os.path.exists(arquivo):
+                df = pd.DataFrame(columns=colunas[nome])
+                df.to_csv(arquivo, index=False, encoding="utf-8")
+
+        if acrescentar_versao(arquivos["estoque"]):
+            print("Coluna VERSAO acrescentada ao estoque.")
+
+        for tabela in ("entrada", "saida"):
+            migradas = [
+                caminho for caminho in dict.fromkeys([arquivos[tabela], *planilhas_movimento(tabela)])
+                if acrescentar_data_iso(caminho, colunas[tabela])
+            ]
+            if migradas:
+                shutil.rmtree(os.path.join(configuracao.PASTA_COLUNAR, tabela.capitalize()), ignore_errors=True)
+                print(f"Coluna DATA ISO acrescentada a {len(migradas)} planilha(s) de {tabela}.")
+
+        for tabela, planilha in self.particionadas.items():
+            if planilha.migrar(arquivos[tabela]):
+                print(f"Planilha {arquivos[tabela]} dividida em partições mensais em {planilha.pasta}.")
+
+    def descartar_caches(self):
+        """
+        Descarta o índice do estoque, os manifestos das partições e os índices de páginas.
+        """
+        self.indice.invalidar()
+        for planilha in self.particionadas.values():
+            planilha.recarregar()
+        for fonte in self.fontes.values():
+            fonte.invalidar()
+
+    def arquivos_backup(self):
+        """
+        Retorna os arquivos que guardam os dados, para backup.
+        """
+        backup = {nome: caminho_tabela(nome) for nome in colunas if nome not in self.particionadas}
+        for tabela, planilha in self.particionadas.items():
+            for particao, caminho in planilha.arquivos().items():
+                backup[f"{tabela}_{particao}"] = caminho
+        return backup
+
+    def transacao(self):
+        """
+        Os arquivos CSV não têm transações; cada escrita é gravada imediatamente.
+        """
+        return contextlib.nullcontext()
+
+    def buscar_produto(self, codigo):
+        """
+        Busca um produto no estoque pelo código.
+        """
+        return self.indice.buscar(codigo)
+
+    def maior_codigo(self):
+        """
+        Retorna o maior CODIGO do estoque, ou None se estiver vazio.
+        """
+        return self._maior(self.indice.codigos())
+
+    def inserir_produto(self, linha):
+        """
+        Adiciona um novo produto ao final do estoque.
+        """
+        with self.indice.trava:
+            self.indice.carregar()
+            with open(arquivos["estoque"], "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(linha)
+            self.indice.adicionar(linha)
+            self.indice.confirmar_escrita()
+
+    def atualizar_estoque_varios(self, quantidades):
+        """
+        Atualiza a quantidade, o valor total e a versão de vários produtos ({codigo: nova_quantidade}),
+        regravando o estoque uma única vez.
+        Lança ValueError, sem alterar nada, se os valores numéricos de algum produto forem inválidos.
+        """
+        indice = self.indice
+        with indice.trava:
+            indice.carregar()
+
+            alterados = []
+            for codigo, nova_quantidade in quantidades.items():
+                for posicao in indice.posicoes.get(codigo, []):
+                    produto = list(indice.linhas[posicao])
+                    produto[4] = str(nova_quantidade)
+                    produto[3] = str(float(produto[2]) * int(nova_quantidade))
+                    nova_versao(produto, versao_produto(produto) + 1)
+                    alterados.append((posicao, produto))
+            for posicao, produto in alterados:
+                indice.linhas[posicao] = produto
+
+            with open(arquivos["estoque"], "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if indice.cabecalho is not None:
+                    writer.writerow(indice.cabecalho)
+                writer.writerows(indice.linhas)
+            indice.confirmar_escrita()
+
+    def registrar_movimentos(self, tabela, linhas):
+        """
+        Adiciona linhas à planilha de entrada ou de saída, em uma única gravação.
+        """
+        linhas = completar_movimentos(tabela, linhas)
+        if tabela in self.particionadas:
+            self.particionadas[tabela].registrar(linhas)
+            return
+        with open(arquivos[tabela], "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerows(linhas)
+
+    def ultimo_movimento(self, tabela):
+        """
+        Retorna a última linha da planilha de entrada ou de saída, ou None se estiver vazia.
+        """
+        if tabela in self.particionadas:
+            return self.particionadas[tabela].ultimo()
+        return ultima_linha_csv(arquivos[tabela], colunas[tabela])
+
+    def adicionar_epi(self, linha):
+        """
+        Adiciona um novo EPI ao final da planilha de EPIs.
+        """
+        with open(arquivo_epis, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(linha)
+
+    def _particoes(self, tabela, recentes, inicio=None, fim=None):
+        if recentes:
+            corte = inicio_recente(configuracao.MESES_RECENTES)
+            inicio = corte if inicio is None else max(pd.Timestamp(inicio), corte)
+        return self.particionadas[tabela].particoes(inicio, fim)
+
+    def ler_tabela(self, nome, dtype=None, campos=None, inicio=None, fim=None, recentes=False):
+        """
+        Lê uma tabela em um DataFrame, opcionalmente só com as colunas em campos.
+        Para entradas e saídas, inicio e fim filtram o período pela coluna DATA e, com partições,
+        só os meses do período são lidos; recentes=True lê só os últimos configuracao.MESES_RECENTES
+        meses. Entradas e saídas são lidas da cópia colunar quando configuracao.COLUNAR estiver ativo.
+        Sem dtype, as colunas vêm com os tipos do esquema (esquema.py).
+        """
+        leitura, periodo = _colunas_leitura(nome, campos, inicio, fim)
+        if nome in self.particionadas:
+            df = self.particionadas[nome].ler(self._particoes(nome, recentes, inicio, fim), leitura)
+        elif nome in self.historicos:
+            df = aplicar_esquema(self.historicos[nome].ler(leitura, texto=True), esquema[nome])
+        else:
+            df = pd.read_csv(
+                caminho_tabela(nome), encoding="utf-8", dtype=dtype or tipos_leitura(esquema[nome]), usecols=leitura
+            )
+            if not dtype:
+                df = aplicar_esquema(df, esquema[nome])
+            dtype = None
+
+        if dtype:
+            df = df.astype(dtype).where(df.notna())
+        if periodo:
+            df = filtrar_periodo(df, inicio, fim)[list(campos or df.columns)]
+        return df
+
+    def salvar_tabela(self, nome, df, recentes=False):
+        """
+        Substitui todo o conteúdo de uma tabela pelo DataFrame informado.
+        Com partições e recentes=True, só os meses recentes de entradas ou saídas são substituídos.
+        """
+        if nome in self.particionadas:
+            somente = self._particoes(nome, True) if recentes else None
+            self.particionadas[nome].salvar(df, somente)
+            return
+
+        preparar_gravacao(df).to_csv(caminho_tabela(nome), index=False, encoding="utf-8")
+        if nome == "estoque":
+            self.indice.invalidar()
+        if nome in self.historicos:
+            self.historicos[nome].invalidar()
+        if nome in self.fontes:
+            self.fontes[nome].invalidar()
+
+    def fonte_paginada(self, tabela, recentes=False):
+        """
+        Retorna uma fonte que lê a planilha de entrada ou de saída em páginas.
+        Com partições e recentes=True, a fonte percorre só os meses recentes.
+        """
+        if tabela in self.particionadas:
+            return self.particionadas[tabela].fonte(self._particoes(tabela, recentes))
+        if tabela not in self.fontes:
+            self.fontes[tabela] = FonteCSVPaginada(arquivos[tabela], colunas[tabela], esquema[tabela])
+        return self.fontes[tabela]
+
+    def compactar(self):
+        """
+        Os arquivos CSV já estão no formato final; não há nada a compactar.
+        """
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    """
+    Armazena os dados em um banco SQLite com índices por CODIGO, CA e DESCRICAO.
+    Os arquivos CSV continuam disponíveis para importação e exportação.
+    """
+
+    tipos = {
+        "CODIGO": "INTEGER", "ID": "INTEGER", "QUANTIDADE": "REAL", "VALOR UN": "REAL", "VALOR TOTAL": "REAL",
+        "VERSAO": "INTEGER"
+    }
+
+    indices = {
+        "estoque": ["CODIGO", "DESCRICAO"],
+        "entrada": ["CODIGO", "DATA ISO"],
+        "saida": ["CODIGO", "DATA ISO"],
+        "epis": ["CA", "DESCRICAO"]
+    }
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.conexao = None
+        self.trava = threading.RLock()
+
+    def conectar(self):
+        if self.conexao is None:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            self.conexao = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+            self.conexao.execute("PRAGMA journal_mode=WAL")
+            self.conexao.execute("PRAGMA synchronous=NORMAL")
+        return self.conexao
+
+    def criar(self):
+        """
+        Cria as tabelas e índices do banco. Na primeira execução, importa os arquivos CSV existentes.
+        """
+        novo = not os.path.exists(self.caminho)
+        conexao = self.conectar()
+
+        with self.transacao():
+            for nome, cols in colunas.items():
+                definicao = ", ".join(f'"{c}" {self.tipos.get(c, "TEXT")}' for c in cols)
+                conexao.execute(f"CREATE TABLE IF NOT EXISTS {nome} ({definicao})")
+                if nome in ("entrada", "saida"):
+                    self._completar_data_iso(nome)
+                if nome == "estoque":
+                    self._completar_versao()
+                for coluna in self.indices[nome]:
+                    nome_indice = f"idx_{nome}_{coluna.lower().replace(' ', '_')}"
+                    conexao.execute(f'CREATE INDEX IF NOT EXISTS {nome_indice} ON {nome} ("{coluna}")')
+
+        if novo:
+            self.importar_csv()
+
+    def _completar_data_iso(self, nome):
+        """
+        Cria a coluna DATA ISO em bancos anteriores a ela e a calcula, de uma vez, para as linhas sem ela.
+        """
+        conexao = self.conectar()
+        existentes = [coluna[1] for coluna in conexao.execute(f"PRAGMA table_info({nome})")]
+        if "DATA ISO" not in existentes:
+            conexao.execute(f'ALTER TABLE {nome} ADD COLUMN "DATA ISO" TEXT')
+        df = pd.read_sql_query(f'SELECT rowid, DATA FROM {nome} WHERE "DATA ISO" IS NULL', conexao)
+        if df.empty:
+            return
+        datas = datas_movimento(df["DATA"]).dt.strftime(FORMATO_DATA_ISO)
+        conexao.executemany(
+            f'UPDATE {nome} SET "DATA ISO" = ? WHERE rowid = ?',
+            zip(datas.where(datas.notna(), None).tolist(), df["rowid"].tolist())
+        )
+
+    def _completar_versao(self):
+        """
+        Cria a coluna VERSAO em bancos anteriores a ela; produtos sem versão ficam com 0.
+        """
+        conexao = self.conectar()
+        existentes = [coluna[1] for coluna in conexao.execute("PRAGMA table_info(estoque)")]
+        if "VERSAO" not in existentes:
+            conexao.execute("ALTER TABLE estoque ADD COLUMN VERSAO INTEGER")
+        conexao.execute("UPDATE estoque SET VERSAO = 0 WHERE VERSAO IS NULL")
+
+    def arquivos_backup(self):
+        """
+        Grava no arquivo do banco as alterações pendentes no log WAL e retorna o arquivo para backup.
+        """
+        with self.trava:
+            self.conectar().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"banco": self.caminho}
+
+    @contextlib.contextmanager
+    def transacao(self):
+        """
+        Agrupa as operações do bloco em uma única transação.
+        Transações aninhadas fazem parte da transação mais externa.
+        """
+        with self.trava:
+            conexao = self.conectar()
+            if conexao.in_transaction:
+                yield conexao
+                return
+
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                yield conexao
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+            conexao.execute("COMMIT")
+
+    def _inserir(self, nome, linhas):
+        cols = colunas[nome]
+        campos = ", ".join(f'"{c}"' for c in cols)
+        marcadores = ", ".join("?" for _ in cols)
+        with self.transacao() as conexao:
+            conexao.executemany(f"INSERT INTO {nome} ({campos}) VALUES ({marcadores})", linhas)
+
+    def _selecionar(self, nome):
+        return ", ".join(f'"{c}"' for c in colunas[nome])
+
+    def buscar_produto(self, codigo):
+        """
+        Busca um produto no estoque pelo código, usando o índice de CODIGO.
+        """
+        with self.trava:
+            row = self.conectar().execute(
+                f"SELECT {self._selecionar('estoque')} FROM estoque WHERE CODIGO = ? ORDER BY rowid LIMIT 1",
+                (codigo,)
+            ).fetchone()
+        if row is None:
+            return None
+        return ["" if valor is None else str(valor) for valor in row]
+
+    def maior_codigo(self):
+        """
+        Retorna o maior CODIGO do estoque, ou None se estiver vazio.
+        """
+        with self.trava:
+            codigos = self.conectar().execute("SELECT DISTINCT CODIGO FROM estoque").fetchall()
+        return self._maior(str(codigo) for (codigo,) in codigos)
+
+    def inserir_produto(self, linha):
+        """
+        Adiciona um novo produto ao estoque.
+        """
+        self._inserir("estoque", [linha])
+
+    def atualizar_estoque_varios(self, quantidades):
+        """
+        Atualiza a quantidade, o valor total e a versão de vários produtos ({codigo: nova_quantidade})
+        na mesma transação.
+        Lança ValueError, sem alterar nada, se os valores numéricos de algum produto forem inválidos.
+        """
+        alteracoes = []
+        for codigo, nova_quantidade in quantidades.items():
+            produto = self.buscar_produto(codigo)
+            if produto is not None:
+                alteracoes.append((nova_quantidade, float(produto[2]) * int(nova_quantidade), codigo))
+
+        with self.transacao() as conexao:
+            conexao.executemany(
+                'UPDATE estoque SET QUANTIDADE = ?, "VALOR TOTAL" = ?, VERSAO = COALESCE(VERSAO, 0) + 1 WHERE CODIGO = ?',
+                alteracoes
+            )
+
+    def registrar_movimentos(self, tabela, linhas):
+        """
+        Adiciona linhas à tabela de entrada ou de saída.
+        """
+        self._inserir(tabela, completar_movimentos(tabela, linhas))
+
+    def ultimo_movimento(self, tabela):
+        """
+        Retorna a última linha da tabela de entrada ou de saída, ou None se estiver vazia.
+        """
+        with self.trava:
+            row = self.conectar().execute(
+                f"SELECT {self._selecionar(tabela)} FROM {tabela} ORDER BY rowid DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        return ["" if valor is None else str(valor) for valor in row]
+
+    def adicionar_epi(self, linha):
+        """
+        Adiciona um novo EPI à tabela de EPIs.
+        """
+        self._inserir("epis", [linha])
+
+    def ler_tabela(self, nome, dtype=None, campos=None, inicio=None, fim=None, recentes=False):
+        """
+        Lê uma tabela em um DataFrame, na ordem de inserção, opcionalmente só com as colunas em campos.
+        Para entradas e saídas, inicio e fim filtram o período pela coluna DATA ISO, usando o índice dela.
+        O banco não é particionado, então recentes é ignorado.
+        """
+        selecao = ", ".join(f'"{c}"' for c in campos) if campos else self._selecionar(nome)
+        condicoes, parametros = [], []
+        if nome in ("entrada", "saida"):
+            if inicio is not None:
+                condicoes.append('"DATA ISO" >= ?')
+                parametros.append(pd.Timestamp(inicio).strftime(FORMATO_DATA_ISO))
+            if fim is not None:
+                fim = pd.Timestamp(fim)
+                if fim == fim.normalize():
+                    condicoes.append('"DATA ISO" < ?')
+                    fim += pd.Timedelta(days=1)
+                else:
+                    condicoes.append('"DATA ISO" <= ?')
+                parametros.append(fim.strftime(FORMATO_DATA_ISO))
+        filtro = f"WHERE {' AND '.join(condicoes)} " if condicoes else ""
+        with self.trava:
+            df = pd.read_sql_query(
+                f"SELECT {selecao} FROM {nome} {filtro}ORDER BY rowid", self.conectar(), params=parametros
+            )
+        if dtype:
+            df = df.astype(dtype).where(df.notna())
+        else:
+            df = aplicar_esquema(df, esquema[nome])
+        return df
+
+    def salvar_tabela(self, nome, df, recentes=False):
+        """
+        Substitui todo o conteúdo de uma tabela pelo DataFrame informado.
+        """
+        df = preparar_gravacao(df.reindex(columns=colunas[nome])).astype(object)
+        linhas = df.where(pd.notna(df), None).values.tolist()
+        with self.transacao() as conexao:
+            conexao.execute(f"DELETE FROM {nome}")
+            self._inserir(nome, linhas)
+
+    def fonte_paginada(self, tabela, recentes=False):
+        """
+        Retorna uma fonte que lê a tabela de entrada ou de saída em páginas.
+        """
+        return FonteSQLitePaginada(self, tabela, colunas[tabela], esquema[tabela])
+
+    def importar_csv(self):
+        """
+        Substitui o conteúdo do banco pelo dos arquivos CSV da pasta Planilhas.
+        Linhas com colunas faltando ou sobrando são ajustadas ao cabeçalho esperado.
+        """
+        with self.transacao() as conexao:
+            for nome, cols in colunas.items():
+                conexao.execute(f"DELETE FROM {nome}")
+                caminhos = planilhas_movimento(nome) if nome in ("entrada", "saida") else [caminho_tabela(nome)]
+                for caminho in caminhos:
+                    try:
+                        with open(caminho, "r", encoding="utf-8") as f:
+                            reader = csv.reader(f)
+                            next(reader, None)
+                            linhas = [
+                                [valor if valor != "" else None for valor in (linha + [""] * len(cols))[:len(cols)]]
+                                for linha in reader if linha
+                            ]
+                    except FileNotFoundError:
+                        continue
+                    self._inserir(nome, linhas)
+                if nome in ("entrada", "saida"):
+                    self._completar_data_iso(nome)
+            self._completar_versao()
+
+    def exportar_csv(self):
+        """
+        Grava o conteúdo do banco nos arquivos CSV da pasta Planilhas.
+        """
+        os.makedirs("Planilhas", exist_ok=True)
+        for nome in colunas:
+            preparar_gravacao(self.ler_tabela(nome)).to_csv(caminho_tabela(nome), index=False, encoding="utf-8")
+
+    def compactar(self):
+        """
+        O banco é a fonte dos dados; use exportar_csv() para gerar os arquivos CSV.
+        """
+
+
+class ArquivoRegistros:
+    """
+    Arquivo de registros de tamanho fixo para o estoque, com um índice de posições por CODIGO.
+    Cada produto ocupa sempre os mesmos bytes, então a quantidade e o valor total
+    podem ser alterados no próprio lugar, sem regravar o arquivo inteiro.
+    O primeiro registro guarda os nomes das colunas.
+    """
+
+    larguras = {
+        "CODIGO": 16,
+        "DESCRICAO": 200,
+        "VALOR UN": 24,
+        "VALOR TOTAL": 24,
+        "QUANTIDADE": 24,
+        "DATA": 24,
+        "LOCALIZACAO": 64,
+        "VERSAO": 12
+    }
+
+    def __init__(self, caminho, campos=None):
+        self.caminho = caminho
+        self.campos = campos or colunas["estoque"]
+        self.inicios = []
+        inicio = 0
+        for campo in self.campos:
+            self.inicios.append(inicio)
+            inicio += self.larguras[campo]
+        self.tamanho = inicio + 1
+        self.trava = threading.RLock()
+        self.assinatura = None
+        self.quantidade = 0
+        self.posicoes = {}
+
+    def _ler_assinatura(self):
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _codificar(self, linha):
+        registro = bytearray()
+        for campo, valor in zip(self.campos, linha):
+            dados = ("" if valor is None else str(valor)).encode("utf-8")
+            if len(dados) > self.larguras[campo]:
+                raise ValueError(f"O campo {campo} excede o tamanho máximo de {self.larguras[campo]} bytes.")
+            registro += dados.ljust(self.larguras[campo])
+        return bytes(registro.ljust(self.tamanho - 1)) + b"\n"
+
+    def _decodificar(self, registro):
+        return [
+            registro[inicio:inicio + self.larguras[campo]].decode("utf-8").rstrip()
+            for campo, inicio in zip(self.campos, self.inicios)
+        ]
+
+    def carregar(self):
+        """
+        Monta o índice de posições, relendo o arquivo se ele foi alterado fora do sistema.
+        """
+        with self.trava:
+            assinatura = self._ler_assinatura()
+            if assinatura is not None and assinatura == self.assinatura:
+                return
+
+            self.quantidade, self.posicoes = 0, {}
+            if assinatura is not None:
+                largura_codigo = self.larguras["CODIGO"]
+                with open(self.caminho, "rb") as f:
+                    f.seek(self.tamanho)
+                    while True:
+                        registro = f.read(self.tamanho)
+                        if len(registro) < self.tamanho:
+                            break
+                        codigo = registro[:largura_codigo].decode("utf-8").rstrip()
+                        self.posicoes.setdefault(codigo, []).append(self.quantidade)
+                        self.quantidade += 1
+            self.assinatura = assinatura
+
+    def invalidar(self):
+        """
+        Força a releitura do índice de posições na próxima consulta.
+        """
+        with self.trava:
+            self.assinatura = None
+
+    def atualizado(self):
+        """
+        Retorna se o arquivo foi gravado com as colunas atuais (o primeiro registro guarda os nomes delas).
+        """
+        with open(self.caminho, "rb") as f:
+            return f.read(self.tamanho) == self._codificar(self.campos)
+
+    def _confirmar_escrita(self):
+        self.assinatura = self._ler_assinatura()
+
+    def gravar(self, linhas):
+        """
+        Regrava o arquivo inteiro com as linhas informadas.
+        """
+        with self.trava:
+            temporario = self.caminho + ".tmp"
+            with open(temporario, "wb") as f:
+                f.write(self._codificar(self.campos))
+                for linha in linhas:
+                    f.write(self._codificar(linha))
+            os.replace(temporario, self.caminho)
+            self.assinatura = None
+            self.carregar()
+
+    def ler(self, posicao):
+        with self.trava:
+            with open(self.caminho, "rb") as f:
+                f.seek((posicao + 1) * self.tamanho)
+                return self._decodificar(f.read(self.tamanho))
+
+    def buscar(self, codigo):
+        """
+        Retorna a primeira linha com o CODIGO informado, ou None.
+        """
+        with self.trava:
+            self.carregar()
+            posicoes = self.posicoes.get(codigo)
+            if not posicoes:
+                return None
+            return self.ler(posicoes[0])
+
+    def codigos(self):
+        with self.trava:
+            self.carregar()
+            return list(self.posicoes)
+
+    def adicionar(self, linha):
+        """
+        Adiciona um registro ao final do arquivo.
+        """
+        with self.trava:
+            self.carregar()
+            registro = self._codificar(linha)
+            with open(self.caminho, "ab") as f:
+                f.write(registro)
+            self.posicoes.setdefault(str(linha[0]), []).append(self.quantidade)
+            self.quantidade += 1
+            self._confirmar_escrita()
+
+    def alterar(self, posicao, valores):
+        """
+        Altera campos de um registro no próprio lugar. Só os bytes entre o primeiro
+        e o último campo alterado são gravados.
+        """
+        with self.trava:
+            linha = self.ler(posicao)
+            for campo, valor in valores.items():
+                linha[self.campos.index(campo)] = valor
+            registro = self._codificar(linha)
+
+            indices = [self.campos.index(campo) for campo in valores]
+            inicio = self.inicios[min(indices)]
+            fim = self.inicios[max(indices)] + self.larguras[self.campos[max(indices)]]
+            with open(self.caminho, "r+b") as f:
+                f.seek((posicao + 1) * self.tamanho + inicio)
+                f.write(registro[inicio:fim])
+            self._confirmar_escrita()
+
+    def linhas(self):
+        with self.trava:
+            self.carregar()
+            with open(self.caminho, "rb") as f:
+                f.seek(self.tamanho)
+                dados = f.read(self.quantidade * self.tamanho)
+        return [
+            self._decodificar(dados[i * self.tamanho:(i + 1) * self.tamanho])
+            for i in range(self.quantidade)
+        ]
+
+
+class ArmazenamentoRegistros(ArmazenamentoCSV):
+    """
+    Guarda o estoque em um arquivo de registros de tamanho fixo (ArquivoRegistros),
+    que permite alterar um produto sem regravar o arquivo. Entradas, saídas e EPIs
+    continuam nos arquivos CSV. compactar() exporta o estoque de volta para o Estoque.csv.
+    """
+
+    def __init__(self, caminho):
+        super().__init__()
+        self.registros = ArquivoRegistros(caminho)
+
+    def criar(self):
+        """
+        Cria os arquivos necessários. Na primeira execução, importa o Estoque.csv existente;
+        um arquivo de registros anterior à coluna VERSAO é convertido.
+        """
+        super().criar()
+        if not os.path.exists(self.registros.caminho):
+            with open(arquivos["estoque"], "r", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                self.registros.gravar([linha for linha in reader if linha])
+        elif not self.registros.atualizado():
+            # Arquivo gravado antes da coluna VERSAO: lido com as colunas antigas e regravado
+            antigo = ArquivoRegistros(self.registros.caminho, colunas["estoque"][:-1])
+            self.registros.gravar([linha + ["0"] for linha in antigo.linhas()])
+            print("Coluna VERSAO acrescentada ao estoque.")
+
+    def descartar_caches(self):
+        super().descartar_caches()
+        self.registros.invalidar()
+
+    def arquivos_backup(self):
+        """
+        Retorna os arquivos que guardam os dados, para backup.
+        """
+        return {**super().arquivos_backup(), "estoque": self.registros.caminho}
+
+    def buscar_produto(self, codigo):
+        """
+        Busca um produto no estoque pelo código, lendo só o registro dele.
+        """
+        return self.registros.buscar(codigo)
+
+    def maior_codigo(self):
+        """
+        Retorna o maior CODIGO do estoque, ou None se estiver vazio.
+        """
+        return self._maior(self.registros.codigos())
+
+    def inserir_produto(self, linha):
+        """
+        Adiciona um novo produto ao final do estoque.
+        """
+        self.registros.adicionar(linha)
+
+    def atualizar_estoque_varios(self, quantidades):
+        """
+        Atualiza a quantidade, o valor total e a versão de vários produtos ({codigo: nova_quantidade}),
+        gravando só esses campos de cada registro.
+        Lança ValueError, sem alterar nada, se os valores numéricos de algum produto forem inválidos.
+        """
+        registros = self.registros
+        with registros.trava:
+            registros.carregar()
+            alteracoes = []
+            for codigo, nova_quantidade in quantidades.items():
+                for posicao in registros.posicoes.get(codigo, []):
+                    produto = registros.ler(posicao)
+                    valor_total = float(produto[2]) * int(nova_quantidade)
+                    alteracoes.append((posicao, {
+                        "VALOR TOTAL": valor_total, "QUANTIDADE": nova_quantidade, "VERSAO": versao_produto(produto) + 1
+                    }))
+            for posicao, valores in alteracoes:
+                registros.alterar(posicao, valores)
+
+    def ler_tabela(self, nome, dtype=None, campos=None, inicio=None, fim=None, recentes=False):
+        """
+        Lê uma tabela em um DataFrame, opcionalmente só com as colunas em campos.
+        """
+        if nome != "estoque":
+            return super().ler_tabela(nome, dtype, campos, inicio, fim, recentes)
+
+        texto = io.StringIO()
+        writer = csv.writer(texto)
+        writer.writerow(colunas["estoque"])
+        writer.writerows(self.registros.linhas())
+        texto.seek(0)
+        if dtype:
+            return pd.read_csv(texto, dtype=dtype, usecols=campos)
+        df = pd.read_csv(texto, dtype=tipos_leitura(esquema["estoque"]), usecols=campos)
+        return aplicar_esquema(df, esquema["estoque"])
+
+    def salvar_tabela(self, nome, df, recentes=False):
+        """
+        Substitui todo o conteúdo de uma tabela pelo DataFrame informado.
+        """
+        if nome != "estoque":
+            return super().salvar_tabela(nome, df, recentes)
+
+        texto = preparar_gravacao(df.reindex(columns=colunas["estoque"])).to_csv(index=False)
+        linhas = list(csv.reader(io.StringIO(texto)))[1:]
+        self.registros.gravar(linhas)
+
+    def compactar(self):
+        """
+        Exporta o arquivo de registros para o Estoque.csv, no formato de sempre.
+        """
+        temporario = arquivos["estoque"] + ".tmp"
+        with open(temporario, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(colunas["estoque"])
+            writer.writerows(self.registros.linhas())
+        os.replace(temporario, arquivos["estoque"])
+        self.indice.invalidar()
+
+
+_armazenamento = None
+
+
+def obter_armazenamento():
+    """
+    Retorna o armazenamento configurado em configuracao.BACKEND.
+    """
+    global _armazenamento
+    if _armazenamento is None:
+        if configuracao.BACKEND == "sqlite":
+            _armazenamento = ArmazenamentoSQLite(configuracao.BANCO_SQLITE)
+        elif configuracao.BACKEND == "registros":
+            _armazenamento = ArmazenamentoRegistros(configuracao.ARQUIVO_REGISTROS)
+        elif configuracao.BACKEND == "csv":
+            _armazenamento = ArmazenamentoCSV()
+        else:
+            raise ValueError(f"Backend de armazenamento desconhecido: {configuracao.BACKEND}")
+        if configuracao.EVENTOS:
+            _armazenamento = ArmazenamentoComEventos(_armazenamento, configuracao.PASTA_EVENTOS, colunas, esquema)
+        if configuracao.DIARIO:
+            _armazenamento = ArmazenamentoComDiario(_armazenamento, configuracao.ARQUIVO_DIARIO)
+    return _armazenamento
@@ -0,0 +1,237 @@
+import io
+import os
+import csv
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+
+class HistoricoColunar:
+    """
+    Cópia binária e colunar de uma planilha de movimentos (Entrada.csv ou Saida.csv).
+    Cada coluna é um arquivo NumPy lido por mapeamento de memória: colunas numéricas
+    em float64 e colunas de texto como códigos int32 de um dicionário de valores.
+    O arquivo meta.json confirma quantas linhas são válidas e até onde o CSV já foi lido,
+    então novas linhas do CSV são acrescentadas de forma incremental a cada leitura.
+    Se o CSV for regravado (e não só acrescido), a cópia é refeita por completo.
+    """
+
+    numericas = ("QUANTIDADE", "VALOR UN", "VALOR TOTAL")
+    tamanho_lote = 50000
+
+    def __init__(self, pasta, caminho_csv, colunas):
+        self.pasta = pasta
+        self.caminho_csv = caminho_csv
+        self.colunas = colunas
+        self.caminho_meta = os.path.join(pasta, "meta.json")
+        self.trava = threading.RLock()
+        self.meta = None
+        self.dicionarios = {}
+
+    def _arquivo(self, coluna, extensao):
+        return os.path.join(self.pasta, coluna.replace(" ", "_") + extensao)
+
+    def _meta_vazio(self):
+        return {
+            "linhas": 0,
+            "posicao": 0,
+            "verificacao": "",
+            "assinatura": None,
+            "dicionarios": {coluna: 0 for coluna in self.colunas if coluna not in self.numericas}
+        }
+
+    def _carregar_meta(self):
+        if self.meta is not None:
+            return
+        try:
+            with open(self.caminho_meta, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.meta = None
+            return
+
+        self.dicionarios = {}
+        for coluna, tamanho in self.meta["dicionarios"].items():
+            arquivo = self._arquivo(coluna, ".dic")
+            with open(arquivo, "r", encoding="utf-8") as f:
+                linhas = f.readlines()
+            if len(linhas) > tamanho:
+                with open(arquivo, "w", encoding="utf-8") as f:
+                    f.writelines(linhas[:tamanho])
+            valores = [json.loads(linha) for linha in linhas[:tamanho]]
+            self.dicionarios[coluna] = (valores, {valor: codigo for codigo, valor in enumerate(valores)})
+
+    def _gravar_meta(self):
+        temporario = self.caminho_meta + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(temporario, self.caminho_meta)
+
+    def _verificacao(self, f, posicao):
+        inicio = max(0, posicao - 256)
+        f.seek(inicio)
+        return hashlib.sha1(f.read(posicao - inicio)).hexdigest()
+
+    def _recriar(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+        os.makedirs(self.pasta, exist_ok=True)
+        self.meta = self._meta_vazio()
+        self.dicionarios = {coluna: ([], {}) for coluna in self.meta["dicionarios"]}
+        for coluna in self.colunas:
+            extensao = ".f8" if coluna in self.numericas else ".i4"
+            open(self._arquivo(coluna, extensao), "wb").close()
+            if coluna not in self.numericas:
+                open(self._arquivo(coluna, ".dic"), "wb").close()
+
+    def invalidar(self):
+        """
+        Descarta a cópia colunar; ela é refeita na próxima leitura.
+        """
+        with self.trava:
+            self.meta = None
+            try:
+                os.remove(self.caminho_meta)
+            except FileNotFoundError:
+                pass
+
+    def sincronizar(self):
+        """
+        Acrescenta as linhas novas do CSV à cópia colunar, ou a refaz se o CSV foi regravado.
+        """
+        with self.trava:
+            self._carregar_meta()
+            try:
+                st = os.stat(self.caminho_csv)
+            except FileNotFoundError:
+                return
+            assinatura = [st.st_size, st.st_mtime_ns]
+            if self.meta is not None and self.meta["assinatura"] == assinatura:
+                return
+
+            with open(self.caminho_csv, "rb") as f:
+                if (
+                    self.meta is None
+                    or st.st_size <= self.meta["posicao"]
+                    or self._verificacao(f, self.meta["posicao"]) != self.meta["verificacao"]
+                ):
+                    self._recriar()
+
+                f.seek(self.meta["posicao"])
+                dados = f.read(st.st_size - self.meta["posicao"])
+                completo = dados.rfind(b"\n") + 1
+
+                reader = csv.reader(io.StringIO(dados[:completo].decode("utf-8"), newline=""))
+                if self.meta["posicao"] == 0:
+                    next(reader, None)
+
+                lote = []
+                for linha in reader:
+                    if not linha:
+                        continue
+                    lote.append((linha + [""] * len(self.colunas))[:len(self.colunas)])
+                    if len(lote) >= self.tamanho_lote:
+                        self._acrescentar(lote)
+                        lote = []
+                self._acrescentar(lote)
+
+                self.meta["posicao"] += completo
+                self.meta["verificacao"] = self._verificacao(f, self.meta["posicao"])
+                self.meta["assinatura"] = assinatura
+                self._gravar_meta()
+
+    def _acrescentar(self, linhas):
+        if not linhas:
+            return
+        n = self.meta["linhas"]
+        for i, coluna in enumerate(self.colunas):
+            valores = [linha[i] for linha in linhas]
+            if coluna in self.numericas:
+                arquivo = self._arquivo(coluna, ".f8")
+                dados = np.array([self._numero(valor) for valor in valores], dtype="<f8")
+            else:
+                arquivo = self._arquivo(coluna, ".i4")
+                dados = self._codificar(coluna, valores)
+            with open(arquivo, "r+b") as f:
+                f.seek(n * dados.itemsize)
+                f.write(dados.tobytes())
+        self.meta["linhas"] = n + len(linhas)
+
+    @staticmethod
+    def _numero(valor):
+        try:
+            return float(valor)
+        except ValueError:
+            return np.nan
+
+    def _codificar(self, coluna, valores):
+        dicionario, codigos = self.dicionarios[coluna]
+        novos = []
+        resultado = np.empty(len(valores), dtype="<i4")
+        for i, valor in enumerate(valores):
+            if valor == "":
+                resultado[i] = -1
+                continue
+            codigo = codigos.get(valor)
+            if codigo is None:
+                codigo = codigos[valor] = len(dicionario)
+                dicionario.append(valor)
+                novos.append(valor)
+            resultado[i] = codigo
+
+        if novos:
+            with open(self._arquivo(coluna, ".dic"), "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(valor, ensure_ascii=False) + "\n" for valor in novos)
+            self.meta["dicionarios"][coluna] = len(dicionario)
+        return resultado
+
+    def ler(self, campos=None, categorias=False, texto=False):
+        """
+        Lê as colunas pedidas (todas, se campos for None) em um DataFrame.
+        Com categorias=True, as colunas de texto vêm como Categorical; senão, como valores,
+        numéricos quando todos os valores da coluna forem números (como faria o read_csv).
+        Com texto=True, elas vêm exatamente como estão no CSV (o ID "001" continua "001").
+        """
+        with self.trava:
+            self.sincronizar()
+            n = self.meta["linhas"] if self.meta else 0
+            dados = {}
+            for coluna in campos or self.colunas:
+                if coluna in self.numericas:
+                    dados[coluna] = self._mapear(self._arquivo(coluna, ".f8"), "<f8", n)
+                else:
+                    codigos = self._mapear(self._arquivo(coluna, ".i4"), "<i4", n)
+                    dados[coluna] = self._decodificar(coluna, codigos, categorias, texto)
+        return pd.DataFrame(dados, columns=list(campos or self.colunas))
+
+    @staticmethod
+    def _mapear(arquivo, tipo, n):
+        if n == 0:
+            return np.empty(0, dtype=tipo)
+        return np.memmap(arquivo, dtype=tipo, mode="r", shape=(n,))
+
+    def _decodificar(self, coluna, codigos, categorias, texto=False):
+        codigos = np.asarray(codigos)
+        serie = pd.Series(self.dicionarios[coluna][0], dtype=object)
+        if serie.empty:
+            return np.full(len(codigos), np.nan)
+        if not texto:
+            try:
+                numeros = pd.to_numeric(serie)
+                if numeros.is_unique:
+                    serie = numeros
+            except (ValueError, TypeError):
+                pass
+        valores = serie.to_numpy()
+
+        if categorias:
+            return pd.Categorical.from_codes(codigos, categories=pd.Index(valores))
+
+        faltando = codigos < 0
+        resultado = valores[np.where(faltando, 0, codigos)]
+        if faltando.any():
+            resultado = resultado.astype(float if resultado.dtype.kind in "iuf" else object)
+            resultado[faltando] = np.nan
+        return resultado
@@ -0,0 +1,83 @@
+# Configurações do sistema
+
+# Armazenamento dos dados:
+# "csv"       - arquivos em Planilhas/
+# "sqlite"    - banco indexado; os arquivos CSV servem para importação/exportação
+# "registros" - estoque em arquivo de registros de tamanho fixo, alterado no próprio lugar
+#               e exportado para o Estoque.csv periodicamente
+BACKEND = "csv"
+
+BANCO_SQLITE = "Planilhas/Almoxarifado.db"
+
+ARQUIVO_REGISTROS = "Planilhas/Estoque.dat"
+
+# Cópia binária colunar (NumPy) de Entrada.csv e Saida.csv, usada nas leituras das tabelas e relatórios.
+# Fica sincronizada com os arquivos CSV, que continuam sendo os dados originais. Opcional:
+# ao ativar, a cópia é criada na primeira execução.
+COLUNAR = False
+
+PASTA_COLUNAR = "Planilhas/Colunar"
+
+# Guarda as entradas e saídas em um arquivo por mês (Planilhas/Entrada/2026-10.csv). Opcional:
+# ao ativar, Entrada.csv e Saida.csv são divididos por mês na primeira execução.
+PARTICOES = False
+# Meses exibidos por padrão na tela e nos relatórios de entradas e saídas
+MESES_RECENTES = 3
+
+# Número de linhas carregadas por vez ao exibir as tabelas de Entrada e Saída
+TAMANHO_PAGINA = 500
+
+# Tempo (milissegundos) que a pesquisa espera depois da última tecla antes de filtrar a tabela
+PESQUISA_ESPERA = 250
+
+# Número máximo de produtos exibidos na pesquisa aproximada ("~parafuzo")
+PESQUISA_APROXIMADA_LIMITE = 50
+# Semelhança mínima (0 a 1) para um produto ou EPI aparecer na pesquisa aproximada
+PESQUISA_APROXIMADA_MINIMO = 0.6
+
+# Próximo código de produto a ser usado no cadastro
+ARQUIVO_SEQUENCIA = "Planilhas/Sequencia.txt"
+
+# Diário (write-ahead log) das entradas e saídas: cada movimentação é gravada em um único
+# registro com fsync e aplicada às planilhas em segundo plano. É reaplicado ao iniciar. Opcional.
+DIARIO = False
+
+ARQUIVO_DIARIO = "Planilhas/Diario.log"
+
+# Log de eventos de todas as alterações (cadastro, entrada, saída, EPIs) com snapshots do estoque.
+# Ao iniciar, o estoque é carregado do último snapshot. Para compactar: python eventos.py. Opcional:
+# ao ativar, o primeiro snapshot é gerado a partir das planilhas.
+EVENTOS = False
+
+PASTA_EVENTOS = "Planilhas/Eventos"
+
+# Trava entre estações (vários computadores usando a mesma pasta Planilhas): toda alteração
+# das planilhas é feita com a trava. Tempos em segundos.
+ARQUIVO_TRAVA = "Planilhas/Planilhas.lock"
+# Tempo máximo de espera pela trava antes de desistir da operação
+TRAVA_TEMPO_LIMITE = 30
+# Tempo sem renovação depois do qual a trava de uma estação é considerada abandonada
+TRAVA_VALIDADE = 20
+# Esperas a partir deste tempo são anotadas em ARQUIVO_LOG_TRAVAS, para acompanhar a disputa pela trava
+TRAVA_AVISO = 0.5
+
+ARQUIVO_LOG_TRAVAS = "Planilhas/Travas.log"
+
+# Tentativas de uma entrada ou saída quando outra estação altera o mesmo produto entre a leitura
+# e a gravação (a VERSAO do produto mudou): a quantidade é relida e a gravação é refeita
+TENTATIVAS_CONFLITO = 5
+
+# Coordenador local (python coordenador.py): um único processo grava as alterações de todas as
+# estações, juntando em lotes os comandos que chegam ao mesmo tempo. Com COORDENADOR definido
+# (por exemplo, "127.0.0.1:8765"), a interface envia cadastros, entradas, saídas e EPIs para ele
+# em vez de gravar as planilhas.
+COORDENADOR = None
+# Porta em que o coordenador atende (só em 127.0.0.1)
+COORDENADOR_PORTA = 8765
+# Tempo (segundos) que o coordenador espera juntando comandos antes de gravar um lote
+COORDENADOR_INTERVALO = 0.05
+# Intervalo (milissegundos) com que a interface busca no coordenador as alterações das outras estações
+COORDENADOR_ACOMPANHAMENTO = 1000
+
+# Mostra no terminal o tempo de cada etapa da inicialização (importações, leitura das planilhas, janelas)
+DEPURAR_INICIALIZACAO = False
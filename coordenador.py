@@ -0,0 +1,376 @@
+import json
+import threading
+import collections
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import configuracao
+from esquema import FORMATO_DATA, FORMATO_DATA_ISO
+from operacoes import ErroOperacao, Lote, executar_juntos
+
+
+class ErroCoordenador(ErroOperacao):
+    """
+    Comando recusado pelo coordenador (dados inválidos, quantidade insuficiente...) ou
+    coordenador inacessível. A mensagem é a que deve ser mostrada ao usuário.
+    """
+
+
+def _chave_produto(codigo):
+    # "12", "12.0" e 12 são o mesmo produto
+    codigo = str(codigo).strip()
+    try:
+        return str(int(float(codigo)))
+    except ValueError:
+        return codigo
+
+
+class Comando:
+    """
+    Um comando recebido por HTTP, esperando ser gravado no próximo lote.
+    """
+
+    def __init__(self, operacao, dados):
+        self.operacao = operacao
+        self.dados = dados
+        self.resultado = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+
+
+class Coordenador:
+    """
+    Dono dos dados de todas as estações: recebe os comandos (cadastro, entrada, saída,
+    registro e retirada de EPI), grava-os em lotes e guarda a lista de alterações (deltas)
+    para os clientes acompanharem.
+    O estoque e os EPIs ficam em memória (produtos e epis, com as linhas como nas planilhas):
+    buscar_produto e tabela são respondidos sem ler as planilhas, e cada lote gravado atualiza
+    as linhas que alterou. Se outro processo obtiver a trava (uma estação sem coordenador ou
+    salvando a tabela editada, a linha de comando), as tabelas são relidas antes da próxima
+    leitura ou do próximo lote.
+    Os comandos que chegam enquanto um lote é gravado esperam juntos pelo próximo: as entradas
+    e saídas de um lote são gravadas na ordem em que chegaram, com um movimentar_lote para cada
+    sequência da mesma planilha, e as retiradas de EPI com um único retirar_epis. Cada comando só é respondido depois que seu lote foi gravado.
+    Um comando "grupo" ({"comandos": [[operacao, dados], ...]}, só entradas, saídas e retiradas
+    de EPI) é gravado inteiro ou recusado inteiro, como as importações e requisições da interface.
+    """
+
+    def __init__(self, repositorio, intervalo=0.05, alteracoes_guardadas=10000):
+        self.repositorio = repositorio
+        self.intervalo = intervalo
+        self.trava = threading.Lock()
+        self.condicao = threading.Condition(self.trava)
+        self.fila = []
+        self.sequencia = 0
+        self.alteracoes = collections.deque(maxlen=alteracoes_guardadas)
+        self.lotes = 0
+        self.thread = None
+        self.produtos = {}
+        self.epis = {}
+        self.trava_planilhas = None
+        self.outras_estacoes = None
+
+    def iniciar(self):
+        """
+        Cria as planilhas, carrega o estoque e os EPIs e inicia a gravação dos lotes em segundo plano.
+        """
+        with self.repositorio.travar() as trava:
+            self.repositorio.criar()
+            self._carregar(trava)
+        self.thread = threading.Thread(target=self._gravar_em_segundo_plano, daemon=True)
+        self.thread.start()
+
+    def executar(self, operacao, dados):
+        """
+        Enfileira um comando e espera o lote dele ser gravado. Retorna o resultado do comando
+        ou lança ErroCoordenador.
+        """
+        if operacao not in Lote.operacoes and operacao != "grupo":
+            raise ErroCoordenador(f"Operação desconhecida: {operacao}")
+        comando = Comando(operacao, dados)
+        with self.trava:
+            self.fila.append(comando)
+            self.condicao.notify()
+        comando.pronto.wait()
+        if comando.erro is not None:
+            raise ErroCoordenador(comando.erro)
+        if comando.resultado is None:
+            raise ErroCoordenador("O comando não foi executado.")
+        return comando.resultado
+
+    def alteracoes_desde(self, sequencia):
+        """
+        Retorna (sequência atual, alterações posteriores a sequencia). As alterações são
+        dicionários {"seq", "tabela", "chave", "linha"}. Retorna None no lugar da lista se
+        as alterações pedidas já foram descartadas (o cliente deve reler as tabelas).
+        """
+        with self.trava:
+            if self.alteracoes and sequencia < self.alteracoes[0]["seq"] - 1:
+                return self.sequencia, None
+            return self.sequencia, [alteracao for alteracao in self.alteracoes if alteracao["seq"] > sequencia]
+
+    def _carregar(self, trava):
+        # Chamada com a trava. As linhas ficam com os valores como estão nas planilhas (texto)
+        tabelas = {}
+        for nome in ("estoque", "epis"):
+            df = self.repositorio.ler_tabela(nome, dtype=str).fillna("")
+            tabelas[nome] = [[str(valor) for valor in linha] for linha in df.itertuples(index=False)]
+        with self.trava:
+            self.produtos = {_chave_produto(linha[0]): linha for linha in tabelas["estoque"]}
+            self.epis = {linha[0] or linha[1]: linha for linha in tabelas["epis"]}
+        self.trava_planilhas, self.outras_estacoes = trava, trava.outras_estacoes
+
+    def _acompanhar(self, trava):
+        # Chamada com a trava: relê as tabelas se outra estação teve a trava desde a última leitura
+        if trava.outras_estacoes != self.outras_estacoes:
+            self._carregar(trava)
+
+    def _atualizar(self):
+        if self.trava_planilhas is not None and self.trava_planilhas.alterada():
+            with self.repositorio.travar() as trava:
+                self._acompanhar(trava)
+
+    def buscar_produto(self, codigo):
+        """
+        Retorna a linha do produto (da memória) ou None se o código não existir.
+        """
+        self._atualizar()
+        with self.trava:
+            produto = self.produtos.get(_chave_produto(codigo))
+            return list(produto) if produto is not None else None
+
+    def tabela(self, nome):
+        """
+        Retorna (sequência atual, linhas) da tabela estoque ou epis, da memória. As alterações
+        posteriores são as de alteracoes_desde(sequência).
+        """
+        self._atualizar()
+        with self.trava:
+            linhas = self.produtos if nome == "estoque" else self.epis
+            return self.sequencia, [list(linha) for linha in linhas.values()]
+
+    def _gravar_em_segundo_plano(self):
+        while True:
+            with self.trava:
+                while not self.fila:
+                    self.condicao.wait()
+            # Espera um pouco para juntar os comandos que chegarem logo depois
+            threading.Event().wait(self.intervalo)
+            with self.trava:
+                comandos, self.fila = self.fila, []
+            try:
+                self._gravar_lote(comandos)
+            except Exception as e:
+                # Todo comando sem erro recebe o da gravação, menos os cadastros e registros de EPI
+                # que já tinham sido gravados (os que têm resultado): se a trava não foi obtida,
+                # nenhum comando foi executado
+                for comando in comandos:
+                    if comando.erro is None and (comando.resultado is None or comando.operacao in Lote.acumuladas):
+                        comando.resultado = None
+                        comando.erro = f"Erro ao gravar as alterações: {e}"
+            for comando in comandos:
+                comando.pronto.set()
+
+    def _gravar_lote(self, comandos):
+        repositorio = self.repositorio
+        agora = datetime.now()
+        data, data_iso = agora.strftime(FORMATO_DATA), agora.strftime(FORMATO_DATA_ISO)
+
+        with repositorio.travar() as trava:
+            self._acompanhar(trava)
+            lote = Lote(repositorio)
+            grupos = [comando for comando in comandos if comando.operacao == "grupo"]
+            for comando in comandos:
+                if comando.operacao == "grupo":
+                    continue
+                try:
+                    comando.resultado = getattr(lote, comando.operacao)(comando.dados, data, data_iso)
+                except ErroOperacao as e:
+                    comando.erro = str(e)
+                except Exception as e:
+                    comando.erro = f"Erro ao executar o comando: {e}"
+            lote.gravar()
+
+            # Cada grupo é conferido e gravado em um lote próprio, depois dos comandos avulsos:
+            # se algum comando dele for recusado, o lote do grupo é descartado sem gravar nada
+            lotes = [lote]
+            for comando in grupos:
+                try:
+                    subcomandos = [(operacao, dados) for operacao, dados in comando.dados.get("comandos", [])]
+                    lote_grupo, resultados = executar_juntos(repositorio, subcomandos, data, data_iso)
+                    comando.resultado = {"resultados": resultados}
+                    lotes.append(lote_grupo)
+                except ErroOperacao as e:
+                    comando.erro = str(e)
+                except (TypeError, ValueError, AttributeError) as e:
+                    comando.erro = f"Grupo de comandos inválido: {e}"
+
+        with self.trava:
+            for lote in lotes:
+                for tabela, chave, linha in lote.alteracoes():
+                    if tabela == "estoque" and linha is not None:
+                        self.produtos[_chave_produto(linha[0])] = list(linha)
+                    elif tabela == "epis":
+                        self.epis[linha[0] or linha[1]] = list(linha)
+                    self.sequencia += 1
+                    self.alteracoes.append({"seq": self.sequencia, "tabela": tabela, "chave": chave, "linha": linha})
+            self.lotes += 1
+            for comando in comandos:
+                if comando.resultado is not None:
+                    comando.resultado["seq"] = self.sequencia
+
+
+class ServidorCoordenador(BaseHTTPRequestHandler):
+    """
+    API HTTP do coordenador (JSON, só em localhost):
+    POST /<operacao> com os dados do comando; GET /produto/<codigo>; GET /tabela/<estoque|epis>;
+    GET /alteracoes?desde=<seq>.
+    """
+
+    coordenador = None
+
+    def _responder(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path.startswith("/produto/"):
+            produto = self.coordenador.buscar_produto(urllib.parse.unquote(url.path[len("/produto/"):]))
+            self._responder(200 if produto else 404, {"produto": produto})
+        elif url.path in ("/tabela/estoque", "/tabela/epis"):
+            sequencia, linhas = self.coordenador.tabela(url.path[len("/tabela/"):])
+            self._responder(200, {"seq": sequencia, "linhas": linhas})
+        elif url.path == "/alteracoes":
+            desde = int(urllib.parse.parse_qs(url.query).get("desde", ["0"])[0])
+            sequencia, alteracoes = self.coordenador.alteracoes_desde(desde)
+            self._responder(200, {"seq": sequencia, "alteracoes": alteracoes})
+        else:
+            self._responder(404, {"erro": "Caminho desconhecido."})
+
+    def do_POST(self):
+        try:
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            dados = json.loads(self.rfile.read(tamanho) or b"{}")
+            resultado = self.coordenador.executar(self.path.strip("/"), dados)
+        except ErroOperacao as e:
+            self._responder(400, {"erro": str(e)})
+        except ValueError as e:
+            self._responder(400, {"erro": f"Comando inválido: {e}"})
+        else:
+            self._responder(200, resultado)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def iniciar_servidor(repositorio, porta=None, intervalo=None):
+    """
+    Inicia o coordenador em 127.0.0.1 (porta 0 escolhe uma porta livre) e retorna o servidor
+    HTTP, ainda sem atender; use servidor.serve_forever().
+    """
+    coordenador = Coordenador(repositorio, configuracao.COORDENADOR_INTERVALO if intervalo is None else intervalo)
+    coordenador.iniciar()
+    manipulador = type("Manipulador", (ServidorCoordenador,), {"coordenador": coordenador})
+    porta = configuracao.COORDENADOR_PORTA if porta is None else porta
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), manipulador)
+    servidor.daemon_threads = True
+    servidor.coordenador = coordenador
+    return servidor
+
+
+class ClienteCoordenador:
+    """
+    Cliente do coordenador, usado pela interface quando configuracao.COORDENADOR está definido.
+    Cada método envia um comando e retorna o resultado (com "seq", a alteração mais recente
+    já incluída) ou lança ErroCoordenador.
+    """
+
+    def __init__(self, endereco, tempo_limite=30):
+        self.url = f"http://{endereco}"
+        self.tempo_limite = tempo_limite
+
+    def _pedir(self, caminho, dados=None):
+        corpo = None if dados is None else json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        pedido = urllib.request.Request(self.url + caminho, data=corpo, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(pedido, timeout=self.tempo_limite) as resposta:
+                resultado = json.loads(resposta.read())
+        except urllib.error.HTTPError as e:
+            resposta = json.loads(e.read() or b"{}")
+            if e.code == 404 and "produto" in resposta:
+                return resposta
+            raise ErroCoordenador(resposta.get("erro", str(e)))
+        except (urllib.error.URLError, OSError) as e:
+            raise ErroCoordenador(f"Coordenador {self.url} inacessível: {e}")
+        if not isinstance(resultado, dict):
+            raise ErroCoordenador(f"Resposta inválida do coordenador {self.url}: {resultado!r}")
+        return resultado
+
+    def cadastrar(self, descricao, quantidade, valor_un, localizacao=""):
+        return self._pedir("/cadastrar", {
+            "descricao": descricao, "quantidade": quantidade, "valor_un": valor_un, "localizacao": localizacao
+        })
+
+    def entrada(self, codigo, quantidade, operador_id=""):
+        return self._pedir("/entrada", {"codigo": codigo, "quantidade": quantidade, "operador_id": operador_id})
+
+    def saida(self, codigo, quantidade, solicitante, operador_id=""):
+        return self._pedir("/saida", {
+            "codigo": codigo, "quantidade": quantidade, "solicitante": solicitante, "operador_id": operador_id
+        })
+
+    def epi(self, ca, descricao, quantidade):
+        return self._pedir("/epi", {"ca": ca, "descricao": descricao, "quantidade": quantidade})
+
+    def retirada(self, colaborador, identificador, quantidade):
+        return self._pedir("/retirada", {
+            "colaborador": colaborador, "identificador": identificador, "quantidade": quantidade
+        })
+
+    def grupo(self, comandos):
+        """
+        Envia comandos de entrada, saída e retirada de EPI ([(operacao, dados)]) para serem
+        gravados juntos: ou todos, ou nenhum (ErroCoordenador com os erros de cada um).
+        """
+        return self._pedir("/grupo", {"comandos": [[operacao, dados] for operacao, dados in comandos]})
+
+    def buscar_produto(self, codigo):
+        return self._pedir(f"/produto/{urllib.parse.quote(str(codigo))}")["produto"]
+
+    def tabela(self, nome):
+        """
+        Retorna (sequência, linhas) da tabela estoque ou epis, como está na memória do coordenador.
+        """
+        resposta = self._pedir(f"/tabela/{nome}")
+        return resposta["seq"], resposta["linhas"]
+
+    def alteracoes(self, desde):
+        """
+        Retorna (sequência atual, alterações posteriores a desde), ou (sequência, None) se o
+        cliente ficou para trás e deve reler as tabelas.
+        """
+        resposta = self._pedir(f"/alteracoes?desde={int(desde)}")
+        return resposta["seq"], resposta["alteracoes"]
+
+
+if __name__ == "__main__":
+    from armazenamento import obter_armazenamento
+
+    servidor = iniciar_servidor(obter_armazenamento())
+    print(f"Coordenador em http://127.0.0.1:{servidor.server_address[1]} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        with servidor.coordenador.repositorio.travar():
+            servidor.coordenador.repositorio.compactar()
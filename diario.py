@@ -0,0 +1,355 @@
+import os
+import json
+import threading
+import contextlib
+from versoes import comparar_versoes, nova_versao, versao_produto
+
+
+class Diario:
+    """
+    Arquivo de diário (write-ahead log) das movimentações de estoque.
+    Cada movimentação é uma linha JSON com número de sequência, gravada com fsync.
+    O arquivo ".aplicado" guarda a sequência da última movimentação já aplicada às planilhas
+    e a da movimentação sendo aplicada.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.caminho_aplicado = caminho + ".aplicado"
+        self.arquivo = None
+
+    def ler_aplicado(self):
+        """
+        Retorna (última sequência aplicada, sequência sendo aplicada). A segunda é None em um
+        ".aplicado" gravado antes de ela existir.
+        """
+        try:
+            with open(self.caminho_aplicado, "r", encoding="utf-8") as f:
+                valores = [int(valor) for valor in f.read().split()]
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+        if not valores:
+            return 0, 0
+        return valores[0], valores[1] if len(valores) > 1 else None
+
+    def gravar_aplicado(self, sequencia, em_aplicacao=None):
+        """
+        Grava a última sequência aplicada. Antes de aplicar uma movimentação, a sequência dela é
+        gravada em em_aplicacao: só ela pode estar nas planilhas sem constar como aplicada.
+        """
+        temporario = self.caminho_aplicado + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(f"{sequencia} {sequencia if em_aplicacao is None else em_aplicacao}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho_aplicado)
+
+    def registros(self):
+        """
+        Lê todas as movimentações do diário. Uma última linha incompleta (gravação
+        interrompida antes do fsync) é ignorada, pois nunca foi confirmada.
+        """
+        registros = []
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        registros.append(json.loads(linha))
+                    except json.JSONDecodeError:
+                        break
+        except FileNotFoundError:
+            pass
+        return registros
+
+    def anexar(self, registro):
+        """
+        Grava uma movimentação no final do diário e só retorna depois do fsync.
+        """
+        if self.arquivo is None:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            self.arquivo = open(self.caminho, "ab")
+        self.arquivo.write(json.dumps(registro, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.arquivo.flush()
+        os.fsync(self.arquivo.fileno())
+
+    def truncar(self):
+        """
+        Esvazia o diário depois que todas as movimentações foram aplicadas.
+        """
+        if self.arquivo is None:
+            self.arquivo = open(self.caminho, "ab")
+        self.arquivo.truncate(0)
+        self.arquivo.flush()
+        os.fsync(self.arquivo.fileno())
+
+
+class ArmazenamentoComDiario:
+    """
+    Envolve um armazenamento para que cada entrada ou saída seja confirmada com uma única
+    gravação no diário. A planilha de movimentos e o estoque são atualizados a partir do
+    diário em segundo plano, com a trava entre estações; a trava só garante que o diário foi
+    gravado. O diário fica na pasta compartilhada: quem obtém a trava depois de outra estação,
+    ou ao iniciar, aplica antes as movimentações que ficaram pendentes nele.
+    Enquanto uma movimentação não é aplicada, buscar_produto já retorna a quantidade e a versão novas.
+    """
+
+    def __init__(self, armazenamento, caminho):
+        self.armazenamento = armazenamento
+        self.diario = Diario(caminho)
+        self.trava = threading.Lock()
+        self.condicao = threading.Condition(self.trava)
+        self.fila = []
+        self.pendentes = {}
+        self.sequencia = 0
+        self.erro = None
+        self.thread = None
+
+    def criar(self):
+        """
+        Cria o armazenamento, reaplica as movimentações pendentes do diário e inicia a aplicação
+        em segundo plano. Deve ser chamada com a trava.
+        """
+        self.armazenamento.criar()
+        for registro in self.recuperar():
+            print(f"Movimentação {registro['seq']} reaplicada a partir do diário.")
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._aplicar_em_segundo_plano, daemon=True)
+            self.thread.start()
+
+    def recuperar(self):
+        """
+        Aplica as movimentações do diário posteriores à última aplicada, desta e de outras
+        estações, e retorna as que foram gravadas agora. Deve ser chamada com a trava.
+        As pendentes que podem ter sido aplicadas sem chegar ao ".aplicado" (a que estava sendo
+        aplicada ou, em um ".aplicado" antigo, todas) são conferidas: as que já estão no final
+        das planilhas de movimentos não são gravadas de novo.
+        """
+        aplicado, em_aplicacao = self.diario.ler_aplicado()
+        registros = self.diario.registros()
+        pendentes = [registro for registro in registros if registro["seq"] > aplicado]
+
+        conferidas = [registro for registro in pendentes if em_aplicacao is None or registro["seq"] <= em_aplicacao]
+        gravados = self._gravados(conferidas)
+        if gravados:
+            # Só a última das já gravadas pode ter ficado sem a atualização do estoque
+            aplicado = pendentes[gravados - 1]["seq"]
+            self.armazenamento.atualizar_estoque_varios(self._quantidades(pendentes[gravados - 1]))
+            self.diario.gravar_aplicado(aplicado)
+        for registro in pendentes[gravados:]:
+            self._aplicar(registro, aplicado)
+            aplicado = registro["seq"]
+
+        ultimo = max([aplicado] + [registro["seq"] for registro in registros])
+        with self.trava:
+            self.sequencia = max(self.sequencia, ultimo)
+            self.fila = [registro for registro in self.fila if registro["seq"] > ultimo]
+            for codigo in [codigo for codigo, pendente in self.pendentes.items() if pendente[0] <= ultimo]:
+                del self.pendentes[codigo]
+            if not self.fila:
+                self.diario.truncar()
+            self.condicao.notify_all()
+        return pendentes[gravados:]
+
+    def _gravados(self, pendentes):
+        """
+        Retorna quantas movimentações pendentes, a partir da primeira, já estão nas planilhas de
+        movimentos. Como elas são aplicadas em ordem, é o maior início das pendentes em que a
+        última movimentação de cada planilha é a última linha dela.
+        """
+        tabelas = {registro["tabela"] for registro in pendentes}
+        ultimas = {tabela: self.armazenamento.ultimo_movimento(tabela) for tabela in tabelas}
+        for gravados in range(len(pendentes), 0, -1):
+            finais = {registro["tabela"]: registro for registro in pendentes[:gravados]}
+            if all(self._no_final(registro, ultimas[tabela]) for tabela, registro in finais.items()):
+                return gravados
+        return 0
+
+    @staticmethod
+    def _no_final(registro, ultimo):
+        linha = registro["movimentos"][-1][0] if "movimentos" in registro else registro["linha"]
+        # Registros gravados antes da coluna DATA ISO têm uma coluna a menos que a planilha
+        return ultimo is not None and ultimo[:len(linha)] == [str(valor) for valor in linha]
+
+    @staticmethod
+    def _quantidades(registro):
+        if "movimentos" in registro:
+            return {codigo: nova_quantidade for _, codigo, nova_quantidade in registro["movimentos"]}
+        return {registro["codigo"]: registro["nova_quantidade"]}
+
+    def _aplicar(self, registro, aplicado):
+        self.diario.gravar_aplicado(aplicado, em_aplicacao=registro["seq"])
+        if "movimentos" in registro:
+            self.armazenamento.movimentar_lote(registro["tabela"], registro["movimentos"])
+        else:
+            self.armazenamento.movimentar(
+                registro["tabela"], registro["linha"], registro["codigo"], registro["nova_quantidade"]
+            )
+        self.diario.gravar_aplicado(registro["seq"])
+
+    def _aplicar_pendentes(self):
+        # Chamada com a trava entre estações. Se a aplicação falhar, as movimentações seguintes
+        # são recusadas (veja _confirmar), para não serem gravadas fora de ordem
+        try:
+            self.recuperar()
+        except Exception as e:
+            print(f"Erro ao aplicar as movimentações do diário: {e}")
+            with self.trava:
+                self.erro = e
+                self.condicao.notify_all()
+
+    def _aplicar_em_segundo_plano(self):
+        while True:
+            with self.trava:
+                while not self.fila and self.erro is None:
+                    self.condicao.wait()
+                if self.erro is not None:
+                    return
+            try:
+                with self.armazenamento.travar():
+                    self._aplicar_pendentes()
+            except TimeoutError:
+                # Outra estação está com a trava; ao obtê-la, ela mesma aplica o que ficou no diário
+                pass
+
+    @contextlib.contextmanager
+    def travar(self):
+        """
+        Obtém a trava entre estações. Se outra estação teve a trava desde a última vez, as
+        movimentações que ela deixou pendentes no diário são aplicadas antes. A liberação não
+        espera as movimentações desta estação serem aplicadas: elas já estão no diário.
+        """
+        with self.armazenamento.travar() as trava:
+            if trava.nivel == 1 and trava.outra_estacao:
+                self._aplicar_pendentes()
+            yield trava
+
+    def aguardar(self):
+        """
+        Aplica as movimentações desta estação que ainda estão só no diário, obtendo a trava
+        entre estações. Usada antes das leituras e gravações diretas das planilhas.
+        """
+        with self.trava:
+            if not self.fila or self.erro is not None:
+                return
+        with self.armazenamento.travar():
+            self._aplicar_pendentes()
+
+    def movimentar(self, tabela, linha, codigo, nova_quantidade, versao=None):
+        """
+        Registra uma entrada ou saída no diário. Retorna assim que a gravação é confirmada.
+        Lança ValueError se os valores numéricos do produto forem inválidos e ConflitoVersao
+        se versao for informada e o produto tiver mudado de versão (veja versoes.py).
+        """
+        with comparar_versoes(self, None if versao is None else {codigo: versao}):
+            self._confirmar({"tabela": tabela, "linha": linha, "codigo": codigo, "nova_quantidade": nova_quantidade})
+
+    def movimentar_lote(self, tabela, movimentos, versoes=None):
+        """
+        Registra um lote de entradas ou saídas no diário, em uma única gravação.
+        movimentos é uma lista de (linha, codigo, nova_quantidade); versoes como em movimentar.
+        """
+        with comparar_versoes(self, versoes):
+            self._confirmar({"tabela": tabela, "movimentos": [list(movimento) for movimento in movimentos]})
+
+    def _confirmar(self, registro):
+        quantidades = self._quantidades(registro)
+        versoes = {}
+        for codigo, nova_quantidade in quantidades.items():
+            produto = self.buscar_produto(codigo)
+            if produto is not None:
+                float(produto[2]) * int(nova_quantidade)
+                versoes[codigo] = versao_produto(produto) + 1
+
+        with self.trava:
+            if self.erro is not None:
+                raise RuntimeError(f"Há movimentações no diário que não puderam ser aplicadas: {self.erro}")
+
+            self.sequencia += 1
+            registro = {"seq": self.sequencia, **registro}
+            self.diario.anexar(registro)
+            self.fila.append(registro)
+            for codigo, nova_quantidade in quantidades.items():
+                self.pendentes[codigo] = (self.sequencia, nova_quantidade, versoes.get(codigo))
+            self.condicao.notify_all()
+
+    def buscar_produto(self, codigo):
+        """
+        Busca um produto no estoque, já com a quantidade das movimentações ainda não aplicadas.
+        """
+        produto = self.armazenamento.buscar_produto(codigo)
+        with self.trava:
+            pendente = self.pendentes.get(codigo)
+        if produto is not None and pendente is not None:
+            _, nova_quantidade, versao = pendente
+            produto[4] = str(nova_quantidade)
+            try:
+                produto[3] = str(float(produto[2]) * int(nova_quantidade))
+            except ValueError:
+                pass
+            if versao is not None:
+                nova_versao(produto, versao)
+        return produto
+
+    def arquivos_backup(self):
+        self.aguardar()
+        return self.armazenamento.arquivos_backup()
+
+    def transacao(self):
+        return self.armazenamento.transacao()
+
+    def proximo_codigo(self):
+        return self.armazenamento.proximo_codigo()
+
+    def reservar_codigos(self, quantidade):
+        return self.armazenamento.reservar_codigos(quantidade)
+
+    def inserir_produto(self, linha):
+        self.armazenamento.inserir_produto(linha)
+
+    def atualizar_estoque(self, codigo, nova_quantidade):
+        self.aguardar()
+        self.armazenamento.atualizar_estoque(codigo, nova_quantidade)
+
+    def atualizar_estoque_varios(self, quantidades):
+        self.aguardar()
+        self.armazenamento.atualizar_estoque_varios(quantidades)
+
+    def registrar_movimento(self, tabela, linha):
+        self.aguardar()
+        self.armazenamento.registrar_movimento(tabela, linha)
+
+    def registrar_movimentos(self, tabela, linhas):
+        self.aguardar()
+        self.armazenamento.registrar_movimentos(tabela, linhas)
+
+    def ultimo_movimento(self, tabela):
+        self.aguardar()
+        return self.armazenamento.ultimo_movimento(tabela)
+
+    def adicionar_epi(self, linha):
+        self.armazenamento.adicionar_epi(linha)
+
+    def repor_epi(self, identificador, quantidade):
+        return self.armazenamento.repor_epi(identificador, quantidade)
+
+    def retirar_epi(self, identificador, quantidade):
+        return self.armazenamento.retirar_epi(identificador, quantidade)
+
+    def retirar_epis(self, retiradas):
+        return self.armazenamento.retirar_epis(retiradas)
+
+    def ler_tabela(self, nome, dtype=None, campos=None, inicio=None, fim=None, recentes=False):
+        self.aguardar()
+        return self.armazenamento.ler_tabela(nome, dtype, campos, inicio, fim, recentes)
+
+    def salvar_tabela(self, nome, df, recentes=False):
+        self.aguardar()
+        self.armazenamento.salvar_tabela(nome, df, recentes)
+
+    def fonte_paginada(self, tabela, recentes=False):
+        self.aguardar()
+        return self.armazenamento.fonte_paginada(tabela, recentes)
+
+    def compactar(self):
+        self.aguardar()
+        self.armazenamento.compactar()
@@ -0,0 +1,154 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+FORMATO_DATA = "%H:%M %d/%m/%Y"
+# Data normalizada das movimentações: ordenável como texto (também usada nas planilhas dos colaboradores)
+FORMATO_DATA_ISO = "%Y-%m-%d %H:%M:%S"
+
+# Tipo de cada coluna das planilhas. "data" é uma data no formato FORMATO_DATA e
+# "data_iso" no formato FORMATO_DATA_ISO.
+tipos_colunas = {
+    "CODIGO": "Int32",
+    # float64, como os valores: a interface calcula VALOR UN * QUANTIDADE e grava o resultado
+    "QUANTIDADE": "float64",
+    "VALOR UN": "float64",
+    "VALOR TOTAL": "float64",
+    "VERSAO": "Int32",
+    "DATA": "data",
+    "DATA ISO": "data_iso",
+    "LOCALIZACAO": "category",
+    "SOLICITANTE": "category",
+    # O ID do operador é texto ("001"), repetido em quase todas as linhas
+    "ID": "category",
+    "DESCRICAO": "object",
+    "CA": "object"
+}
+
+# Nas planilhas de movimentos a mesma descrição se repete em muitas linhas
+tipos_tabelas = {
+    "entrada": {"DESCRICAO": "category"},
+    "saida": {"DESCRICAO": "category"}
+}
+
+
+formatos_datas = {"data": FORMATO_DATA, "data_iso": FORMATO_DATA_ISO}
+
+
+def montar_esquema(colunas):
+    """
+    Monta o esquema de tipos de cada tabela a partir das colunas das planilhas.
+    """
+    return {
+        nome: {coluna: tipos_tabelas.get(nome, {}).get(coluna, tipos_colunas.get(coluna, "object")) for coluna in cols}
+        for nome, cols in colunas.items()
+    }
+
+
+def tipos_leitura(tipos):
+    """
+    Retorna o dtype para o read_csv: colunas de texto são lidas como texto (um CA "0123"
+    continua "0123"); números e datas são convertidos depois, por aplicar_esquema.
+    """
+    return {coluna: str for coluna, tipo in tipos.items() if tipo == "object"} | {
+        coluna: "category" for coluna, tipo in tipos.items() if tipo == "category"
+    }
+
+
+def converter_datas(serie, formato=FORMATO_DATA):
+    """
+    Converte uma coluna de datas em texto (NaT quando inválida). Cada valor distinto é
+    interpretado uma única vez: nas planilhas de movimentos a mesma data se repete em muitas linhas.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    codigos, valores = pd.factorize(serie.astype(object))
+    if len(valores) == 0:
+        return pd.Series(pd.NaT, index=serie.index, name=serie.name, dtype="datetime64[ns]")
+    datas = pd.to_datetime(pd.Index(valores, dtype=object), format=formato, errors="coerce")
+    resultado = datas.take(codigos, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+
+def data_iso(data):
+    """
+    Retorna a data normalizada (FORMATO_DATA_ISO) de um valor da coluna DATA, ou "" se for inválido.
+    """
+    try:
+        return datetime.strptime(str(data), FORMATO_DATA).strftime(FORMATO_DATA_ISO)
+    except ValueError:
+        return ""
+
+
+def _numeros(serie, inteiros=False):
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if (numeros.isna() & serie.notna()).any():
+        raise ValueError("valores não numéricos")
+    if inteiros and not (numeros.dropna() % 1 == 0).all():
+        raise ValueError("valores não inteiros")
+    return numeros
+
+
+def _converter(serie, tipo):
+    if tipo in formatos_datas:
+        datas = converter_datas(serie, formatos_datas[tipo])
+        if (datas.isna() & serie.notna()).any():
+            raise ValueError("datas fora do formato")
+        return datas
+    if tipo == "Int32":
+        return _numeros(serie, inteiros=True).astype("Int32")
+    if tipo in ("float32", "float64"):
+        return _numeros(serie).astype(tipo)
+    if tipo == "category":
+        return serie.astype("category")
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.astype(object)
+    return serie
+
+
+def aplicar_esquema(df, tipos):
+    """
+    Converte as colunas do DataFrame para os tipos do esquema. Uma coluna com valores que não
+    se encaixam no tipo (por exemplo, um CODIGO com letras) fica como está, para que nada se
+    perca quando a tabela for salva de novo.
+    """
+    for coluna in df.columns:
+        tipo = tipos.get(coluna)
+        if tipo is None:
+            continue
+        try:
+            df[coluna] = _converter(df[coluna], tipo)
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def preparar_gravacao(df):
+    """
+    Retorna o DataFrame com as datas de volta no formato das planilhas, pronto para ser gravado.
+    """
+    datas = [coluna for coluna in df.columns if pd.api.types.is_datetime64_any_dtype(df[coluna])]
+    if not datas:
+        return df
+    df = df.copy()
+    for coluna in datas:
+        formato = formatos_datas.get(tipos_colunas.get(coluna), FORMATO_DATA)
+        df[coluna] = df[coluna].dt.strftime(formato).astype(object)
+    return df
+
+
+def para_edicao(df):
+    """
+    Cópia do DataFrame para exibir e editar na tabela da interface: datas e categorias voltam
+    a ser texto no formato das planilhas e inteiros anuláveis viram int64 ou float64, tipos
+    que a pandastable sabe editar.
+    """
+    df = preparar_gravacao(df).copy()
+    for coluna in df.columns:
+        serie = df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            df[coluna] = serie.astype(object)
+        elif pd.api.types.is_extension_array_dtype(serie.dtype) and pd.api.types.is_integer_dtype(serie.dtype):
+            df[coluna] = serie.astype(np.float64 if serie.isna().any() else np.int64)
+    return df
@@ -0,0 +1,430 @@
+import os
+import gzip
+import json
+import shutil
+import threading
+import contextlib
+from datetime import datetime
+import pandas as pd
+from esquema import aplicar_esquema
+from versoes import comparar_versoes, nova_versao, versao_produto
+
+
+# Formato dos snapshots; um snapshot de outro formato é refeito a partir das planilhas.
+# 2: linhas do estoque com a coluna VERSAO
+FORMATO_SNAPSHOT = 2
+
+
+class EstadoEstoque:
+    """
+    Estado materializado do estoque e dos EPIs, obtido aplicando os eventos em ordem.
+    As linhas são guardadas como listas de texto, no mesmo formato das planilhas.
+    """
+
+    def __init__(self, estoque=None, epis=None):
+        self.estoque = estoque or []
+        self.epis = epis or []
+        self.posicoes = {}
+        for posicao, linha in enumerate(self.estoque):
+            self.posicoes.setdefault(linha[0], []).append(posicao)
+
+    def buscar(self, codigo):
+        posicoes = self.posicoes.get(codigo)
+        return list(self.estoque[posicoes[0]]) if posicoes else None
+
+    def aplicar(self, evento):
+        """
+        Aplica um evento ao estado.
+        """
+        tipo = evento["tipo"]
+        if tipo == "cadastro":
+            linha = [str(valor) for valor in evento["linha"]]
+            self.posicoes.setdefault(linha[0], []).append(len(self.estoque))
+            self.estoque.append(linha)
+        elif tipo in ("entrada", "saida", "estoque"):
+            if evento.get("nova_quantidade") is not None:
+                self._atualizar_quantidade(evento["codigo"], evento["nova_quantidade"])
+            for codigo, nova_quantidade in evento.get("quantidades", {}).items():
+                self._atualizar_quantidade(codigo, nova_quantidade)
+        elif tipo == "epi_registro":
+            self.epis.append(["" if valor is None else str(valor) for valor in evento["linha"]])
+        elif tipo in ("epi_reposicao", "epi_retirada"):
+            self._alterar_epi(evento["identificador"], evento["nova_quantidade"])
+        elif tipo == "epi_retiradas":
+            for identificador, _, nova_quantidade in evento["retiradas"]:
+                self._alterar_epi(identificador, nova_quantidade)
+
+    def _atualizar_quantidade(self, codigo, nova_quantidade):
+        for posicao in self.posicoes.get(codigo, []):
+            produto = self.estoque[posicao]
+            produto[4] = str(nova_quantidade)
+            try:
+                produto[3] = str(float(produto[2]) * int(nova_quantidade))
+            except ValueError:
+                pass
+            nova_versao(produto, versao_produto(produto) + 1)
+
+    def _alterar_epi(self, identificador, nova_quantidade):
+        for epi in self.epis:
+            epi[0] = epi[0].strip().upper()
+            epi[1] = epi[1].strip().upper()
+            if identificador in (epi[0], epi[1]):
+                epi[2] = str(nova_quantidade)
+
+
+class RegistroEventos:
+    """
+    Log de eventos (somente anexação) com snapshots periódicos do estado.
+    Ao iniciar, carrega o snapshot mais recente e reaplica só os eventos posteriores.
+    A compactação grava um novo snapshot e move os eventos antigos, compactados, para Historico/.
+    """
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.caminho_eventos = os.path.join(pasta, "Eventos.jsonl")
+        self.pasta_historico = os.path.join(pasta, "Historico")
+        self.arquivo = None
+        self.sequencia = 0
+        self.lido = None
+
+    def _snapshots(self):
+        try:
+            nomes = os.listdir(self.pasta)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            (int(nome[len("Snapshot_"):-len(".json")]), nome)
+            for nome in nomes if nome.startswith("Snapshot_") and nome.endswith(".json")
+        )
+
+    def carregar(self):
+        """
+        Retorna o estado do snapshot mais recente com os eventos posteriores aplicados,
+        ou None se ainda não houver snapshot (ou se ele for de um formato anterior).
+        """
+        snapshots = self._snapshots()
+        if not snapshots:
+            return None
+
+        sequencia, nome = snapshots[-1]
+        with open(os.path.join(self.pasta, nome), "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        estado = EstadoEstoque(dados["estoque"], dados["epis"])
+
+        try:
+            with open(self.caminho_eventos, "r", encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        evento = json.loads(linha)
+                    except json.JSONDecodeError:
+                        break
+                    if evento["seq"] > sequencia:
+                        estado.aplicar(evento)
+                        sequencia = evento["seq"]
+        except FileNotFoundError:
+            pass
+
+        self.sequencia = sequencia
+        self.lido = self._assinatura()
+        return estado if dados.get("formato") == FORMATO_SNAPSHOT else None
+
+    def _assinatura(self):
+        snapshots = self._snapshots()
+        try:
+            tamanho = os.path.getsize(self.caminho_eventos)
+        except FileNotFoundError:
+            tamanho = 0
+        return (snapshots[-1][0] if snapshots else None, tamanho)
+
+    def acompanhar(self, estado):
+        """
+        Aplica ao estado os eventos gravados por outras estações desde a última leitura.
+        Se outra estação gravou um snapshot mais novo, o estado é carregado dele.
+        Retorna o estado atualizado.
+        """
+        assinatura = self._assinatura()
+        if assinatura == self.lido:
+            return estado
+        if assinatura[0] is not None and assinatura[0] > self.sequencia:
+            if self.arquivo is not None:
+                self.arquivo.close()
+                self.arquivo = None
+            return self.carregar() or estado
+
+        try:
+            with open(self.caminho_eventos, "r", encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        evento = json.loads(linha)
+                    except json.JSONDecodeError:
+                        break
+                    if evento["seq"] > self.sequencia:
+                        estado.aplicar(evento)
+                        self.sequencia = evento["seq"]
+        except FileNotFoundError:
+            pass
+        self.lido = assinatura
+        return estado
+
+    def anexar(self, evento):
+        """
+        Grava um evento no final do log e retorna o evento com sequência e data.
+        """
+        if self.arquivo is None:
+            os.makedirs(self.pasta, exist_ok=True)
+            self.arquivo = open(self.caminho_eventos, "ab")
+
+        self.sequencia += 1
+        evento = {"seq": self.sequencia, "data": datetime.now().isoformat(timespec="seconds"), **evento}
+        self.arquivo.write(json.dumps(evento, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.arquivo.flush()
+        os.fsync(self.arquivo.fileno())
+        self.lido = (self.lido[0] if self.lido else None, self.arquivo.tell())
+        return evento
+
+    def gravar_snapshot(self, estado):
+        """
+        Grava o estado atual como snapshot e move os eventos já incluídos nele para o histórico.
+        """
+        os.makedirs(self.pasta_historico, exist_ok=True)
+        caminho = os.path.join(self.pasta, f"Snapshot_{self.sequencia}.json")
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"seq": self.sequencia, "formato": FORMATO_SNAPSHOT, "estoque": estado.estoque, "epis": estado.epis}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+        if os.path.exists(self.caminho_eventos) and os.path.getsize(self.caminho_eventos) > 0:
+            destino = os.path.join(self.pasta_historico, f"Eventos_ate_{self.sequencia}.jsonl.gz")
+            with open(self.caminho_eventos, "rb") as origem, gzip.open(destino, "wb") as f:
+                shutil.copyfileobj(origem, f)
+        with open(self.caminho_eventos, "wb"):
+            pass
+        self.lido = (self.sequencia, 0)
+
+        for sequencia, nome in self._snapshots()[:-2]:
+            os.remove(os.path.join(self.pasta, nome))
+
+
+class ArmazenamentoComEventos:
+    """
+    Envolve um armazenamento registrando cada alteração (cadastro, entrada, saída,
+    registro e retirada de EPI) em um log de eventos. O estado do estoque é mantido
+    em memória a partir do último snapshot, então as consultas por CODIGO não precisam
+    ler as planilhas ao iniciar. colunas e esquema são os de armazenamento.py, usados para
+    montar as tabelas de estoque e EPIs a partir do estado.
+    """
+
+    def __init__(self, armazenamento, pasta, colunas=None, esquema=None):
+        self.armazenamento = armazenamento
+        self.registro = RegistroEventos(pasta)
+        self.colunas = colunas or {}
+        self.esquema = esquema or {}
+        self.estado = None
+        self.trava = threading.RLock()
+
+    def _linhas(self, nome):
+        df = self.armazenamento.ler_tabela(nome, dtype=str)
+        return df.fillna("").values.tolist()
+
+    def criar(self):
+        """
+        Cria o armazenamento e carrega o estado do último snapshot. Na primeira execução,
+        o snapshot inicial é gerado a partir das planilhas.
+        """
+        self.armazenamento.criar()
+        with self.trava:
+            self.estado = self.registro.carregar()
+            if self.estado is None:
+                self.reconstruir()
+
+    def reconstruir(self):
+        """
+        Gera um novo snapshot a partir do conteúdo atual do armazenamento.
+        """
+        with self.trava:
+            self.estado = EstadoEstoque(self._linhas("estoque"), self._linhas("epis"))
+            self.registro.gravar_snapshot(self.estado)
+
+    @contextlib.contextmanager
+    def travar(self):
+        """
+        Obtém a trava entre estações e aplica ao estado em memória os eventos gravados
+        por outras estações desde a última vez.
+        """
+        with self.armazenamento.travar() as trava:
+            with self.trava:
+                if self.estado is not None:
+                    self.estado = self.registro.acompanhar(self.estado)
+            yield trava
+
+    def _registrar(self, evento):
+        with self.trava:
+            self.estado.aplicar(self.registro.anexar(evento))
+
+    def compactar(self):
+        """
+        Grava um snapshot com todos os eventos até agora e compacta o armazenamento.
+        """
+        with self.trava:
+            self.registro.gravar_snapshot(self.estado)
+        self.armazenamento.compactar()
+
+    def buscar_produto(self, codigo):
+        """
+        Busca um produto no estado em memória.
+        """
+        with self.trava:
+            return self.estado.buscar(codigo)
+
+    def inserir_produto(self, linha):
+        with self.trava:
+            self.armazenamento.inserir_produto(linha)
+            self._registrar({"tipo": "cadastro", "linha": linha})
+
+    def atualizar_estoque(self, codigo, nova_quantidade):
+        with self.trava:
+            self.armazenamento.atualizar_estoque(codigo, nova_quantidade)
+            self._registrar({"tipo": "estoque", "codigo": codigo, "nova_quantidade": nova_quantidade})
+
+    def atualizar_estoque_varios(self, quantidades):
+        with self.trava:
+            self.armazenamento.atualizar_estoque_varios(quantidades)
+            self._registrar({"tipo": "estoque", "quantidades": quantidades})
+
+    def registrar_movimento(self, tabela, linha):
+        with self.trava:
+            self.armazenamento.registrar_movimento(tabela, linha)
+            self._registrar({"tipo": tabela, "linha": linha, "codigo": str(linha[0]), "nova_quantidade": None})
+
+    def registrar_movimentos(self, tabela, linhas):
+        with self.trava:
+            self.armazenamento.registrar_movimentos(tabela, linhas)
+            self._registrar({"tipo": tabela, "linhas": linhas})
+
+    def movimentar(self, tabela, linha, codigo, nova_quantidade, versao=None):
+        with comparar_versoes(self, None if versao is None else {codigo: versao}), self.trava:
+            self.armazenamento.movimentar(tabela, linha, codigo, nova_quantidade)
+            self._registrar({"tipo": tabela, "linha": linha, "codigo": codigo, "nova_quantidade": nova_quantidade})
+
+    def movimentar_lote(self, tabela, movimentos, versoes=None):
+        """
+        Registra um lote de entradas ou saídas com um único evento.
+        """
+        with comparar_versoes(self, versoes), self.trava:
+            self.armazenamento.movimentar_lote(tabela, movimentos)
+            self._registrar({
+                "tipo": tabela,
+                "linhas": [linha for linha, _, _ in movimentos],
+                "quantidades": {codigo: nova_quantidade for _, codigo, nova_quantidade in movimentos}
+            })
+
+    def adicionar_epi(self, linha):
+        with self.trava:
+            self.armazenamento.adicionar_epi(linha)
+            self._registrar({"tipo": "epi_registro", "linha": linha})
+
+    def repor_epi(self, identificador, quantidade):
+        with self.trava:
+            nova_quantidade = self.armazenamento.repor_epi(identificador, quantidade)
+            self._registrar({
+                "tipo": "epi_reposicao", "identificador": identificador,
+                "quantidade": quantidade, "nova_quantidade": nova_quantidade
+            })
+        return nova_quantidade
+
+    def retirar_epi(self, identificador, quantidade):
+        with self.trava:
+            nova_quantidade = self.armazenamento.retirar_epi(identificador, quantidade)
+            self._registrar({
+                "tipo": "epi_retirada", "identificador": identificador,
+                "quantidade": quantidade, "nova_quantidade": nova_quantidade
+            })
+        return nova_quantidade
+
+    def retirar_epis(self, retiradas):
+        """
+        Retira vários EPIs de uma vez, registrando um único evento.
+        """
+        with self.trava:
+            novas_quantidades = self.armazenamento.retirar_epis(retiradas)
+            self._registrar({
+                "tipo": "epi_retiradas",
+                "retiradas": [
+                    [identificador, quantidade, nova_quantidade]
+                    for (identificador, quantidade), nova_quantidade in zip(retiradas, novas_quantidades)
+                ]
+            })
+        return novas_quantidades
+
+    def salvar_tabela(self, nome, df, recentes=False):
+        """
+        Salva uma tabela inteira. Para o estoque e os EPIs, o novo conteúdo vira um snapshot.
+        """
+        with self.trava:
+            self.armazenamento.salvar_tabela(nome, df, recentes)
+            if nome in ("estoque", "epis"):
+                self.reconstruir()
+
+    def arquivos_backup(self):
+        return self.armazenamento.arquivos_backup()
+
+    def transacao(self):
+        return self.armazenamento.transacao()
+
+    def proximo_codigo(self):
+        return self.armazenamento.proximo_codigo()
+
+    def reservar_codigos(self, quantidade):
+        return self.armazenamento.reservar_codigos(quantidade)
+
+    def ultimo_movimento(self, tabela):
+        return self.armazenamento.ultimo_movimento(tabela)
+
+    def _tabela_do_estado(self, nome):
+        with self.trava:
+            if self.estado is None:
+                return None
+            self.estado = self.registro.acompanhar(self.estado)
+            linhas = [list(linha) for linha in (self.estado.estoque if nome == "estoque" else self.estado.epis)]
+        colunas = self.colunas[nome]
+        if any(len(linha) != len(colunas) for linha in linhas):
+            return None
+        df = pd.DataFrame(linhas, columns=colunas, dtype=object)
+        # Células vazias ficam vazias (NaN), como na leitura das planilhas
+        return df.mask(df == "")
+
+    def ler_tabela(self, nome, dtype=None, campos=None, inicio=None, fim=None, recentes=False):
+        """
+        Lê uma tabela. O estoque e os EPIs inteiros vêm do estado em memória (snapshot e
+        eventos), sem ler as planilhas; as demais leituras são feitas no armazenamento.
+        """
+        if nome in ("estoque", "epis") and campos is None and nome in self.colunas:
+            df = self._tabela_do_estado(nome)
+            if df is not None:
+                if dtype:
+                    return df.astype(dtype).where(df.notna())
+                # Texto com o mesmo tipo da leitura das planilhas (read_csv com dtype=str)
+                for coluna, tipo in self.esquema[nome].items():
+                    if tipo == "object":
+                        df[coluna] = df[coluna].astype(str).where(df[coluna].notna())
+                return aplicar_esquema(df, self.esquema[nome])
+        return self.armazenamento.ler_tabela(nome, dtype, campos, inicio, fim, recentes)
+
+    def fonte_paginada(self, tabela, recentes=False):
+        return self.armazenamento.fonte_paginada(tabela, recentes)
+
+
+if __name__ == "__main__":
+    from armazenamento import obter_armazenamento
+
+    repositorio = obter_armazenamento()
+    # Com a trava entre estações: nenhuma outra estação grava eventos durante a compactação
+    with repositorio.travar():
+        repositorio.criar()
+        repositorio.compactar()
+    print("Eventos compactados em um novo snapshot.")
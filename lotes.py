@@ -0,0 +1,247 @@
+import os
+import re
+import csv
+from datetime import datetime
+from versoes import versao_produto
+
+
+def _ler_texto(caminho):
+    try:
+        with open(caminho, "r", newline="", encoding="utf-8-sig") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        # Planilhas exportadas pelo Excel no Windows costumam vir em Latin-1
+        with open(caminho, "r", newline="", encoding="latin-1") as f:
+            return f.read()
+
+
+def _separador(linha):
+    if ";" in linha:
+        return ";"
+    if "\t" in linha:
+        return "\t"
+    if "," in linha and not re.search(r"\S\s+\S", linha):
+        return ","
+    return None
+
+
+def ler_arquivo_lote(caminho, campos):
+    """
+    Lê um arquivo CSV de lote. Veja ler_texto_lote.
+    """
+    return ler_texto_lote(_ler_texto(caminho), campos)
+
+
+def ler_texto_lote(texto, campos):
+    """
+    Lê as linhas de um lote, separadas por ponto e vírgula, tabulação, vírgula ou espaços.
+    Se a primeira linha tiver algum dos nomes em campos, ela é o cabeçalho; senão, as colunas
+    são lidas na ordem de campos. Retorna uma lista de (número da linha, {campo: texto}).
+    """
+    primeira = next((linha for linha in texto.splitlines() if linha.strip()), "")
+    separador = _separador(primeira)
+    if separador is None:
+        reader = ([valor.strip(",") for valor in linha.split()] for linha in texto.splitlines())
+    else:
+        reader = csv.reader(texto.splitlines(), delimiter=separador)
+
+    linhas = [(numero, linha) for numero, linha in enumerate(reader, start=1) if any(valor.strip() for valor in linha)]
+    if not linhas:
+        return []
+
+    ordem = campos
+    cabecalho = [valor.strip().upper() for valor in linhas[0][1]]
+    if any(campo in cabecalho for campo in campos):
+        ordem = cabecalho
+        linhas = linhas[1:]
+
+    itens = []
+    for numero, linha in linhas:
+        item = {campo: "" for campo in campos}
+        for campo, valor in zip(ordem, linha):
+            if campo in item:
+                item[campo] = valor.strip()
+        itens.append((numero, item))
+    return itens
+
+
+def _numero(texto):
+    return float(texto.replace(",", "."))
+
+
+def preparar_entradas(repositorio, itens, data, data_iso, operador_id, versoes=None):
+    """
+    Valida as linhas de um lote de entradas (CODIGO, QUANTIDADE e, opcionalmente, VALOR UN)
+    em uma única passada pelo índice de produtos.
+    Retorna (movimentos, erros): movimentos no formato de movimentar_lote e a lista de erros
+    encontrados. Um mesmo código pode aparecer em várias linhas; as quantidades se acumulam.
+    Sem VALOR UN no arquivo, é usado o valor unitário do estoque. data e data_iso são a DATA
+    e a DATA ISO gravadas em todas as linhas. Se versoes for um dicionário, recebe a VERSAO
+    de cada produto lido, para o movimentar_lote conferir se algum mudou.
+    """
+    movimentos, erros = [], []
+    quantidades = {}
+
+    for numero, item in itens:
+        codigo = item["CODIGO"]
+        produto = repositorio.buscar_produto(codigo) if codigo else None
+        if not produto:
+            erros.append(f"Linha {numero}: código '{codigo}' não encontrado.")
+            continue
+
+        try:
+            quantidade = _numero(item["QUANTIDADE"])
+            if quantidade <= 0:
+                raise ValueError
+        except ValueError:
+            erros.append(f"Linha {numero}: a quantidade '{item['QUANTIDADE']}' deve ser um número maior que zero.")
+            continue
+
+        try:
+            valor_un = _numero(item.get("VALOR UN") or produto[2])
+            atual = quantidades[codigo] if codigo in quantidades else float(produto[4])
+            float(produto[2])
+        except ValueError:
+            erros.append(f"Linha {numero}: valores numéricos inválidos para o código {codigo}.")
+            continue
+
+        if versoes is not None and codigo not in quantidades:
+            versoes[codigo] = versao_produto(produto)
+        quantidades[codigo] = atual + quantidade
+        linha = [codigo, produto[1], quantidade, valor_un, valor_un * quantidade, data, operador_id, data_iso]
+        movimentos.append((linha, codigo, quantidades[codigo]))
+
+    return movimentos, erros
+
+
+def preparar_saidas(repositorio, itens, solicitante, data, data_iso, operador_id, versoes=None):
+    """
+    Valida as linhas de uma requisição (CODIGO e QUANTIDADE) de um mesmo solicitante,
+    conferindo a quantidade disponível de todas de uma vez: um código repetido em várias
+    linhas tem as quantidades somadas antes da conferência.
+    Retorna (movimentos, erros) como preparar_entradas.
+    """
+    movimentos, erros = [], []
+    quantidades = {}
+
+    for numero, item in itens:
+        codigo = item["CODIGO"]
+        produto = repositorio.buscar_produto(codigo) if codigo else None
+        if not produto:
+            erros.append(f"Linha {numero}: código '{codigo}' não encontrado.")
+            continue
+
+        try:
+            quantidade = _numero(item["QUANTIDADE"])
+            if quantidade <= 0:
+                raise ValueError
+        except ValueError:
+            erros.append(f"Linha {numero}: a quantidade '{item['QUANTIDADE']}' deve ser um número maior que zero.")
+            continue
+
+        try:
+            atual = quantidades[codigo] if codigo in quantidades else float(produto[4])
+            float(produto[2])
+        except ValueError:
+            erros.append(f"Linha {numero}: valores numéricos inválidos para o código {codigo}.")
+            continue
+
+        if quantidade > atual:
+            erros.append(
+                f"Linha {numero}: quantidade insuficiente de {produto[1]} (código {codigo}): "
+                f"pedido {quantidade}, disponível {atual}."
+            )
+            continue
+
+        if versoes is not None and codigo not in quantidades:
+            versoes[codigo] = versao_produto(produto)
+        quantidades[codigo] = atual - quantidade
+        linha = [codigo, produto[1], quantidade, solicitante, data, operador_id, data_iso]
+        movimentos.append((linha, codigo, quantidades[codigo]))
+
+    return movimentos, erros
+
+
+def ler_itens_epi(texto):
+    """
+    Lê os EPIs de uma retirada em lote, um por linha: "CA ou DESCRIÇÃO;QUANTIDADE".
+    Sem ";", a linha inteira é o CA ou a descrição e a quantidade é 1.
+    Retorna uma lista de (número da linha, identificador, quantidade em texto).
+    """
+    itens = []
+    for numero, linha in enumerate(texto.splitlines(), start=1):
+        if not linha.strip():
+            continue
+        identificador, _, quantidade = linha.partition(";")
+        itens.append((numero, identificador.strip().upper(), quantidade.strip() or "1"))
+    return itens
+
+
+def preparar_retiradas_epi(df_epis, colaboradores, itens, data):
+    """
+    Valida uma retirada em lote: cada colaborador retira cada um dos itens.
+    O total de cada EPI (quantidade x colaboradores) é conferido com o estoque de EPIs de uma vez.
+    Retorna (retiradas, linhas_por_colaborador, erros): retiradas no formato de retirar_epis
+    e as linhas a acrescentar à planilha de cada colaborador.
+    """
+    df_epis = df_epis.copy()
+    df_epis["CA"] = df_epis["CA"].fillna("").astype(str).str.strip().str.upper()
+    df_epis["DESCRICAO"] = df_epis["DESCRICAO"].fillna("").astype(str).str.strip().str.upper()
+
+    erros = []
+    selecionados = []
+    totais = {}
+    for numero, identificador, quantidade in itens:
+        encontrados = df_epis.index[(df_epis["CA"] == identificador) | (df_epis["DESCRICAO"] == identificador)]
+        if len(encontrados) == 0:
+            erros.append(f"Linha {numero}: EPI '{identificador}' não encontrado.")
+            continue
+        try:
+            quantidade = _numero(quantidade)
+            if quantidade <= 0:
+                raise ValueError
+        except ValueError:
+            erros.append(f"Linha {numero}: a quantidade '{quantidade}' deve ser um número maior que zero.")
+            continue
+        posicao = encontrados[0]
+        selecionados.append((posicao, identificador, quantidade))
+        totais[posicao] = totais.get(posicao, 0) + quantidade * len(colaboradores)
+
+    for posicao, total in totais.items():
+        try:
+            disponivel = float(df_epis.at[posicao, "QUANTIDADE"])
+        except ValueError:
+            disponivel = 0
+        if total > disponivel:
+            erros.append(
+                f"Quantidade insuficiente de {df_epis.at[posicao, 'DESCRICAO']}: "
+                f"necessário {total}, disponível {disponivel}."
+            )
+
+    retiradas = [(identificador, quantidade * len(colaboradores)) for _, identificador, quantidade in selecionados]
+    linhas_por_colaborador = {
+        colaborador: [
+            [df_epis.at[posicao, "CA"], df_epis.at[posicao, "DESCRICAO"], quantidade, data]
+            for posicao, _, quantidade in selecionados
+        ]
+        for colaborador in colaboradores
+    }
+    return retiradas, linhas_por_colaborador, erros
+
+
+def anexar_retiradas_colaboradores(linhas_por_colaborador, pasta="Colaboradores"):
+    """
+    Acrescenta as retiradas de EPI à planilha do mês de cada colaborador
+    (Colaboradores/<NOME>/<NOME>_AAAA_MM.csv), abrindo cada arquivo uma única vez.
+    """
+    mes = datetime.now().strftime("%Y_%m")
+    for colaborador, linhas in linhas_por_colaborador.items():
+        pasta_colaborador = os.path.join(pasta, colaborador)
+        os.makedirs(pasta_colaborador, exist_ok=True)
+        caminho = os.path.join(pasta_colaborador, f"{colaborador}_{mes}.csv")
+        novo = not os.path.exists(caminho)
+        with open(caminho, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if novo:
+                writer.writerow(["CA", "DESCRICAO", "QTD RETIRADA", "DATA"])
+            writer.writerows(linhas)
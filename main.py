@@ -1,115 +1,137 @@
+import time
+inicio_programa = time.perf_counter()
+
 import os
+import re
 import csv
-import time
+import queue
+import functools
+import importlib
 import shutil
-import pandas as pd
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
+import configuracao
 from usuarios import usuarios
-from pandastable import Table, TableModel
 
-
-arquivos = {
-    "estoque": "Planilhas/Estoque.csv",
-    "entrada": "Planilhas/Entrada.csv",
-    "saida": "Planilhas/Saida.csv"
-}
+# pandas, pandastable e os módulos de dados são importados em segundo plano enquanto a janela
+# de login está aberta (veja carregar_em_segundo_plano) e ligados aos nomes deste arquivo depois do login.
 
 
 
 # Funções
 
-def criar_planilhas():
+def criar_planilhas(repositorio):
     """
-    Cria os arquivos CSV necessários para o funcionamento do sistema, caso não existam.
+    Cria as planilhas (ou tabelas do banco) necessárias para o funcionamento do sistema, caso não existam.
+    Recebe o repositório porque é executada antes de o repositorio deste arquivo ser definido.
     """
-    colunas = {
-        "estoque": ["CODIGO", "DESCRICAO", "VALOR UN", "VALOR TOTAL", "QUANTIDADE", "DATA", "LOCALIZACAO"],
-        "entrada": ["CODIGO", "DESCRICAO", "QUANTIDADE", "VALOR UN", "VALOR TOTAL", "DATA", "ID"],
-        "saida": ["CODIGO", "DESCRICAO", "QUANTIDADE", "SOLICITANTE", "DATA", "ID"],
-        "epis": ["CA", "DESCRICAO", "QUANTIDADE"]
-    }
-    os.makedirs("Planilhas", exist_ok=True)
-
-    for nome, arquivo in arquivos.items():
-        if not os.path.exists(arquivo):
-            df = pd.DataFrame(columns=colunas[nome])
-            df.to_csv(arquivo, index=False, encoding="utf-8")
-
-    if not os.path.exists("Planilhas/Epis.csv"):
-        df_epis = pd.DataFrame(columns=["CA", "DESCRICAO", "QUANTIDADE"])
-        df_epis.to_csv("Planilhas/Epis.csv", index=False, encoding="utf-8")
+    with repositorio.travar():
+        repositorio.criar()
             
             
-def obter_proximo_codigo():
+def buscar_produto(codigo):
     """
-    Obtém o próximo código disponível para um novo produto.
+    Busca um produto no estoque pelo código.
     """
-    
-    try:
-        with open(arquivos["estoque"], "r", encoding="utf-8") as f:
-            reader = list(csv.reader(f))
-            if len(reader) > 1:
-                return int(float(reader[-1][0])) + 1
-            else:
-                return 3
-    except (FileNotFoundError, ValueError):
-        return 3
+    if coordenador is not None:
+        return coordenador.buscar_produto(codigo)
+    return repositorio.buscar_produto(codigo)
 
-    
-def atualizar_estoque(codigo, nova_quantidade):
+
+pesquisa_agendada = None
+geracao_pesquisa = 0
+
+
+def agendar_pesquisa(event=None):
     """
-    Atualiza a quantidade de um produto no estoque.
+    Chamada a cada tecla digitada na pesquisa: a pesquisa só é feita PESQUISA_ESPERA
+    milissegundos depois da última tecla.
     """
-    
-    with open(arquivos["estoque"], "r", encoding="utf-8") as f:
-        produtos = list(csv.reader(f))
+    global pesquisa_agendada
 
-    for produto in produtos:
-        if produto[0] == codigo:
-            try:
-                produto[4] = str(nova_quantidade)
-                produto[3] = str(float(produto[2]) * int(nova_quantidade))
-            except ValueError:
-                messagebox.showerror("Erro", "Erro ao atualizar o estoque. Verifique os valores numéricos.")
-                return
-
-    with open(arquivos["estoque"], "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerows(produtos)
+    if pesquisa_agendada is not None:
+        main.after_cancel(pesquisa_agendada)
+    pesquisa_agendada = main.after(configuracao.PESQUISA_ESPERA, pesquisar_tabela)
 
 
-def buscar_produto(codigo):
+def cancelar_pesquisa():
     """
-    Busca um produto no estoque pelo código.
+    Cancela a pesquisa agendada e descarta a que estiver em andamento.
     """
-    
-    try:
-        with open(arquivos["estoque"], "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            next(reader)
-            for row in reader:
-                if row[0] == codigo:
-                    return row
-    except FileNotFoundError:
-        pass
-    return None
+    global pesquisa_agendada, geracao_pesquisa
+
+    if pesquisa_agendada is not None:
+        main.after_cancel(pesquisa_agendada)
+        pesquisa_agendada = None
+    geracao_pesquisa += 1
+    return geracao_pesquisa
 
 
 def pesquisar_tabela(event=None):
     """
-    Filtra a tabela com base na entrada do usuário.
+    Filtra a tabela com base na entrada do usuário (veja pesquisa.py). O filtro é feito em
+    segundo plano; se outra pesquisa começar antes de ele terminar, ele é interrompido e
+    o resultado, descartado. No estoque, PREFIXO_APROXIMADO ("~parafuzo") mostra os produtos
+    mais parecidos, do mais para o menos parecido; "loc:A3 qtd<5" pesquisa por campo
+    (veja pesquisa.compilar_consulta).
     """
-    query = pesquisar_entry.get().strip().lower()
-    if query:
-        df_filtered = df[df.apply(lambda row: row.astype(
-            str).str.lower().str.contains(query).any(), axis=1)]
-    else:
-        df_filtered = df
+    geracao = cancelar_pesquisa()
+    query = pesquisar_entry.get().strip()
+    if not query:
+        pandas_table.model.df = df
+        pandas_table.redraw()
+        return
 
-    pandas_table.model.df = df_filtered
-    pandas_table.redraw()
+    carregar_tabela_completa()
+    tabela = df
+    try:
+        por_campo = not query.startswith(PREFIXO_REGEX) and compilar_consulta(query) is not None
+    except ErroConsulta:
+        # Pesquisa por campo ainda incompleta ("qtd<") enquanto é digitada: mantém o filtro anterior
+        return
+    usar_indice = tabela_atual == "estoque" and not query.startswith(PREFIXO_REGEX) and not por_campo
+    # Só o estoque tem pesquisa aproximada; nas outras tabelas o "~" é procurado como texto
+    aproximada = usar_indice and query.startswith(PREFIXO_APROXIMADO)
+    if aproximada:
+        query = query[len(PREFIXO_APROXIMADO):].strip()
+
+    def filtrar_aproximado():
+        return indice_estoque.filtrar_aproximado(
+            tabela, query, configuracao.PESQUISA_APROXIMADA_LIMITE, configuracao.PESQUISA_APROXIMADA_MINIMO
+        )
+
+    def filtrar():
+        if aproximada:
+            return filtrar_aproximado()
+        if usar_indice:
+            # O texto em qualquer coluna, como nas outras tabelas, mais os produtos com todas as
+            # palavras em DESCRICAO, LOCALIZACAO ou CODIGO; se nenhum, os produtos parecidos
+            df_filtered = cache_pesquisa.filtrar(
+                tabela, query, cancelado=lambda: geracao != geracao_pesquisa, indice=indice_estoque
+            )
+            if df_filtered is None or not df_filtered.empty:
+                return df_filtered
+            return filtrar_aproximado()
+        return cache_pesquisa.filtrar(tabela, query, cancelado=lambda: geracao != geracao_pesquisa)
+
+    def concluir(df_filtered, erro):
+        if geracao != geracao_pesquisa or tabela is not df:
+            return
+        if isinstance(erro, (re.error, ErroConsulta)):
+            # Expressão regular ou pesquisa por campo ainda incompleta enquanto é digitada: mantém o filtro anterior
+            return
+        if erro is not None:
+            messagebox.showerror("Erro", f"Erro ao pesquisar na tabela {tabela_atual}: {erro}")
+            return
+        if df_filtered is None:
+            # Pesquisa interrompida por outra mais nova
+            return
+        pandas_table.model.df = df_filtered
+        pandas_table.redraw()
+
+    executar_em_segundo_plano(filtrar, concluir)
 
 
 def limpar_tabela(): 
@@ -117,6 +139,7 @@ def limpar_tabela():
     Limpa a tabela de pesquisa e exibe todos os produtos.
     """
     
+    cancelar_pesquisa()
     pesquisar_entry.delete(0, tk.END)
     pandas_table.model.df = df
     pandas_table.redraw()
@@ -126,7 +149,8 @@ def cadastrar_estoque():
     """
     Cadastra um novo produto no estoque.
     """
-    codigo = obter_proximo_codigo()
+    if not alteracoes_liberadas():
+        return
 
     descricao = desc_entry.get().strip().upper()
     if not descricao:
@@ -151,17 +175,16 @@ def cadastrar_estoque():
 
     localizacao = localizacao_entry.get().strip().upper()
 
-    data = datetime.now().strftime("%H:%M %d/%m/%Y")
-    confirmacao = messagebox.askyesno(
-        "Confirmação", f"Você deseja cadastrar o produto com código {codigo} e descrição {descricao}?"
-    )
+    # O código só é reservado depois da confirmação, junto com a gravação do produto, para que
+    # um cadastro cancelado não deixe um código sem uso
+    confirmacao = messagebox.askyesno("Confirmação", f"Você deseja cadastrar o produto com descrição {descricao}?")
     if confirmacao:
-        valor_total = quantidade * valor_un
-
         try:
-            with open(arquivos["estoque"], "a", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow([int(codigo), descricao, valor_un, valor_total, quantidade, data, localizacao])
+            if coordenador is not None:
+                codigo = coordenador.cadastrar(descricao, quantidade, valor_un, localizacao)["codigo"]
+            else:
+                codigo = operacoes.cadastrar_produto(repositorio, descricao, quantidade, valor_un, localizacao)
+            indice_estoque.atualizar(codigo, descricao, localizacao)
             messagebox.showinfo("Sucesso", f"Produto cadastrado com sucesso! \n{descricao} Código: {codigo}")
 
             desc_entry.delete(0, tk.END)
@@ -178,6 +201,9 @@ def registrar_entrada():
     """
     Registra a entrada de um produto no estoque.
     """
+    if not alteracoes_liberadas():
+        return
+
     codigo = codigo_entry.get().strip()
     if not codigo:
         messagebox.showerror("Erro", "O código do produto não pode ser vazio.")
@@ -203,8 +229,6 @@ def registrar_entrada():
         messagebox.showerror("Erro", "Erro ao calcular a nova quantidade. Verifique os valores no estoque.")
         return
 
-    data = datetime.now().strftime("%H:%M %d/%m/%Y")
-
     valor_un = float(produto[2])
     valor_total = valor_un * quantidade_adicionada
 
@@ -219,11 +243,29 @@ def registrar_entrada():
     )
 
     if confirmacao:
-        with open(arquivos["entrada"], "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([codigo, produto[1], quantidade_adicionada, valor_un, valor_total, data, operador_logado_id])
+        try:
+            if coordenador is not None:
+                nova_quantidade = coordenador.entrada(codigo, quantidade_adicionada, operador_logado_id)["quantidade"]
+            else:
+                produto, nova_quantidade = operacoes.registrar_entrada(
+                    repositorio, codigo, quantidade_adicionada, operador_logado_id
+                )
+        except ErroOperacao as e:
+            messagebox.showerror("Erro", f"Erro ao registrar a entrada: {e}")
+            return
+        except ConflitoVersao as e:
+            messagebox.showerror("Erro", f"O produto está sendo alterado por outra estação. Tente novamente.\n\n{e}")
+            return
+        except TimeoutError as e:
+            messagebox.showerror("Erro", f"Outra estação está usando as planilhas. Tente novamente.\n\n{e}")
+            return
+        except ValueError:
+            messagebox.showerror("Erro", "Erro ao atualizar o estoque. Verifique os valores numéricos.")
+            return
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao registrar a entrada: {e}")
+            return
 
-        atualizar_estoque(codigo, nova_quantidade)
         messagebox.showinfo(
             "Sucesso",
             f"Entrada registrada e estoque atualizado!\n"
@@ -232,12 +274,107 @@ def registrar_entrada():
 
         codigo_entry.delete(0, tk.END)
         quantidade_entrada_entry.delete(0, tk.END)
-        
+
+
+def importar_entradas():
+    """
+    Registra de uma vez as entradas de um arquivo CSV do fornecedor, com as colunas
+    CODIGO, QUANTIDADE e, opcionalmente, VALOR UN. Todas as linhas são validadas antes;
+    se alguma tiver erro, nenhuma entrada é registrada.
+    """
+    if not alteracoes_liberadas():
+        return
+
+    caminho = filedialog.askopenfilename(
+        title="Importar Entradas",
+        filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos", "*.*")]
+    )
+    if not caminho:
+        return
+
+    try:
+        itens = ler_arquivo_lote(caminho, ["CODIGO", "QUANTIDADE", "VALOR UN"])
+    except (OSError, csv.Error) as e:
+        messagebox.showerror("Erro", f"Erro ao ler o arquivo: {e}")
+        return
+
+    if not itens:
+        messagebox.showerror("Erro", "O arquivo não tem itens para registrar.")
+        return
+
+    agora = datetime.now()
+    movimentos, erros = preparar_entradas(
+        repositorio, itens, agora.strftime("%H:%M %d/%m/%Y"), agora.strftime(FORMATO_DATA_ISO), operador_logado_id
+    )
+    if erros:
+        mensagem = "\n".join(erros[:15])
+        if len(erros) > 15:
+            mensagem += f"\n... e mais {len(erros) - 15} erro(s)."
+        messagebox.showerror("Erro", f"Nenhuma entrada foi registrada. Corrija o arquivo:\n\n{mensagem}")
+        return
+
+    quantidade_total = sum(linha[2] for linha, _, _ in movimentos)
+    valor_total = sum(linha[4] for linha, _, _ in movimentos)
+    confirmacao = messagebox.askyesno(
+        "Confirmação",
+        f"Você deseja registrar as entradas deste arquivo?\n\n"
+        f"Arquivo: {os.path.basename(caminho)}\n"
+        f"Linhas: {len(movimentos)}\n"
+        f"Produtos: {len({codigo for _, codigo, _ in movimentos})}\n"
+        f"Quantidade total: {quantidade_total}\n"
+        f"Valor Total: R$ {valor_total:.2f}"
+    )
+
+    def gravar():
+        # Validado de novo a cada tentativa, com as quantidades e versões atuais do estoque
+        versoes = {}
+        movimentos, erros = preparar_entradas(
+            repositorio, itens, agora.strftime("%H:%M %d/%m/%Y"), agora.strftime(FORMATO_DATA_ISO),
+            operador_logado_id, versoes
+        )
+        if not erros and coordenador is not None:
+            # O coordenador confere de novo e grava todas as entradas juntas, ou nenhuma
+            coordenador.grupo([
+                ("entrada", {"codigo": codigo, "quantidade": linha[2], "valor_un": linha[3], "operador_id": operador_logado_id})
+                for linha, codigo, _ in movimentos
+            ])
+        elif not erros:
+            repositorio.movimentar_lote("entrada", movimentos, versoes)
+        return movimentos, erros
+
+    if confirmacao:
+        try:
+            movimentos, erros = repetir_em_conflito(gravar, configuracao.TENTATIVAS_CONFLITO)
+        except ErroOperacao as e:
+            messagebox.showerror("Erro", f"Nenhuma entrada foi registrada.\n\n{e}")
+            return
+        except ConflitoVersao as e:
+            messagebox.showerror("Erro", f"Os produtos estão sendo alterados por outra estação. Tente novamente.\n\n{e}")
+            return
+        except TimeoutError as e:
+            messagebox.showerror("Erro", f"Outra estação está usando as planilhas. Tente novamente.\n\n{e}")
+            return
+        except ValueError:
+            messagebox.showerror("Erro", "Erro ao atualizar o estoque. Verifique os valores numéricos.")
+            return
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao registrar as entradas: {e}")
+            return
+
+        if erros:
+            messagebox.showerror("Erro", "Nenhuma entrada foi registrada: o estoque foi alterado por outra estação.\n\n" + "\n".join(erros[:15]))
+            return
+
+        messagebox.showinfo("Sucesso", f"{len(movimentos)} entradas registradas e estoque atualizado!")
+
 
 def registrar_saida():
     """
     Registra a saída de um produto do estoque.
     """
+    if not alteracoes_liberadas():
+        return
+
     codigo = codigo_saida_entry.get().strip()
     if not codigo:
         messagebox.showerror("Erro", "O código do produto não pode ser vazio.")
@@ -267,7 +404,6 @@ def registrar_saida():
         return
 
     nova_quantidade = float(produto[4]) - quantidade_retirada
-    data = datetime.now().strftime("%H:%M %d/%m/%Y")
 
     confirmacao = messagebox.askyesno(
         "Confirmação",
@@ -280,11 +416,33 @@ def registrar_saida():
     )
 
     if confirmacao:
-        with open(arquivos["saida"], "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([codigo, produto[1], quantidade_retirada, solicitante, data, operador_logado_id])
+        try:
+            # A quantidade é conferida de novo na gravação: outra estação pode ter retirado o produto
+            if coordenador is not None:
+                nova_quantidade = coordenador.saida(codigo, quantidade_retirada, solicitante, operador_logado_id)["quantidade"]
+            else:
+                produto, nova_quantidade = operacoes.registrar_saida(
+                    repositorio, codigo, quantidade_retirada, solicitante, operador_logado_id
+                )
+        except QuantidadeInsuficiente as e:
+            messagebox.showerror("Erro", f"Quantidade insuficiente no estoque! Disponível agora: {e.disponivel}")
+            return
+        except ErroOperacao as e:
+            messagebox.showerror("Erro", f"Erro ao registrar a saída: {e}")
+            return
+        except ConflitoVersao as e:
+            messagebox.showerror("Erro", f"O produto está sendo alterado por outra estação. Tente novamente.\n\n{e}")
+            return
+        except TimeoutError as e:
+            messagebox.showerror("Erro", f"Outra estação está usando as planilhas. Tente novamente.\n\n{e}")
+            return
+        except ValueError:
+            messagebox.showerror("Erro", "Erro ao atualizar o estoque. Verifique os valores numéricos.")
+            return
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao registrar a saída: {e}")
+            return
 
-        atualizar_estoque(codigo, nova_quantidade)
         messagebox.showinfo(
             "Sucesso",
             f"Saída registrada e estoque atualizado!\n"
@@ -296,10 +454,153 @@ def registrar_saida():
         quantidade_saida_entry.delete(0, tk.END)
 
 
+def abrir_requisicao():
+    """
+    Abre a tela de requisição: várias saídas de um mesmo solicitante, registradas de uma vez.
+    """
+    if not alteracoes_liberadas():
+        return
+
+    janela = tk.Toplevel(main)
+    janela.title("Requisição de Saída")
+    janela.geometry("420x480")
+    janela.resizable(False, False)
+    janela.transient(main)
+
+    tk.Label(janela, text="Solicitante", font=("Arial", 12)).place(x=20, y=15)
+    solicitante_requisicao_entry = tk.Entry(janela, font=("Arial", 12))
+    solicitante_requisicao_entry.config(bg="#fff", fg="#000")
+    solicitante_requisicao_entry.place(x=20, y=40, width=380, height=30)
+
+    tk.Label(janela, text="Itens (um por linha: CODIGO QUANTIDADE)", font=("Arial", 12)).place(x=20, y=80)
+    itens_text = tk.Text(janela, font=("Arial", 12))
+    itens_text.config(bg="#fff", fg="#000")
+    itens_text.place(x=20, y=105, width=380, height=260)
+
+    def carregar_arquivo():
+        caminho = filedialog.askopenfilename(
+            parent=janela, title="Carregar Requisição",
+            filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos", "*.*")]
+        )
+        if not caminho:
+            return
+        try:
+            itens = ler_arquivo_lote(caminho, ["CODIGO", "QUANTIDADE"])
+        except (OSError, csv.Error) as e:
+            messagebox.showerror("Erro", f"Erro ao ler o arquivo: {e}", parent=janela)
+            return
+        itens_text.delete("1.0", tk.END)
+        itens_text.insert("1.0", "\n".join(f"{item['CODIGO']} {item['QUANTIDADE']}" for _, item in itens))
+
+    def registrar():
+        if registrar_requisicao(solicitante_requisicao_entry.get(), itens_text.get("1.0", tk.END), janela):
+            janela.destroy()
+
+    carregar_button = tk.Button(janela, text="Carregar Arquivo", command=carregar_arquivo)
+    carregar_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
+    carregar_button.place(x=20, y=380, width=185, height=40)
+
+    registrar_button = tk.Button(janela, text="Registrar Requisição", command=registrar)
+    registrar_button.config(bg="#67F5A5", fg="#000", font=("Arial", 12))
+    registrar_button.place(x=215, y=380, width=185, height=40)
+
+
+def registrar_requisicao(solicitante, texto, janela=None):
+    """
+    Registra as saídas de uma requisição. As quantidades de todos os itens são conferidas
+    de uma vez; se algum item tiver erro, nenhuma saída é registrada.
+    Retorna True se a requisição foi registrada.
+    """
+    solicitante = solicitante.strip().upper()
+    if not solicitante:
+        messagebox.showerror("Erro", "O nome do solicitante não pode ser vazio.", parent=janela)
+        return False
+
+    itens = ler_texto_lote(texto, ["CODIGO", "QUANTIDADE"])
+    if not itens:
+        messagebox.showerror("Erro", "A requisição não tem itens.", parent=janela)
+        return False
+
+    agora = datetime.now()
+    movimentos, erros = preparar_saidas(
+        repositorio, itens, solicitante, agora.strftime("%H:%M %d/%m/%Y"), agora.strftime(FORMATO_DATA_ISO),
+        operador_logado_id
+    )
+    if erros:
+        mensagem = "\n".join(erros[:15])
+        if len(erros) > 15:
+            mensagem += f"\n... e mais {len(erros) - 15} erro(s)."
+        messagebox.showerror("Erro", f"Nenhuma saída foi registrada. Corrija a requisição:\n\n{mensagem}", parent=janela)
+        return False
+
+    resumo = "\n".join(f"{linha[0]} - {linha[1]}: {linha[2]}" for linha, _, _ in movimentos[:15])
+    if len(movimentos) > 15:
+        resumo += f"\n... e mais {len(movimentos) - 15} item(ns)."
+    confirmacao = messagebox.askyesno(
+        "Confirmação",
+        f"Você deseja registrar esta requisição?\n\n"
+        f"Solicitante: {solicitante}\n"
+        f"Itens: {len(movimentos)}\n\n{resumo}",
+        parent=janela
+    )
+    if not confirmacao:
+        return False
+
+    def gravar():
+        # Conferida de novo a cada tentativa, com as quantidades e versões atuais do estoque
+        versoes = {}
+        movimentos, erros = preparar_saidas(
+            repositorio, itens, solicitante, agora.strftime("%H:%M %d/%m/%Y"), agora.strftime(FORMATO_DATA_ISO),
+            operador_logado_id, versoes
+        )
+        if not erros and coordenador is not None:
+            # O coordenador confere de novo e grava todas as saídas juntas, ou nenhuma
+            coordenador.grupo([
+                ("saida", {"codigo": codigo, "quantidade": linha[2], "solicitante": solicitante, "operador_id": operador_logado_id})
+                for linha, codigo, _ in movimentos
+            ])
+        elif not erros:
+            repositorio.movimentar_lote("saida", movimentos, versoes)
+        return movimentos, erros
+
+    try:
+        movimentos, erros = repetir_em_conflito(gravar, configuracao.TENTATIVAS_CONFLITO)
+    except ErroOperacao as e:
+        messagebox.showerror("Erro", f"Nenhuma saída foi registrada.\n\n{e}", parent=janela)
+        return False
+    except ConflitoVersao as e:
+        messagebox.showerror(
+            "Erro", f"Os produtos estão sendo alterados por outra estação. Tente novamente.\n\n{e}", parent=janela
+        )
+        return False
+    except TimeoutError as e:
+        messagebox.showerror("Erro", f"Outra estação está usando as planilhas. Tente novamente.\n\n{e}", parent=janela)
+        return False
+    except ValueError:
+        messagebox.showerror("Erro", "Erro ao atualizar o estoque. Verifique os valores numéricos.", parent=janela)
+        return False
+    except Exception as e:
+        messagebox.showerror("Erro", f"Erro ao registrar a requisição: {e}", parent=janela)
+        return False
+
+    if erros:
+        mensagem = "\n".join(erros[:15])
+        messagebox.showerror(
+            "Erro", f"Nenhuma saída foi registrada: o estoque foi alterado por outra estação.\n\n{mensagem}", parent=janela
+        )
+        return False
+
+    messagebox.showinfo("Sucesso", f"Requisição registrada: {len(movimentos)} saídas para {solicitante}.", parent=janela)
+    return True
+
+
 def registrar_epi():
     """
     Registra um novo EPI no arquivo Epis.csv ou atualiza a quantidade de um EPI existente.
     """
+    if not alteracoes_liberadas():
+        return
+
     ca = ca_entry.get().strip().upper()
     descricao = descricao_epi_entry.get().strip().upper()
     quantidade = quantidade_epi_entry.get().strip()
@@ -321,7 +622,7 @@ def registrar_epi():
         return
 
     try:
-        df_epis = pd.read_csv("Planilhas/Epis.csv", encoding="utf-8", dtype={"CA": str})
+        df_epis = repositorio.ler_tabela("epis")
         df_epis["CA"] = df_epis["CA"].fillna("").astype(str).str.strip().str.upper()
         df_epis["DESCRICAO"] = df_epis["DESCRICAO"].fillna("").astype(str).str.strip().str.upper()
 
@@ -337,9 +638,10 @@ def registrar_epi():
                     f"Deseja adicionar {quantidade} à quantidade existente?"
                 )
                 if adicionar_quantidade:
-                    nova_quantidade = float(epi_existente_ca.iloc[0]["QUANTIDADE"]) + quantidade
-                    df_epis.loc[epi_existente_ca.index, "QUANTIDADE"] = nova_quantidade
-                    df_epis.to_csv("Planilhas/Epis.csv", index=False, encoding="utf-8")
+                    if coordenador is not None:
+                        nova_quantidade = coordenador.epi(ca, "", quantidade)["quantidade"]
+                    else:
+                        nova_quantidade = operacoes.repor_epi(repositorio, ca, quantidade)
                     atualizar_tabela_epis()
                     messagebox.showinfo("Sucesso", f"Quantidade atualizada com sucesso!\nCA: {ca}, Nova Quantidade: {nova_quantidade}")
                 else:
@@ -358,9 +660,10 @@ def registrar_epi():
                     f"Deseja adicionar {quantidade} à quantidade existente?"
                 )
                 if adicionar_quantidade:
-                    nova_quantidade = float(epi_existente_desc.iloc[0]["QUANTIDADE"]) + quantidade
-                    df_epis.loc[epi_existente_desc.index, "QUANTIDADE"] = nova_quantidade
-                    df_epis.to_csv("Planilhas/Epis.csv", index=False, encoding="utf-8")
+                    if coordenador is not None:
+                        nova_quantidade = coordenador.epi("", descricao, quantidade)["quantidade"]
+                    else:
+                        nova_quantidade = operacoes.repor_epi(repositorio, descricao, quantidade)
                     atualizar_tabela_epis()
                     messagebox.showinfo("Sucesso", f"Quantidade atualizada com sucesso!\nDescrição: {descricao}, Nova Quantidade: {nova_quantidade}")
                 else:
@@ -378,9 +681,21 @@ def registrar_epi():
             messagebox.showinfo("Operação Cancelada", "O registro do EPI foi cancelado.")
             return
 
-        with open("Planilhas/Epis.csv", "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([ca, descricao, quantidade])
+        if coordenador is not None:
+            # Se outra estação registrou o mesmo EPI nesse meio tempo, o coordenador soma a quantidade a ele
+            registrado = not coordenador.epi(ca, descricao, quantidade)["novo"]
+            if registrado:
+                messagebox.showinfo("Aviso", "Este EPI acabou de ser registrado por outra estação; a quantidade foi somada a ele.")
+                atualizar_tabela_epis()
+                return
+        else:
+            # Outra estação pode ter registrado o mesmo EPI enquanto a confirmação estava aberta
+            registrado = not operacoes.registrar_epi(repositorio, ca, descricao, quantidade)
+
+        if registrado:
+            messagebox.showerror("Erro", "Este EPI acabou de ser registrado por outra estação. Use a opção de adicionar quantidade.")
+            atualizar_tabela_epis()
+            return
 
         messagebox.showinfo("Sucesso", f"EPI registrado com sucesso!\nDescrição: {descricao}, Quantidade: {quantidade}")
 
@@ -398,6 +713,9 @@ def registrar_retirada():
     """
     Registra a retirada de um EPI por um colaborador.
     """
+    if not alteracoes_liberadas():
+        return
+
     colaborador = colaborador_entry.get().strip().upper()
     identificador = ca_retirada_entry.get().strip().upper()
     quantidade_retirada = quantidade_retirada_entry.get().strip()
@@ -415,7 +733,7 @@ def registrar_retirada():
         return
 
     try:
-        df_epis = pd.read_csv("Planilhas/Epis.csv", encoding="utf-8", dtype={"CA": str})
+        df_epis = repositorio.ler_tabela("epis")
         df_epis["CA"] = df_epis["CA"].fillna("").astype(str).str.strip().str.upper()
         df_epis["DESCRICAO"] = df_epis["DESCRICAO"].fillna("").astype(str).str.strip().str.upper()
 
@@ -423,8 +741,24 @@ def registrar_retirada():
                       (df_epis["DESCRICAO"].str.upper() == identificador)]
 
         if epi.empty:
-            messagebox.showerror("Erro", f"O EPI com CA ou Descrição '{identificador}' não foi encontrado.")
-            return
+            # CA ou descrição digitados com erro: oferece o EPI mais parecido
+            parecidos = ranquear(
+                identificador, ((posicao, f"{ca} {descricao}") for posicao, (ca, descricao)
+                                in enumerate(zip(df_epis["CA"], df_epis["DESCRICAO"]))),
+                limite=1, minimo=configuracao.PESQUISA_APROXIMADA_MINIMO
+            )
+            if not parecidos:
+                messagebox.showerror("Erro", f"O EPI com CA ou Descrição '{identificador}' não foi encontrado.")
+                return
+            epi = df_epis.iloc[[parecidos[0][0]]]
+            ca, descricao = epi.iloc[0]["CA"], epi.iloc[0]["DESCRICAO"]
+            if not messagebox.askyesno(
+                "EPI Não Encontrado",
+                f"O EPI '{identificador}' não foi encontrado. Você quis dizer '{descricao}'"
+                + (f" (CA {ca})" if ca else "") + "?"
+            ):
+                return
+            identificador = ca or descricao
 
         descricao = epi.iloc[0]["DESCRICAO"]
         quantidade_disponivel = int(epi.iloc[0]["QUANTIDADE"])
@@ -458,23 +792,18 @@ def registrar_retirada():
             messagebox.showinfo("Operação Cancelada", "A retirada foi cancelada.")
             return
 
-        df_epis.loc[(df_epis["CA"] == identificador) | (df_epis["DESCRICAO"] == identificador), "QUANTIDADE"] = quantidade_disponivel - quantidade_retirada
-        df_epis.to_csv("Planilhas/Epis.csv", index=False, encoding="utf-8")
+        try:
+            # A quantidade é conferida de novo na gravação: outra estação pode ter retirado o EPI
+            if coordenador is not None:
+                coordenador.retirada(colaborador, identificador, quantidade_retirada)
+            else:
+                operacoes.retirar_epi(repositorio, colaborador, identificador, quantidade_retirada)
+        except ErroOperacao as e:
+            messagebox.showerror("Erro", str(e) if isinstance(e, QuantidadeInsuficiente) else f"Erro ao registrar a retirada: {e}")
+            atualizar_tabela_epis()
+            return
         atualizar_tabela_epis()
 
-        nome_arquivo = f"{colaborador}_{datetime.now().strftime('%Y_%m')}.csv"
-        caminho_arquivo = os.path.join(pasta_colaborador, nome_arquivo)
-
-        if not os.path.exists(caminho_arquivo):
-            with open(caminho_arquivo, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(["CA", "DESCRICAO", "QTD RETIRADA", "DATA"])
-
-        data = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(caminho_arquivo, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([epi.iloc[0]["CA"], descricao, quantidade_retirada, data])
-
         messagebox.showinfo("Sucesso", f"Retirada registrada para o colaborador {colaborador}.\n"
                                        f"Descrição: {descricao}, Quantidade: {quantidade_retirada}")
 
@@ -490,13 +819,124 @@ def registrar_retirada():
         return    
 
 
+def abrir_retirada_lote():
+    """
+    Abre a tela de retirada em lote: vários colaboradores retiram os mesmos EPIs (um kit) de uma vez.
+    """
+    if not alteracoes_liberadas():
+        return
+
+    janela = tk.Toplevel(main)
+    janela.title("Retirada de EPIs em Lote")
+    janela.geometry("620x480")
+    janela.resizable(False, False)
+    janela.transient(main)
+
+    tk.Label(janela, text="Colaboradores (um por linha)", font=("Arial", 12)).place(x=20, y=15)
+    colaboradores_text = tk.Text(janela, font=("Arial", 12))
+    colaboradores_text.config(bg="#fff", fg="#000")
+    colaboradores_text.place(x=20, y=40, width=280, height=340)
+
+    tk.Label(janela, text="EPIs (CA ou Descrição;Quantidade)", font=("Arial", 12)).place(x=320, y=15)
+    epis_text = tk.Text(janela, font=("Arial", 12))
+    epis_text.config(bg="#fff", fg="#000")
+    epis_text.place(x=320, y=40, width=280, height=340)
+
+    def registrar():
+        if registrar_retirada_lote(colaboradores_text.get("1.0", tk.END), epis_text.get("1.0", tk.END), janela):
+            janela.destroy()
+
+    registrar_button = tk.Button(janela, text="Registrar Retiradas", command=registrar)
+    registrar_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
+    registrar_button.place(x=20, y=400, width=580, height=40)
+
+
+def registrar_retirada_lote(texto_colaboradores, texto_epis, janela=None):
+    """
+    Registra a retirada dos mesmos EPIs por vários colaboradores. O estoque de EPIs é
+    conferido de uma vez e a planilha Epis.csv é gravada uma única vez; a planilha de cada
+    colaborador é aberta uma única vez. Retorna True se as retiradas foram registradas.
+    """
+    colaboradores = list(dict.fromkeys(
+        linha.strip().upper() for linha in texto_colaboradores.splitlines() if linha.strip()
+    ))
+    itens = ler_itens_epi(texto_epis)
+    if not colaboradores or not itens:
+        messagebox.showerror("Erro", "Informe pelo menos um colaborador e um EPI.", parent=janela)
+        return False
+
+    try:
+        df_epis = repositorio.ler_tabela("epis")
+    except FileNotFoundError:
+        messagebox.showerror("Erro", "Arquivo Epis.csv não encontrado.", parent=janela)
+        return False
+
+    data = datetime.now().strftime(FORMATO_DATA_ISO)
+    retiradas, linhas_por_colaborador, erros = preparar_retiradas_epi(df_epis, colaboradores, itens, data)
+    if erros:
+        mensagem = "\n".join(erros[:15])
+        if len(erros) > 15:
+            mensagem += f"\n... e mais {len(erros) - 15} erro(s)."
+        messagebox.showerror("Erro", f"Nenhuma retirada foi registrada. Corrija os dados:\n\n{mensagem}", parent=janela)
+        return False
+
+    novos = [c for c in colaboradores if not os.path.exists(os.path.join("Colaboradores", c))]
+    resumo = "\n".join(f"{linha[1] or linha[0]}: {linha[2]} por colaborador" for linha in linhas_por_colaborador[colaboradores[0]])
+    aviso_novos = f"\n\nSerão criadas pastas para {len(novos)} colaborador(es) novo(s): {', '.join(novos[:10])}" if novos else ""
+    confirmacao = messagebox.askyesno(
+        "Confirmação",
+        f"Você deseja registrar a retirada destes EPIs?\n\n"
+        f"Colaboradores: {len(colaboradores)}\n\n{resumo}{aviso_novos}",
+        parent=janela
+    )
+    if not confirmacao:
+        return False
+
+    try:
+        if coordenador is not None:
+            # O coordenador confere de novo e grava todas as retiradas juntas, ou nenhuma
+            coordenador.grupo([
+                ("retirada", {"colaborador": colaborador, "identificador": identificador, "quantidade": quantidade})
+                for colaborador in colaboradores for _, identificador, quantidade in itens
+            ])
+        else:
+            with repositorio.travar():
+                # Conferida de novo com a trava, com as quantidades atuais dos EPIs
+                retiradas, linhas_por_colaborador, erros = preparar_retiradas_epi(
+                    repositorio.ler_tabela("epis"), colaboradores, itens, data
+                )
+                if not erros:
+                    repositorio.retirar_epis(retiradas)
+                    anexar_retiradas_colaboradores(linhas_por_colaborador)
+    except ErroOperacao as e:
+        atualizar_tabela_epis()
+        messagebox.showerror("Erro", f"Nenhuma retirada foi registrada.\n\n{e}", parent=janela)
+        return False
+    except TimeoutError as e:
+        messagebox.showerror("Erro", f"Outra estação está usando as planilhas. Tente novamente.\n\n{e}", parent=janela)
+        return False
+    except Exception as e:
+        messagebox.showerror("Erro", f"Erro ao registrar as retiradas: {e}", parent=janela)
+        return False
+
+    atualizar_tabela_epis()
+    if erros:
+        mensagem = "\n".join(erros[:15])
+        messagebox.showerror(
+            "Erro", f"Nenhuma retirada foi registrada: os EPIs foram alterados por outra estação.\n\n{mensagem}", parent=janela
+        )
+        return False
+    messagebox.showinfo("Sucesso", f"Retiradas registradas para {len(colaboradores)} colaborador(es).", parent=janela)
+    return True
+
+
 def atualizar_tabela_epis():
     """
     Atualiza a tabela de EPIs com os dados mais recentes do arquivo Epis.csv.
     """
     global df_epis
     try:
-        df_epis = pd.read_csv("Planilhas/Epis.csv", encoding="utf-8")
+        df_epis = para_edicao(repositorio.ler_tabela("epis"))
         epis_table.updateModel(TableModel(df_epis))
         epis_table.redraw()
     except FileNotFoundError:
@@ -518,15 +958,14 @@ def exportar_conteudo():
 
     try:
         with pd.ExcelWriter(caminho_excel) as writer:
-            arquivos_com_epis = {**arquivos, "epis": "Planilhas/Epis.csv"}
-            for nome, arquivo in arquivos_com_epis.items():
+            for nome in [*arquivos, "epis"]:
                 try:
-                    df = pd.read_csv(arquivo, encoding="utf-8")
+                    df = repositorio.ler_tabela(nome, recentes=True)
                     df.to_excel(writer, sheet_name=nome.capitalize(), index=False)
                 except FileNotFoundError:
-                    messagebox.showwarning("Aviso", f"Arquivo {arquivo} não encontrado. Ignorando...")
+                    messagebox.showwarning("Aviso", f"Tabela {nome} não encontrada. Ignorando...")
 
-        df_estoque = pd.read_csv(arquivos["estoque"], encoding="utf-8")
+        df_estoque = repositorio.ler_tabela("estoque")
         if "QUANTIDADE" not in df_estoque.columns:
             messagebox.showerror("Erro", "Coluna 'QUANTIDADE' não encontrada no estoque.")
             return
@@ -548,6 +987,128 @@ def exportar_conteudo():
 
 
 tabela_atual = "estoque"
+fonte_paginada = None
+df_carregado = None
+
+
+def guardar_carregado():
+    """
+    Guarda uma cópia da tabela de estoque como foi carregada, para que salvar_mudancas
+    saiba quais linhas foram editadas nesta estação. O índice de pesquisa do estoque é
+    atualizado em segundo plano com os produtos novos, alterados ou excluídos.
+    """
+    global df_carregado
+    df_carregado = df.copy() if tabela_atual == "estoque" else None
+    if df_carregado is not None:
+        executar_em_segundo_plano(functools.partial(indice_estoque.sincronizar, df_carregado))
+
+
+def exibir_paginado(nome_tabela):
+    """
+    Exibe as primeiras páginas dos meses recentes de uma tabela de movimentos. As próximas
+    são carregadas conforme a tabela é rolada (veja carregar_proxima_pagina).
+    """
+    global df, fonte_paginada
+
+    fonte_paginada = repositorio.fonte_paginada(nome_tabela, recentes=True)
+    df = para_edicao(fonte_paginada.ler(0, 2 * configuracao.TAMANHO_PAGINA))
+    pandas_table.updateModel(TableModel(df))
+    pandas_table.redraw()
+
+
+def carregar_proxima_pagina():
+    """
+    Carrega a próxima página da tabela paginada quando as linhas visíveis se aproximam
+    do fim do que já foi carregado. É executada periodicamente pelo loop do Tkinter.
+    Se a leitura falhar, o erro é mostrado uma vez e a tabela para de carregar páginas
+    até ser aberta de novo.
+    """
+    global df, fonte_paginada
+
+    if fonte_paginada is not None and pandas_table.model.df is df:
+        visiveis = getattr(pandas_table, "visiblerows", None)
+        if visiveis and max(visiveis) >= len(df) - configuracao.TAMANHO_PAGINA:
+            try:
+                pagina = fonte_paginada.ler(len(df), configuracao.TAMANHO_PAGINA)
+            except Exception as e:
+                fonte_paginada, pagina = None, None
+                messagebox.showerror("Erro", f"Erro ao carregar a próxima página da tabela {tabela_atual}: {e}")
+            if pagina is not None and not pagina.empty:
+                df = pd.concat([df, para_edicao(pagina)])
+                pandas_table.model.df = df
+                pandas_table.redraw()
+
+    main.after(200, carregar_proxima_pagina)
+
+
+seq_coordenador = 0
+
+
+def acompanhar_coordenador():
+    """
+    Aplica à tabela exibida as alterações confirmadas pelo coordenador (de qualquer estação).
+    Produtos editados nesta estação e ainda não salvos ficam como estão. É executada
+    periodicamente pelo loop do Tkinter quando há um coordenador configurado.
+    """
+    global df, df_carregado, seq_coordenador
+
+    if not manutencao_concluida.is_set():
+        main.after(configuracao.COORDENADOR_ACOMPANHAMENTO, acompanhar_coordenador)
+        return
+
+    try:
+        seq_coordenador, alteracoes = coordenador.alteracoes(seq_coordenador)
+    except ErroCoordenador as e:
+        print(f"Erro ao acompanhar o coordenador: {e}")
+        alteracoes = []
+
+    if alteracoes is None:
+        # Esta estação ficou para trás: as alterações antigas já foram descartadas pelo coordenador
+        if tabela_atual == "estoque":
+            atualizar_tabela()
+        atualizar_tabela_epis()
+    elif alteracoes:
+        linhas = [alteracao["linha"] for alteracao in alteracoes
+                  if alteracao["tabela"] == "estoque" and alteracao["linha"] is not None]
+        if linhas and tabela_atual == "estoque" and df_carregado is not None:
+            novas = pd.DataFrame([linha[:len(colunas["estoque"])] for linha in linhas], columns=colunas["estoque"])
+            novas = para_edicao(aplicar_esquema(novas, esquema["estoque"]))
+            posicoes = {str(codigo): indice for indice, codigo in zip(df_carregado.index, df_carregado["CODIGO"])}
+            editadas = (df.astype(str) != df_carregado.reindex(df.index).astype(str)).any(axis=1)
+            acrescentar = []
+            for _, linha in novas.iterrows():
+                indice = posicoes.get(str(linha["CODIGO"]))
+                if indice is None:
+                    acrescentar.append(linha)
+                elif indice in df.index and not editadas.get(indice, False):
+                    df.loc[indice, linha.index] = linha.values
+                    df_carregado.loc[indice, linha.index] = linha.values
+                    cache_pesquisa.invalidar()
+                indice_estoque.atualizar(linha["CODIGO"], linha["DESCRICAO"], linha["LOCALIZACAO"])
+            exibida = pandas_table.model.df is df
+            if acrescentar:
+                inicio = max(df.index.max(), df_carregado.index.max()) + 1 if len(df) else 0
+                acrescentar = pd.DataFrame(acrescentar, index=range(inicio, inicio + len(acrescentar)))
+                df = pd.concat([df, acrescentar])
+                df_carregado = pd.concat([df_carregado, acrescentar])
+            if exibida:
+                pandas_table.model.df = df
+                pandas_table.redraw()
+        if any(alteracao["tabela"] == "epis" for alteracao in alteracoes):
+            atualizar_tabela_epis()
+
+    main.after(configuracao.COORDENADOR_ACOMPANHAMENTO, acompanhar_coordenador)
+
+
+def carregar_tabela_completa():
+    """
+    Carrega todas as linhas da tabela paginada atual (necessário, por exemplo, para pesquisar).
+    """
+    global df, fonte_paginada
+
+    if fonte_paginada is not None:
+        df = para_edicao(repositorio.ler_tabela(tabela_atual, recentes=True))
+        fonte_paginada = None
 
 
 def trocar_tabela(nome_tabela):
@@ -555,7 +1116,7 @@ def trocar_tabela(nome_tabela):
     Troca a tabela exibida na interface gráfica.
     """
     
-    global tabela_atual, df
+    global tabela_atual, df, fonte_paginada
 
     if nome_tabela not in arquivos:
         messagebox.showerror("Erro", f"Tabela {nome_tabela} não encontrada.")
@@ -564,9 +1125,14 @@ def trocar_tabela(nome_tabela):
     tabela_atual = nome_tabela
 
     try:
-        df = pd.read_csv(arquivos[nome_tabela], encoding="utf-8")
-        pandas_table.updateModel(TableModel(df))
-        pandas_table.redraw()
+        if nome_tabela in ("entrada", "saida"):
+            exibir_paginado(nome_tabela)
+        else:
+            fonte_paginada = None
+            df = para_edicao(repositorio.ler_tabela(nome_tabela))
+            guardar_carregado()
+            pandas_table.updateModel(TableModel(df))
+            pandas_table.redraw()
 
         atualizar_cores_botoes()
 
@@ -597,34 +1163,142 @@ def atualizar_cores_botoes():
 def salvar_mudancas():
     """
     Salva as alterações feitas na tabela atual no arquivo CSV correspondente.
+    No estoque, só as linhas editadas nesta estação são gravadas, e só se o produto não foi
+    alterado por outra estação depois que a tabela foi carregada (veja mesclar_estoque).
     """
-    
+    global df, fonte_paginada
+
+    if not alteracoes_liberadas():
+        return
+
+    conflitos, novos = [], []
     try:
-        df_original = pd.read_csv(arquivos[tabela_atual], encoding="utf-8")
+        with repositorio.travar():
+            df_original = para_edicao(repositorio.ler_tabela(tabela_atual, recentes=True))
 
-        df_atualizado = pandas_table.model.df.copy()
+            df_atualizado = pandas_table.model.df.copy()
 
-        for index, row in df_atualizado.iterrows():
-            if not row.equals(df_original.loc[index]):
-                df_original.loc[index] = row
+            if tabela_atual == "estoque" and df_carregado is not None:
+                df_original, conflitos, novos = mesclar_estoque(
+                    df_original, df_carregado, df_atualizado, repositorio.proximo_codigo
+                )
+            else:
+                for index, row in df_atualizado.iterrows():
+                    if not row.equals(df_original.loc[index]):
+                        df_original.loc[index] = row
 
-        if os.path.exists(arquivos[tabela_atual]):
-            shutil.copy(arquivos[tabela_atual], arquivos[tabela_atual].replace(".csv", "_backup.csv"))
+            if os.path.exists(arquivos[tabela_atual]):
+                shutil.copy(arquivos[tabela_atual], arquivos[tabela_atual].replace(".csv", "_backup.csv"))
 
-        df_original.to_csv(arquivos[tabela_atual], index=False, encoding="utf-8")
+            repositorio.salvar_tabela(tabela_atual, df_original, recentes=True)
 
-        pandas_table.updateModel(TableModel(df_original))
+        df, fonte_paginada = df_original, None
+        guardar_carregado()
+        pandas_table.updateModel(TableModel(df))
         pandas_table.redraw()
-
-        messagebox.showinfo("Sucesso", f"Alterações na tabela {tabela_atual.capitalize()} salvas com sucesso!")
+        incluidos = f"\n\n{len(novos)} produto(s) novo(s) incluído(s) com os códigos: {', '.join(map(str, novos))}" if novos else ""
+
+        if conflitos:
+            codigos = ", ".join(str(codigo) for codigo in conflitos[:20])
+            messagebox.showwarning(
+                "Aviso",
+                f"{len(conflitos)} produto(s) foram alterados por outra estação depois que a tabela foi carregada. "
+                f"As alterações feitas aqui nesses produtos não foram salvas; a tabela mostra os dados atuais.\n\n"
+                f"Códigos: {codigos}{incluidos}"
+            )
+        else:
+            messagebox.showinfo("Sucesso", f"Alterações na tabela {tabela_atual.capitalize()} salvas com sucesso!{incluidos}")
     except Exception as e:
         messagebox.showerror("Erro", f"Erro ao salvar alterações na tabela {tabela_atual}: {e}")
         
 
-def criar_backup_periodico():
+respostas_segundo_plano = queue.Queue()
+tarefas_segundo_plano = []
+manutencao_concluida = threading.Event()
+
+
+def executar_em_segundo_plano(tarefa, ao_terminar=None):
+    """
+    Executa tarefa() em uma thread. Quando ela termina, ao_terminar(resultado, erro) é chamada
+    no loop do Tkinter (veja processar_respostas), que é o único que pode mexer na interface.
+    """
+    def executar():
+        try:
+            resultado, erro = tarefa(), None
+        except Exception as e:
+            resultado, erro = None, e
+        respostas_segundo_plano.put((ao_terminar, resultado, erro))
+
+    thread = threading.Thread(target=executar, daemon=True)
+    tarefas_segundo_plano.append(thread)
+    thread.start()
+
+
+def processar_respostas():
+    """
+    Entrega à interface os resultados das tarefas em segundo plano que terminaram.
+    É executada periodicamente pelo loop do Tkinter.
+    """
+    tarefas_segundo_plano[:] = [thread for thread in tarefas_segundo_plano if thread.is_alive()]
+    while True:
+        try:
+            ao_terminar, resultado, erro = respostas_segundo_plano.get_nowait()
+        except queue.Empty:
+            break
+        if ao_terminar is not None:
+            ao_terminar(resultado, erro)
+    main.after(50, processar_respostas)
+
+
+def iniciar_manutencao():
+    """
+    Corrige as planilhas de entrada e saída e depois cria o backup, em segundo plano, para que
+    a janela principal abra sem esperar. Os botões que alteram os dados ficam desabilitados
+    até a correção terminar.
+    """
+    for botao in botoes_alteracao:
+        botao.config(state="disabled")
+    main.title("Almoxarifado - verificando planilhas...")
+    inicio = time.perf_counter()
+
+    def concluir(resultado, erro):
+        registrar_tempo("correção das planilhas em segundo plano", inicio)
+        if erro is not None:
+            messagebox.showerror("Erro", f"Erro ao corrigir as planilhas: {erro}")
+        manutencao_concluida.set()
+        for botao in botoes_alteracao:
+            botao.config(state="normal")
+        main.title("Almoxarifado")
+        criar_backup_periodico()
+
+    executar_em_segundo_plano(corrigir_planilhas, concluir)
+
+
+def alteracoes_liberadas():
+    """
+    Retorna True se os dados já podem ser alterados; enquanto a correção das planilhas do
+    início não termina, avisa o usuário e retorna False.
+    """
+    if manutencao_concluida.is_set():
+        return True
+    messagebox.showinfo("Aguarde", "As planilhas ainda estão sendo verificadas. Tente novamente em instantes.")
+    return False
+
+
+def criar_backup():
     """
-    Cria backups periódicos dos arquivos de dados e remove backups com mais de 3 dias.
+    Cria o backup dos arquivos de dados (se o último tiver mais de 3 horas) e remove backups
+    com mais de 3 dias. Também compacta o armazenamento, exportando-o para os arquivos CSV
+    quando necessário. Não usa o Tkinter: é executada em segundo plano e retorna a lista de
+    mensagens de erro para a interface mostrar.
     """
+    erros = []
+    try:
+        with repositorio.travar():
+            repositorio.compactar()
+    except Exception as e:
+        print(f"Erro ao compactar o armazenamento: {e}")
+
     pasta_backup = "Backups"
     os.makedirs(pasta_backup, exist_ok=True)
 
@@ -635,24 +1309,23 @@ def criar_backup_periodico():
         with open(arquivo_ultimo_backup, "r", encoding="utf-8") as f:
             ultimo_backup = float(f.read().strip())
         if (agora - ultimo_backup) < 3 * 60 * 60:
-            main.after(10800000, criar_backup_periodico)
-            return
+            return erros
 
     timestamp = time.strftime("%Y%m%d_%H%M%S")
     try:
-        arquivos_com_epis = {**arquivos, "epis": "Planilhas/Epis.csv"}
-        for nome, arquivo in arquivos_com_epis.items():
-            if os.path.exists(arquivo):
-                nome_backup = f"{nome}_{timestamp}.csv"
-                caminho_backup = os.path.join(pasta_backup, nome_backup)
-                shutil.copy(arquivo, caminho_backup)
+        with repositorio.travar():
+            for nome, arquivo in repositorio.arquivos_backup().items():
+                if os.path.exists(arquivo):
+                    nome_backup = f"{nome}_{timestamp}{os.path.splitext(arquivo)[1]}"
+                    caminho_backup = os.path.join(pasta_backup, nome_backup)
+                    shutil.copy(arquivo, caminho_backup)
 
         with open(arquivo_ultimo_backup, "w", encoding="utf-8") as f:
             f.write(str(agora))
 
         print(f"Backup criado com sucesso em {timestamp}")
     except Exception as e:
-        messagebox.showerror("Erro", f"Erro ao criar backup: {e}")
+        erros.append(f"Erro ao criar backup: {e}")
 
     try:
         for arquivo in os.listdir(pasta_backup):
@@ -663,64 +1336,98 @@ def criar_backup_periodico():
                     os.remove(caminho_arquivo)
                     print(f"Backup antigo removido: {arquivo}")
     except Exception as e:
-        messagebox.showerror("Erro", f"Erro ao remover backups antigos: {e}")
+        erros.append(f"Erro ao remover backups antigos: {e}")
+
+    return erros
+
 
-    main.after(10800000, criar_backup_periodico)
+def criar_backup_periodico():
+    """
+    Executa criar_backup em segundo plano e agenda a próxima execução para daqui a 3 horas.
+    """
+    def concluir(erros, erro):
+        for mensagem in erros if erro is None else [f"Erro ao criar backup: {erro}"]:
+            messagebox.showerror("Erro", mensagem)
+        main.after(10800000, criar_backup_periodico)
+
+    executar_em_segundo_plano(criar_backup, concluir)
     
     
 def corrigir_planilhas():
     """
     Corrige as planilhas de entrada e saída, preenchendo colunas vazias com '1'.
+    A DATA ISO que faltar é calculada a partir da DATA.
+    Os arquivos só são regravados quando há algo a corrigir.
     """
     planilhas = ["entrada", "saida"]
     colunas_esperadas = {
-        "entrada": ["CODIGO", "DESCRICAO", "QUANTIDADE", "VALOR UN", "VALOR TOTAL", "DATA", "ID"],
-        "saida": ["CODIGO", "DESCRICAO", "QUANTIDADE", "SOLICITANTE", "DATA", "ID"]
+        "entrada": ["CODIGO", "DESCRICAO", "QUANTIDADE", "VALOR UN", "VALOR TOTAL", "DATA", "ID", "DATA ISO"],
+        "saida": ["CODIGO", "DESCRICAO", "QUANTIDADE", "SOLICITANTE", "DATA", "ID", "DATA ISO"]
     }
 
-    for planilha in planilhas:
-        caminho = arquivos[planilha]
-        try:
-            with open(caminho, "r", encoding="utf-8") as f:
-                linhas = list(csv.reader(f))
-
-            if len(linhas) > 0 and len(linhas[0]) != len(colunas_esperadas[planilha]):
-                linhas[0] = colunas_esperadas[planilha]
-
-            linhas_corrigidas = []
-            for linha in linhas:
-                if len(linha) < len(colunas_esperadas[planilha]):
-                    linha.extend(["1"] * (len(colunas_esperadas[planilha]) - len(linha)))
-                elif len(linha) > len(colunas_esperadas[planilha]):
-                    linha = linha[:len(colunas_esperadas[planilha])]
-                linhas_corrigidas.append(linha)
-
-            with open(caminho, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerows(linhas_corrigidas)
-
-        except FileNotFoundError:
-            print(f"Arquivo {caminho} não encontrado. Ignorando...")
-        except Exception as e:
-            print(f"Erro ao corrigir {caminho}: {e}")
+    with repositorio.travar():
+        for planilha in planilhas:
+            for caminho in planilhas_movimento(planilha):
+                try:
+                    with open(caminho, "r", encoding="utf-8") as f:
+                        linhas = list(csv.reader(f))
+
+                    corrigido = False
+                    if len(linhas) > 0 and len(linhas[0]) != len(colunas_esperadas[planilha]):
+                        linhas[0] = colunas_esperadas[planilha]
+                        corrigido = True
+
+                    linhas_corrigidas = []
+                    for linha in linhas:
+                        if len(linha) < len(colunas_esperadas[planilha]):
+                            linha.extend(["1"] * (len(colunas_esperadas[planilha]) - len(linha)))
+                            linha[-1] = data_iso(linha[colunas_esperadas[planilha].index("DATA")])
+                            corrigido = True
+                        elif len(linha) > len(colunas_esperadas[planilha]):
+                            linha = linha[:len(colunas_esperadas[planilha])]
+                            corrigido = True
+                        linhas_corrigidas.append(linha)
+
+                    if not corrigido:
+                        continue
+
+                    with open(caminho, "w", newline="", encoding="utf-8") as f:
+                        writer = csv.writer(f)
+                        writer.writerows(linhas_corrigidas)
+
+                except FileNotFoundError:
+                    print(f"Arquivo {caminho} não encontrado. Ignorando...")
+                except Exception as e:
+                    print(f"Erro ao corrigir {caminho}: {e}")
 
 
 def atualizar_tabela():
     """
     Atualiza a tabela atual com os dados mais recentes do arquivo CSV correspondente.
+    Enquanto a correção das planilhas do início não termina, a tabela só é relida: o estoque
+    não é regravado.
     """
-    
     global df
     try:
-        df = pd.read_csv(arquivos[tabela_atual], encoding="utf-8")
+        if tabela_atual in ("entrada", "saida"):
+            exibir_paginado(tabela_atual)
+            return
 
-        if os.path.exists("./Planilhas/Estoque.csv"):
-            shutil.copy("./Planilhas/Estoque.csv", "./Planilhas/Estoque_backup.csv")
+        if not manutencao_concluida.is_set():
+            df = repositorio.ler_tabela(tabela_atual)
+        else:
+            with repositorio.travar():
+                df = repositorio.ler_tabela(tabela_atual)
 
-        if tabela_atual == "estoque":
-            df["VALOR TOTAL"] = df["VALOR UN"] * df["QUANTIDADE"]
-            df.to_csv(arquivos["estoque"], index=False, encoding="utf-8")         
+                if os.path.exists("./Planilhas/Estoque.csv"):
+                    shutil.copy("./Planilhas/Estoque.csv", "./Planilhas/Estoque_backup.csv")
+
+                if tabela_atual == "estoque":
+                    df["VALOR TOTAL"] = df["VALOR UN"] * df["QUANTIDADE"]
+                    repositorio.salvar_tabela("estoque", df)
 
+        df = para_edicao(df)
+        guardar_carregado()
         pandas_table.updateModel(TableModel(df))
         pandas_table.redraw()
 
@@ -742,7 +1449,11 @@ def validar_login():
     if usuario in usuarios and senha == usuarios[usuario]["senha"]:
         operador_logado_id = usuarios[usuario]["id"]
         messagebox.showinfo("Sucesso", f"Login realizado com sucesso!\nOperador ID: {operador_logado_id}")
-        root.destroy()
+        if not carregamento.is_set():
+            login_button.config(text="Carregando...", state="disabled")
+            usuario_entry.config(state="disabled")
+            senha_entry.config(state="disabled")
+        abrir_quando_carregado()
     else:
         messagebox.showerror("Erro", "Usuário ou senha inválidos!")
 
@@ -763,10 +1474,73 @@ def fechar_aplicacao():
     Encerra o programa completamente.
     """
     if messagebox.askyesno("Confirmação", "Deseja realmente sair?"):
+        # Uma correção ou backup em andamento não pode ser interrompido no meio de uma gravação
+        for thread in tarefas_segundo_plano:
+            thread.join()
+        try:
+            with repositorio.travar():
+                repositorio.compactar()
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao compactar o armazenamento: {e}")
         main.destroy()
         os._exit(0)
 
 
+def registrar_tempo(etapa, inicio):
+    """
+    Mostra no terminal quanto tempo uma etapa da inicialização levou, se configuracao.DEPURAR_INICIALIZACAO.
+    """
+    if configuracao.DEPURAR_INICIALIZACAO:
+        print(f"[inicialização] {etapa}: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+
+carregamento = threading.Event()
+dados_carregados = {}
+
+
+def carregar_em_segundo_plano():
+    """
+    Importa pandas, pandastable e os módulos de dados, cria as planilhas que faltarem e lê as
+    tabelas de estoque e EPIs. É executada em uma thread enquanto o usuário digita o login;
+    não usa o Tkinter. Um erro fica em dados_carregados["erro"].
+    """
+    try:
+        # Só importados aqui para ficarem carregados; os nomes são ligados depois do login
+        inicio = time.perf_counter()
+        importlib.import_module("pandas")
+        importlib.import_module("pandastable")
+        registrar_tempo("importação de pandas e pandastable", inicio)
+
+        inicio = time.perf_counter()
+        importlib.import_module("operacoes")
+        importlib.import_module("coordenador")
+        from armazenamento import obter_armazenamento
+        from esquema import para_edicao
+        registrar_tempo("importação dos módulos do almoxarifado", inicio)
+
+        inicio = time.perf_counter()
+        repositorio = obter_armazenamento()
+        criar_planilhas(repositorio)
+        dados_carregados["repositorio"] = repositorio
+        dados_carregados["estoque"] = para_edicao(repositorio.ler_tabela("estoque"))
+        dados_carregados["epis"] = para_edicao(repositorio.ler_tabela("epis"))
+        registrar_tempo("leitura do estoque e dos EPIs", inicio)
+    except Exception as e:
+        dados_carregados["erro"] = e
+    finally:
+        carregamento.set()
+
+
+def abrir_quando_carregado():
+    """
+    Fecha a janela de login assim que o carregamento em segundo plano termina.
+    """
+    if carregamento.is_set():
+        root.destroy()
+    else:
+        root.after(50, abrir_quando_carregado)
+
+
 def focar_proximo(event):
     """
     Move o foco para o próximo widget quando a tecla Enter é pressionada.
@@ -802,9 +1576,41 @@ senha_entry.pack(pady=5)
 login_button = tk.Button(root, text="Entrar", font=("Arial", 12), bg="#67F5A5", command=validar_login)
 login_button.pack(pady=10)
 
+root.after_idle(registrar_tempo, "janela de login exibida", inicio_programa)
+threading.Thread(target=carregar_em_segundo_plano, daemon=True).start()
 root.mainloop()
 
 
+# Os módulos já foram importados em segundo plano: estas importações só ligam os nomes
+import pandas as pd
+from pandastable import Table, TableModel
+import operacoes
+from lotes import (
+    ler_arquivo_lote, ler_texto_lote, ler_itens_epi, preparar_entradas, preparar_saidas,
+    preparar_retiradas_epi, anexar_retiradas_colaboradores
+)
+from armazenamento import arquivos, colunas, esquema, planilhas_movimento
+from esquema import FORMATO_DATA_ISO, aplicar_esquema, data_iso, para_edicao
+from versoes import ConflitoVersao, mesclar_estoque, repetir_em_conflito
+from coordenador import ClienteCoordenador, ErroCoordenador
+from operacoes import ErroOperacao, QuantidadeInsuficiente
+from pesquisa import (
+    PREFIXO_APROXIMADO, PREFIXO_REGEX, CachePesquisa, ErroConsulta, IndiceInvertido, compilar_consulta, ranquear
+)
+
+if "erro" in dados_carregados:
+    messagebox.showerror("Erro", f"Erro ao carregar as planilhas: {dados_carregados['erro']}")
+    raise dados_carregados["erro"]
+
+repositorio = dados_carregados["repositorio"]
+# Com um coordenador configurado, as alterações são enviadas a ele (veja coordenador.py)
+coordenador = ClienteCoordenador(configuracao.COORDENADOR) if configuracao.COORDENADOR else None
+# Texto de pesquisa da tabela exibida, refeito quando ela é recarregada ou alterada
+cache_pesquisa = CachePesquisa()
+# Índice de palavras e trigramas do estoque (DESCRICAO, LOCALIZACAO e CODIGO), mantido entre as cargas
+indice_estoque = IndiceInvertido()
+
+
 
 # Configuração da janela principal
 
@@ -816,10 +1622,6 @@ main.resizable(False, False)
 
 main.protocol("WM_DELETE_WINDOW", fechar_aplicacao)
 
-criar_planilhas()
-criar_backup_periodico()
-corrigir_planilhas()
-
 
 # Criando o sistema de abas
 
@@ -832,7 +1634,8 @@ notebook.pack(expand=True, fill="both")
 estoque_tab = ttk.Frame(notebook)
 notebook.add(estoque_tab, text="Estoque")
 
-df = pd.read_csv(os.path.join("Planilhas", "Estoque.csv"), encoding="utf-8")
+df = dados_carregados["estoque"]
+guardar_carregado()
 
 pandas_table_table_frame = tk.Frame(master=estoque_tab)
 pandas_table_table_frame.place(x=20, y=20, width=1057, height=483)
@@ -840,7 +1643,7 @@ pandas_table = Table(parent=pandas_table_table_frame, dataframe=df)
 pandas_table.show()
 
 pesquisar_entry = tk.Entry(master=estoque_tab)
-pesquisar_entry.bind("<KeyRelease>", pesquisar_tabela)
+pesquisar_entry.bind("<KeyRelease>", agendar_pesquisa)
 pesquisar_entry.config(bg="#fff", fg="#000", borderwidth=3)
 pesquisar_entry.place(x=20, y=517, width=295, height=43)
 
@@ -949,6 +1752,10 @@ entrada_button = tk.Button(master=movimentacao_tab, text="Registrar Entrada", co
 entrada_button.config(bg="#67F5A5", fg="#000", font=("Arial", 12))
 entrada_button.place(x=80, y=210, width=371, height=40)
 
+importar_entradas_button = tk.Button(master=movimentacao_tab, text="Importar Arquivo de Entradas", command=importar_entradas)
+importar_entradas_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
+importar_entradas_button.place(x=80, y=260, width=371, height=40)
+
 separator = ttk.Separator(movimentacao_tab, orient="vertical")
 separator.place(x=550, y=20, height=530)
 
@@ -983,6 +1790,10 @@ saida_button = tk.Button(master=movimentacao_tab, text="Registrar Saída", comma
 saida_button.config(bg="#67F5A5", fg="#000", font=("Arial", 12))
 saida_button.place(x=645, y=280, width=371, height=40)
 
+requisicao_button = tk.Button(master=movimentacao_tab, text="Requisição com Vários Itens", command=abrir_requisicao)
+requisicao_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
+requisicao_button.place(x=645, y=330, width=371, height=40)
+
 
 
 # Aba EPIs
@@ -990,7 +1801,7 @@ saida_button.place(x=645, y=280, width=371, height=40)
 epis_tab = ttk.Frame(notebook)
 notebook.add(epis_tab, text="EPIs")
 
-df_epis = pd.read_csv("Planilhas/Epis.csv", encoding="utf-8")
+df_epis = dados_carregados["epis"]
 
 epis_table_frame = tk.Frame(master=epis_tab)
 epis_table_frame.place(x=20, y=20, width=650, height=530)
@@ -1040,7 +1851,23 @@ colaborador_entry.place(x=700, y=470, width=300, height=30)
 
 registrar_retirada_button = tk.Button(master=epis_tab, text="Registrar Retirada", command=lambda: registrar_retirada())
 registrar_retirada_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
-registrar_retirada_button.place(x=700, y=510, width=300, height=40)
+registrar_retirada_button.place(x=700, y=510, width=145, height=40)
+
+retirada_lote_button = tk.Button(master=epis_tab, text="Retirada em Lote", command=abrir_retirada_lote)
+retirada_lote_button.config(bg="#54befc", fg="#000", font=("Arial", 12))
+retirada_lote_button.place(x=855, y=510, width=145, height=40)
+
 
+# Botões que alteram os dados, desabilitados enquanto as planilhas são corrigidas (veja iniciar_manutencao)
+botoes_alteracao = [
+    save_button, cadastro_button, entrada_button, importar_entradas_button, saida_button,
+    requisicao_button, registrar_epi_button, registrar_retirada_button, retirada_lote_button
+]
 
+iniciar_manutencao()
+main.after_idle(registrar_tempo, "janela principal exibida", inicio_programa)
+main.after(50, processar_respostas)
+main.after(200, carregar_proxima_pagina)
+if coordenador is not None:
+    main.after(configuracao.COORDENADOR_ACOMPANHAMENTO, acompanhar_coordenador)
 main.mainloop()
@@ -0,0 +1,422 @@
+from datetime import datetime
+import configuracao
+from esquema import FORMATO_DATA, FORMATO_DATA_ISO
+from lotes import anexar_retiradas_colaboradores
+from versoes import repetir_em_conflito, versao_produto
+
+
+class ErroOperacao(Exception):
+    """
+    Operação recusada (dados inválidos, produto não encontrado...). A mensagem é a que deve
+    ser mostrada ao usuário.
+    """
+
+
+class QuantidadeInsuficiente(ErroOperacao):
+    """
+    Não há quantidade suficiente no estoque. disponivel guarda a quantidade disponível agora.
+    """
+
+    def __init__(self, mensagem, disponivel):
+        self.disponivel = disponivel
+        super().__init__(mensagem)
+
+
+def _numero(valor, nome, positivo=True):
+    try:
+        numero = float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        raise ErroOperacao(f"{nome} deve ser um número válido.")
+    if positivo and numero <= 0:
+        raise ErroOperacao(f"{nome} deve ser maior que zero.")
+    return numero
+
+
+def _texto(dados, campo):
+    return str(dados.get(campo) or "").strip().upper()
+
+
+class Lote:
+    """
+    Comandos de um lote, validados em ordem sobre as quantidades já alteradas pelos anteriores.
+    Cadastros e registros de EPI são gravados na hora; entradas, saídas e retiradas de EPI
+    são acumuladas e gravadas em gravar(), na ordem em que chegaram.
+    Cada operação recebe os dados do comando (um dicionário) e as datas do lote.
+    """
+
+    operacoes = ("cadastrar", "entrada", "saida", "epi", "retirada")
+    # Operações que só são gravadas em gravar(): um lote só com elas pode ser descartado
+    acumuladas = ("entrada", "saida", "retirada")
+
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+        self.quantidades = {}
+        # (tabela, linha, codigo, nova_quantidade) de cada entrada e saída, na ordem dos comandos
+        self.movimentos = []
+        self.retiradas = []
+        self.retiradas_colaboradores = {}
+        self.epis = None
+        self.produtos_alterados = []
+        self.epis_alterados = []
+        self.movimentos_gravados = 0
+        self.retiradas_gravadas = False
+
+    def _produto(self, codigo):
+        produto = self.repositorio.buscar_produto(codigo) if codigo else None
+        if not produto:
+            raise ErroOperacao(f"Código do produto '{codigo}' não encontrado.")
+        try:
+            float(produto[2])
+            atual = self.quantidades.get(codigo, float(produto[4]))
+        except ValueError:
+            raise ErroOperacao(f"Valores numéricos inválidos no estoque para o código {codigo}.")
+        return produto, atual
+
+    def _tabela_epis(self):
+        if self.epis is None:
+            self.epis = self.repositorio.ler_tabela("epis", dtype={"CA": str})
+            self.epis["CA"] = self.epis["CA"].fillna("").astype(str).str.strip().str.upper()
+            self.epis["DESCRICAO"] = self.epis["DESCRICAO"].fillna("").astype(str).str.strip().str.upper()
+            self.epis["QUANTIDADE"] = self.epis["QUANTIDADE"].astype(float)
+        return self.epis
+
+    def _epi(self, identificador):
+        epis = self._tabela_epis()
+        encontrados = epis.index[(epis["CA"] == identificador) | (epis["DESCRICAO"] == identificador)]
+        return encontrados[0] if len(encontrados) else None
+
+    def cadastrar(self, dados, data, data_iso):
+        descricao = _texto(dados, "descricao")
+        if not descricao:
+            raise ErroOperacao("Descrição não pode ser vazia.")
+        quantidade = _numero(dados.get("quantidade"), "A quantidade", positivo=False)
+        valor_un = _numero(dados.get("valor_un"), "O valor unitário", positivo=False)
+        codigo = self.repositorio.proximo_codigo()
+        linha = [int(codigo), descricao, valor_un, quantidade * valor_un, quantidade, data,
+                 _texto(dados, "localizacao"), 0]
+        self.repositorio.inserir_produto(linha)
+        self.produtos_alterados.append(str(codigo))
+        return {"codigo": str(codigo), "descricao": descricao}
+
+    def entrada(self, dados, data, data_iso):
+        codigo = str(dados.get("codigo", "")).strip()
+        quantidade = _numero(dados.get("quantidade"), "A quantidade")
+        produto, atual = self._produto(codigo)
+        if dados.get("valor_un") in (None, ""):
+            valor_un = float(produto[2])
+        else:
+            valor_un = _numero(dados["valor_un"], "O valor unitário", positivo=False)
+        self.quantidades[codigo] = atual + quantidade
+        linha = [codigo, produto[1], quantidade, valor_un, valor_un * quantidade, data,
+                 dados.get("operador_id", ""), data_iso]
+        self.movimentos.append(("entrada", linha, codigo, self.quantidades[codigo]))
+        self.produtos_alterados.append(codigo)
+        return {"codigo": codigo, "descricao": produto[1], "quantidade": self.quantidades[codigo]}
+
+    def saida(self, dados, data, data_iso):
+        codigo = str(dados.get("codigo", "")).strip()
+        quantidade = _numero(dados.get("quantidade"), "A quantidade")
+        solicitante = _texto(dados, "solicitante")
+        if not solicitante:
+            raise ErroOperacao("O nome do solicitante não pode ser vazio.")
+        produto, atual = self._produto(codigo)
+        if quantidade > atual:
+            raise QuantidadeInsuficiente(f"Quantidade insuficiente no estoque! Disponível: {atual}", atual)
+        self.quantidades[codigo] = atual - quantidade
+        linha = [codigo, produto[1], quantidade, solicitante, data, dados.get("operador_id", ""), data_iso]
+        self.movimentos.append(("saida", linha, codigo, self.quantidades[codigo]))
+        self.produtos_alterados.append(codigo)
+        return {"codigo": codigo, "descricao": produto[1], "quantidade": self.quantidades[codigo]}
+
+    def epi(self, dados, data, data_iso):
+        """
+        Registra um EPI novo ou, se já existir um com o mesmo CA ou descrição, soma a quantidade.
+        """
+        ca, descricao = _texto(dados, "ca"), _texto(dados, "descricao")
+        if not (ca or descricao):
+            raise ErroOperacao("Você deve preencher pelo menos o CA ou a Descrição.")
+        quantidade = _numero(dados.get("quantidade"), "A quantidade")
+        epis = self._tabela_epis()
+        identificador = next((valor for valor in (ca, descricao) if valor and self._epi(valor) is not None), None)
+
+        if identificador is None:
+            self.repositorio.adicionar_epi([ca, descricao, quantidade])
+            epis.loc[len(epis)] = [ca, descricao, quantidade]
+            self.epis_alterados.append(ca or descricao)
+            return {"identificador": ca or descricao, "quantidade": quantidade, "novo": True}
+
+        posicao = self._epi(identificador)
+        reservado = sum(q for i, q in self.retiradas if self._epi(i) == posicao)
+        nova_quantidade = self.repositorio.repor_epi(identificador, quantidade) - reservado
+        epis.at[posicao, "QUANTIDADE"] = nova_quantidade
+        self.epis_alterados.append(identificador)
+        return {"identificador": identificador, "quantidade": nova_quantidade, "novo": False}
+
+    def retirada(self, dados, data, data_iso):
+        colaborador, identificador = _texto(dados, "colaborador"), _texto(dados, "identificador")
+        if not colaborador or not identificador:
+            raise ErroOperacao("Colaborador e CA/Descrição devem ser preenchidos.")
+        quantidade = _numero(dados.get("quantidade"), "A quantidade")
+        posicao = self._epi(identificador)
+        if posicao is None:
+            raise ErroOperacao(f"O EPI com CA ou Descrição '{identificador}' não foi encontrado.")
+        epis = self._tabela_epis()
+        disponivel = float(epis.at[posicao, "QUANTIDADE"])
+        if quantidade > disponivel:
+            raise ErroOperacao(f"Quantidade insuficiente no estoque para o EPI '{epis.at[posicao, 'DESCRICAO']}'.")
+
+        epis.at[posicao, "QUANTIDADE"] = disponivel - quantidade
+        self.retiradas.append((identificador, quantidade))
+        self.retiradas_colaboradores.setdefault(colaborador, []).append(
+            [epis.at[posicao, "CA"], epis.at[posicao, "DESCRICAO"], quantidade, data_iso]
+        )
+        self.epis_alterados.append(identificador)
+        return {"identificador": identificador, "descricao": epis.at[posicao, "DESCRICAO"],
+                "quantidade": disponivel - quantidade}
+
+    def gravar(self):
+        """
+        Grava as entradas, as saídas e as retiradas de EPI acumuladas. As entradas e saídas são
+        gravadas na ordem dos comandos, com um movimentar_lote para cada sequência da mesma
+        planilha: cada movimento guarda a quantidade acumulada até ele, então o estoque termina
+        com a quantidade do último. movimentos_gravados e retiradas_gravadas dizem o que foi
+        mantido se uma gravação falhar.
+        """
+        inicio = 0
+        while inicio < len(self.movimentos):
+            tabela = self.movimentos[inicio][0]
+            fim = inicio
+            while fim < len(self.movimentos) and self.movimentos[fim][0] == tabela:
+                fim += 1
+            self.repositorio.movimentar_lote(tabela, [movimento[1:] for movimento in self.movimentos[inicio:fim]])
+            self.movimentos_gravados = inicio = fim
+        if self.retiradas:
+            self.repositorio.retirar_epis(self.retiradas)
+            anexar_retiradas_colaboradores(self.retiradas_colaboradores)
+        self.retiradas_gravadas = True
+
+    def gravada(self, operacao, movimento):
+        """
+        Diz se uma operação acumulada já foi gravada. movimento é a posição em movimentos da
+        entrada ou saída (o tamanho de movimentos antes dela).
+        """
+        if operacao == "retirada":
+            return self.retiradas_gravadas
+        return movimento < self.movimentos_gravados
+
+    def alteracoes(self):
+        """
+        Retorna as alterações do lote: (tabela, chave, linha atual) de cada produto e EPI alterado.
+        """
+        for codigo in dict.fromkeys(self.produtos_alterados):
+            yield "estoque", codigo, self.repositorio.buscar_produto(codigo)
+        if self.epis_alterados:
+            epis = self._tabela_epis()
+            for identificador in dict.fromkeys(self.epis_alterados):
+                posicao = self._epi(identificador)
+                if posicao is not None:
+                    yield "epis", identificador, [str(valor) for valor in epis.loc[posicao, ["CA", "DESCRICAO", "QUANTIDADE"]]]
+
+
+def _datas():
+    agora = datetime.now()
+    return agora.strftime(FORMATO_DATA), agora.strftime(FORMATO_DATA_ISO)
+
+
+def _produto(repositorio, codigo):
+    produto = repositorio.buscar_produto(codigo) if codigo else None
+    if not produto:
+        raise ErroOperacao(f"Código do produto '{codigo}' não encontrado.")
+    try:
+        return produto, float(produto[2]), float(produto[4])
+    except ValueError:
+        raise ErroOperacao(f"Valores numéricos inválidos no estoque para o código {codigo}.")
+
+
+def _epis(repositorio):
+    epis = repositorio.ler_tabela("epis", dtype={"CA": str})
+    for coluna in ("CA", "DESCRICAO"):
+        epis[coluna] = epis[coluna].fillna("").astype(str).str.strip().str.upper()
+    return epis
+
+
+def cadastrar_produto(repositorio, descricao, quantidade, valor_un, localizacao="", codigo=None):
+    """
+    Cadastra um produto no estoque e retorna o código dele. Sem codigo, reserva o próximo.
+    """
+    descricao = str(descricao or "").strip().upper()
+    if not descricao:
+        raise ErroOperacao("Descrição não pode ser vazia.")
+    quantidade = _numero(quantidade, "A quantidade", positivo=False)
+    valor_un = _numero(valor_un, "O valor unitário", positivo=False)
+    data, _ = _datas()
+
+    with repositorio.travar():
+        if codigo is None:
+            codigo = repositorio.proximo_codigo()
+        repositorio.inserir_produto([int(codigo), descricao, valor_un, quantidade * valor_un, quantidade, data,
+                                     str(localizacao or "").strip().upper(), 0])
+    return str(codigo)
+
+
+def registrar_entrada(repositorio, codigo, quantidade, operador_id="", tentativas=None):
+    """
+    Registra a entrada de um produto e retorna (produto, nova quantidade). O produto é lido sem
+    a trava e gravado com compare-and-swap da versão (veja versoes.py), repetindo até tentativas vezes.
+    """
+    codigo = str(codigo or "").strip()
+    quantidade = _numero(quantidade, "A quantidade")
+    data, data_iso = _datas()
+
+    def gravar():
+        # Relido a cada tentativa: se outra estação movimentar o produto antes da gravação,
+        # a versão muda e a entrada é somada de novo à quantidade atual
+        produto, valor_un, atual = _produto(repositorio, codigo)
+        nova_quantidade = atual + quantidade
+        repositorio.movimentar(
+            "entrada",
+            [codigo, produto[1], quantidade, valor_un, valor_un * quantidade, data, operador_id, data_iso],
+            codigo, nova_quantidade, versao=versao_produto(produto)
+        )
+        return produto, nova_quantidade
+
+    return repetir_em_conflito(gravar, tentativas or configuracao.TENTATIVAS_CONFLITO)
+
+
+def registrar_saida(repositorio, codigo, quantidade, solicitante, operador_id="", tentativas=None):
+    """
+    Registra a saída de um produto e retorna (produto, nova quantidade). Lança
+    QuantidadeInsuficiente se o estoque não tiver a quantidade pedida.
+    """
+    codigo = str(codigo or "").strip()
+    quantidade = _numero(quantidade, "A quantidade")
+    solicitante = str(solicitante or "").strip().upper()
+    if not solicitante:
+        raise ErroOperacao("O nome do solicitante não pode ser vazio.")
+    data, data_iso = _datas()
+
+    def gravar():
+        # A quantidade é conferida de novo a cada tentativa: outra estação pode ter retirado o produto
+        produto, _, disponivel = _produto(repositorio, codigo)
+        if quantidade > disponivel:
+            raise QuantidadeInsuficiente(f"Quantidade insuficiente no estoque! Disponível: {disponivel}", disponivel)
+        nova_quantidade = disponivel - quantidade
+        repositorio.movimentar(
+            "saida", [codigo, produto[1], quantidade, solicitante, data, operador_id, data_iso],
+            codigo, nova_quantidade, versao=versao_produto(produto)
+        )
+        return produto, nova_quantidade
+
+    return repetir_em_conflito(gravar, tentativas or configuracao.TENTATIVAS_CONFLITO)
+
+
+def registrar_epi(repositorio, ca, descricao, quantidade):
+    """
+    Registra um EPI novo. Retorna False, sem gravar nada, se já existir um EPI com o mesmo
+    CA ou descrição (use repor_epi para somar a quantidade a ele).
+    """
+    ca, descricao = str(ca or "").strip().upper(), str(descricao or "").strip().upper()
+    if not (ca or descricao):
+        raise ErroOperacao("Você deve preencher pelo menos o CA ou a Descrição.")
+    quantidade = _numero(quantidade, "A quantidade")
+
+    with repositorio.travar():
+        epis = _epis(repositorio)
+        if (ca and (epis["CA"] == ca).any()) or (descricao and (epis["DESCRICAO"] == descricao).any()):
+            return False
+        repositorio.adicionar_epi([ca, descricao, quantidade])
+    return True
+
+
+def repor_epi(repositorio, identificador, quantidade):
+    """
+    Soma a quantidade ao EPI com o CA ou descrição informado e retorna a nova quantidade.
+    """
+    quantidade = _numero(quantidade, "A quantidade")
+    with repositorio.travar():
+        return repositorio.repor_epi(str(identificador).strip().upper(), quantidade)
+
+
+def retirar_epi(repositorio, colaborador, identificador, quantidade):
+    """
+    Registra a retirada de um EPI por um colaborador (no estoque de EPIs e na planilha do
+    colaborador) e retorna (descrição, quantidade restante). Lança QuantidadeInsuficiente
+    se não houver a quantidade pedida.
+    """
+    colaborador, identificador = str(colaborador or "").strip().upper(), str(identificador or "").strip().upper()
+    if not colaborador or not identificador:
+        raise ErroOperacao("Colaborador e CA/Descrição devem ser preenchidos.")
+    quantidade = _numero(quantidade, "A quantidade")
+
+    with repositorio.travar():
+        # A quantidade é conferida com a trava: outra estação pode ter retirado o EPI
+        epis = _epis(repositorio)
+        epi = epis[(epis["CA"] == identificador) | (epis["DESCRICAO"] == identificador)]
+        if epi.empty:
+            raise ErroOperacao(f"O EPI com CA ou Descrição '{identificador}' não foi encontrado.")
+        ca, descricao, disponivel = epi.iloc[0]["CA"], epi.iloc[0]["DESCRICAO"], float(epi.iloc[0]["QUANTIDADE"])
+        if quantidade > disponivel:
+            raise QuantidadeInsuficiente(
+                f"Quantidade insuficiente no estoque para o EPI '{descricao}'. Disponível agora: {disponivel}", disponivel
+            )
+        repositorio.retirar_epi(identificador, quantidade)
+        anexar_retiradas_colaboradores({colaborador: [[ca, descricao, quantidade, _datas()[1]]]})
+    return descricao, disponivel - quantidade
+
+
+def executar_comandos(repositorio, comandos):
+    """
+    Executa uma lista de comandos (operacao, dados), com as operações e os dados de Lote, em um
+    único lote: uma só tomada da trava e uma gravação das entradas, das saídas e das retiradas
+    de EPI no final (veja Lote.gravar). Um comando com erro não impede os outros.
+    Retorna uma lista de (resultado, erro) na ordem dos comandos. Se a gravação final falhar,
+    as entradas, saídas e retiradas não gravadas voltam com o erro dela; os cadastros e
+    registros de EPI, gravados na hora, são mantidos.
+    """
+    data, data_iso = _datas()
+    respostas = []
+    with repositorio.travar():
+        lote = Lote(repositorio)
+        movimentos = []
+        for operacao, dados in comandos:
+            movimentos.append(len(lote.movimentos))
+            if operacao not in Lote.operacoes:
+                respostas.append((None, f"Operação desconhecida: {operacao}"))
+                continue
+            try:
+                respostas.append((getattr(lote, operacao)(dados, data, data_iso), None))
+            except ErroOperacao as e:
+                respostas.append((None, str(e)))
+        try:
+            lote.gravar()
+        except (ErroOperacao, ValueError, KeyError, OSError) as e:
+            respostas = [
+                (None, f"Não gravado: {e}")
+                if erro is None and operacao in Lote.acumuladas and not lote.gravada(operacao, movimento)
+                else (resultado, erro)
+                for (operacao, _), movimento, (resultado, erro) in zip(comandos, movimentos, respostas)
+            ]
+    return respostas
+
+
+def executar_juntos(repositorio, comandos, data, data_iso):
+    """
+    Executa comandos de entrada, saída e retirada de EPI (operacao, dados) juntos: ou todos
+    são gravados, ou nenhum. Deve ser chamada com a trava. Retorna (lote, resultados) depois
+    de gravar; se algum comando for recusado, nada é gravado e é lançado ErroOperacao com
+    os erros de todos eles.
+    """
+    lote = Lote(repositorio)
+    resultados, erros = [], []
+    for numero, (operacao, dados) in enumerate(comandos, start=1):
+        if operacao not in Lote.acumuladas:
+            erros.append(f"Item {numero}: a operação {operacao} não pode ser feita em grupo.")
+            continue
+        try:
+            resultados.append(getattr(lote, operacao)(dados, data, data_iso))
+        except ErroOperacao as e:
+            erros.append(f"Item {numero}: {e}")
+    if erros:
+        raise ErroOperacao("\n".join(erros))
+    lote.gravar()
+    return lote, resultados
@@ -0,0 +1,156 @@
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+from esquema import aplicar_esquema, tipos_leitura
+
+
+class FonteCSVPaginada:
+    """
+    Lê páginas de linhas de um arquivo CSV sem carregar o arquivo inteiro.
+    Mantém um índice com a posição (em bytes) do início de cada linha, que é estendido
+    só até onde as páginas pedidas precisam, então abrir um arquivo grande é imediato.
+    """
+
+    tamanho_bloco = 1 << 20
+
+    def __init__(self, caminho, colunas, tipos=None):
+        self.caminho = caminho
+        self.colunas = colunas
+        self.tipos = tipos
+        self.trava = threading.Lock()
+        self._reiniciar(None)
+
+    def invalidar(self):
+        """
+        Descarta o índice de linhas; usado quando o arquivo é regravado pelo sistema.
+        """
+        with self.trava:
+            self._reiniciar(None)
+
+    def _reiniciar(self, assinatura):
+        self.assinatura = assinatura
+        self.quebras = []
+        self.varrido = 0
+
+    def _verificar(self):
+        st = os.stat(self.caminho)
+        assinatura = (st.st_size, st.st_mtime_ns)
+        if self.assinatura is not None and assinatura != self.assinatura:
+            if st.st_size <= self.assinatura[0]:
+                self._reiniciar(assinatura)
+        self.assinatura = assinatura
+        return st.st_size
+
+    def _indexar_ate(self, linhas, tamanho):
+        with open(self.caminho, "rb") as f:
+            while len(self.quebras) <= linhas and self.varrido < tamanho:
+                f.seek(self.varrido)
+                bloco = f.read(min(self.tamanho_bloco, tamanho - self.varrido))
+                posicoes = np.flatnonzero(np.frombuffer(bloco, dtype=np.uint8) == 10) + 1
+                if len(posicoes) == 0:
+                    if len(bloco) < self.tamanho_bloco:
+                        break
+                    self.varrido += len(bloco)
+                    continue
+                self.quebras.extend((posicoes + self.varrido).tolist())
+                self.varrido += int(posicoes[-1])
+
+    def ler(self, inicio, quantidade):
+        """
+        Retorna um DataFrame com as linhas de dados [inicio, inicio + quantidade), com o índice
+        igual à posição de cada linha no arquivo.
+        """
+        with self.trava:
+            tamanho = self._verificar()
+            self._indexar_ate(inicio + quantidade, tamanho)
+            disponiveis = max(len(self.quebras) - 1, 0)
+            fim = min(inicio + quantidade, disponiveis)
+            if inicio >= fim:
+                return pd.DataFrame(columns=self.colunas)
+
+            with open(self.caminho, "rb") as f:
+                f.seek(self.quebras[inicio])
+                dados = f.read(self.quebras[fim] - self.quebras[inicio])
+
+        if self.tipos is None:
+            df = pd.read_csv(io.BytesIO(dados), header=None, names=self.colunas, encoding="utf-8")
+        else:
+            df = pd.read_csv(
+                io.BytesIO(dados), header=None, names=self.colunas, encoding="utf-8", dtype=tipos_leitura(self.tipos)
+            )
+            df = aplicar_esquema(df, self.tipos)
+        df.index = pd.RangeIndex(inicio, inicio + len(df))
+        return df
+
+    def total(self):
+        """
+        Retorna o número de linhas de dados do arquivo (indexando o arquivo até o fim).
+        """
+        with self.trava:
+            try:
+                tamanho = self._verificar()
+            except FileNotFoundError:
+                return 0
+            self._indexar_ate(tamanho, tamanho)
+            return max(len(self.quebras) - 1, 0)
+
+
+class FontePartes:
+    """
+    Lê páginas de uma sequência de fontes (por exemplo, as partições mensais de uma planilha)
+    como se fossem uma só.
+    """
+
+    def __init__(self, fontes, colunas):
+        self.fontes = fontes
+        self.colunas = colunas
+
+    def ler(self, inicio, quantidade):
+        """
+        Retorna um DataFrame com as linhas [inicio, inicio + quantidade) da sequência,
+        com o índice igual à posição de cada linha na sequência.
+        """
+        partes = []
+        posicao, fim, deslocamento = inicio, inicio + quantidade, 0
+        for fonte in self.fontes:
+            if posicao >= fim:
+                break
+            total = fonte.total()
+            if posicao < deslocamento + total:
+                parte = fonte.ler(posicao - deslocamento, fim - posicao)
+                parte.index = pd.RangeIndex(posicao, posicao + len(parte))
+                partes.append(parte)
+                posicao += len(parte)
+            deslocamento += total
+        if not partes:
+            return pd.DataFrame(columns=self.colunas)
+        return pd.concat(partes)
+
+
+class FonteSQLitePaginada:
+    """
+    Lê páginas de linhas de uma tabela do banco SQLite, na ordem de inserção.
+    """
+
+    def __init__(self, armazenamento, tabela, colunas, tipos=None):
+        self.armazenamento = armazenamento
+        self.tabela = tabela
+        self.colunas = colunas
+        self.tipos = tipos
+
+    def ler(self, inicio, quantidade):
+        """
+        Retorna um DataFrame com as linhas [inicio, inicio + quantidade).
+        """
+        selecao = ", ".join(f'"{c}"' for c in self.colunas)
+        with self.armazenamento.trava:
+            df = pd.read_sql_query(
+                f"SELECT {selecao} FROM {self.tabela} ORDER BY rowid LIMIT ? OFFSET ?",
+                self.armazenamento.conectar(), params=(quantidade, inicio)
+            )
+        if self.tipos is not None:
+            df = aplicar_esquema(df, self.tipos)
+        df.index = pd.RangeIndex(inicio, inicio + len(df))
+        return df
@@ -0,0 +1,347 @@
+import os
+import csv
+import json
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from colunar import HistoricoColunar
+from paginacao import FonteCSVPaginada, FontePartes
+from esquema import FORMATO_DATA_ISO, aplicar_esquema, converter_datas, preparar_gravacao, tipos_leitura
+
+
+SEM_DATA = "sem-data"
+
+
+def datas_movimento(serie):
+    """
+    Converte a coluna DATA das planilhas de movimentos em datas (NaT quando inválida).
+    """
+    return converter_datas(serie)
+
+
+def meses_movimento(serie):
+    """
+    Retorna o mês ("AAAA-MM") de cada valor da coluna DATA, ou "sem-data" quando inválido.
+    """
+    return datas_movimento(serie).dt.strftime("%Y-%m").fillna(SEM_DATA)
+
+
+def inicio_recente(meses):
+    """
+    Retorna o primeiro dia do período recente: o mês atual e os (meses - 1) anteriores.
+    """
+    return (pd.Timestamp.now().to_period("M") - (meses - 1)).to_timestamp()
+
+
+def filtrar_periodo(df, inicio=None, fim=None):
+    """
+    Mantém só as linhas com data dentro do período. O fim é inclusivo; uma data sem hora
+    inclui o dia inteiro. Usa a coluna DATA ISO quando existir: se as datas estiverem em
+    ordem (o normal, já que as linhas são acrescentadas em ordem), o período é encontrado
+    por busca binária; senão, ou sem DATA ISO, cada linha é comparada.
+    """
+    if inicio is None and fim is None:
+        return df
+    if "DATA ISO" in df.columns:
+        datas = converter_datas(df["DATA ISO"], FORMATO_DATA_ISO)
+    else:
+        datas = datas_movimento(df["DATA"])
+
+    depois_do_fim = False
+    if fim is not None:
+        fim = pd.Timestamp(fim)
+        if fim == fim.normalize():
+            fim, depois_do_fim = fim + pd.Timedelta(days=1), True
+
+    if "DATA ISO" in df.columns and datas.notna().all() and datas.is_monotonic_increasing:
+        valores = datas.to_numpy()
+        primeira = 0 if inicio is None else np.searchsorted(valores, np.datetime64(pd.Timestamp(inicio)), "left")
+        ultima = len(valores) if fim is None else np.searchsorted(
+            valores, np.datetime64(fim), "left" if depois_do_fim else "right"
+        )
+        return df.iloc[primeira:ultima]
+
+    filtro = datas.notna()
+    if inicio is not None:
+        filtro &= datas >= pd.Timestamp(inicio)
+    if fim is not None:
+        filtro &= datas < fim if depois_do_fim else datas <= fim
+    return df[filtro.to_numpy()]
+
+
+def acrescentar_data_iso(caminho, colunas):
+    """
+    Acrescenta a coluna DATA ISO a uma planilha de movimentos gravada antes dela, calculada
+    da coluna DATA de todas as linhas de uma vez (vazia quando a DATA é inválida).
+    Retorna True se o arquivo foi regravado.
+    """
+    try:
+        with open(caminho, "r", newline="", encoding="utf-8") as f:
+            cabecalho = next(csv.reader(f), None)
+    except FileNotFoundError:
+        return False
+    if cabecalho is None or "DATA ISO" in cabecalho or "DATA" not in cabecalho:
+        return False
+
+    df = pd.read_csv(caminho, encoding="utf-8", dtype=str, keep_default_na=False)
+    df["DATA ISO"] = datas_movimento(df["DATA"]).dt.strftime(FORMATO_DATA_ISO).fillna("")
+    temporario = caminho + ".tmp"
+    df.reindex(columns=colunas, fill_value="").to_csv(temporario, index=False, encoding="utf-8")
+    os.replace(temporario, caminho)
+    return True
+
+
+def ultima_linha_csv(caminho, colunas):
+    """
+    Retorna a última linha de um arquivo CSV lendo só o final dele, ou None se não houver linhas de dados.
+    """
+    try:
+        with open(caminho, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            tamanho = f.tell()
+            f.seek(max(0, tamanho - 65536))
+            final = f.read().decode("utf-8", errors="replace")
+    except FileNotFoundError:
+        return None
+    linhas = [linha for linha in final.splitlines() if linha.strip()]
+    if not linhas:
+        return None
+    linha = next(csv.reader([linhas[-1]]))
+    return None if linha == colunas else linha
+
+
+class PlanilhaParticionada:
+    """
+    Planilha de movimentos (entrada ou saída) dividida em um arquivo CSV por mês da coluna DATA,
+    por exemplo Planilhas/Saida/2026-10.csv. O manifesto.json lista as partições, o número de
+    linhas de cada uma e a que recebeu a última linha; as leituras por período só abrem as
+    partições que o cobrem. Linhas sem DATA válida ficam na partição "sem-data".
+    Com tipos (o esquema da tabela), as leituras já vêm com as colunas convertidas.
+    """
+
+    def __init__(self, pasta, colunas, pasta_colunar=None, tipos=None):
+        self.pasta = pasta
+        self.colunas = colunas
+        self.coluna_data = colunas.index("DATA")
+        self.caminho_manifesto = os.path.join(pasta, "manifesto.json")
+        self.pasta_colunar = pasta_colunar
+        self.tipos = tipos
+        self.trava = threading.RLock()
+        self.manifesto = None
+        self.historicos = {}
+        self.fontes = {}
+
+    def caminho(self, particao):
+        return os.path.join(self.pasta, particao + ".csv")
+
+    def _gravar_manifesto(self):
+        temporario = self.caminho_manifesto + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.manifesto, f)
+        os.replace(temporario, self.caminho_manifesto)
+
+    def _montar_manifesto(self):
+        particoes = {}
+        try:
+            nomes = os.listdir(self.pasta)
+        except FileNotFoundError:
+            nomes = []
+        for nome in nomes:
+            if nome.endswith(".csv"):
+                with open(os.path.join(self.pasta, nome), "r", newline="", encoding="utf-8") as f:
+                    linhas = sum(1 for linha in csv.reader(f) if linha)
+                particoes[nome[:-len(".csv")]] = {"linhas": max(linhas - 1, 0)}
+        datadas = sorted(particao for particao in particoes if particao != SEM_DATA)
+        self.manifesto = {"particoes": particoes, "ultima": datadas[-1] if datadas else None}
+        self._gravar_manifesto()
+
+    def _carregar(self):
+        if self.manifesto is not None:
+            return
+        try:
+            with open(self.caminho_manifesto, "r", encoding="utf-8") as f:
+                self.manifesto = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            os.makedirs(self.pasta, exist_ok=True)
+            self._montar_manifesto()
+
+    def _agrupar(self, linhas):
+        meses = meses_movimento(pd.Series([linha[self.coluna_data] for linha in linhas], dtype=object))
+        grupos = {}
+        for mes, linha in zip(meses, linhas):
+            grupos.setdefault(mes, []).append(linha)
+        return grupos
+
+    def migrar(self, caminho_unico):
+        """
+        Cria as partições na primeira execução. Se existir a planilha única antiga, suas linhas
+        são distribuídas pelos meses e ela é renomeada para <nome>.csv.migrado.
+        Retorna True se a planilha única foi migrada.
+        """
+        with self.trava:
+            if os.path.exists(self.caminho_manifesto):
+                return False
+            os.makedirs(self.pasta, exist_ok=True)
+            if not os.path.exists(caminho_unico):
+                self._montar_manifesto()
+                return False
+
+            with open(caminho_unico, "r", newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                # Linhas com colunas faltando são completadas com "1", como em corrigir_planilhas
+                linhas = [
+                    (linha + ["1"] * len(self.colunas))[:len(self.colunas)]
+                    for linha in reader if linha
+                ]
+
+            for mes, grupo in self._agrupar(linhas).items():
+                with open(self.caminho(mes), "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(self.colunas)
+                    writer.writerows(grupo)
+
+            if self.pasta_colunar:
+                shutil.rmtree(self.pasta_colunar, ignore_errors=True)
+            self._montar_manifesto()
+            os.replace(caminho_unico, caminho_unico + ".migrado")
+            return True
+
+    def recarregar(self):
+        """
+        Descarta o manifesto e as cópias em memória; usado quando outra estação pode ter alterado as partições.
+        """
+        with self.trava:
+            self.manifesto = None
+            for particao in list(self.fontes):
+                self._descartar_copias(particao)
+
+    def particoes(self, inicio=None, fim=None):
+        """
+        Retorna as partições em ordem. Com um período, só os meses que o cobrem (sem a partição "sem-data").
+        """
+        with self.trava:
+            self._carregar()
+            nomes = sorted(self.manifesto["particoes"])
+        if inicio is None and fim is None:
+            return nomes
+        primeiro = pd.Timestamp(inicio).strftime("%Y-%m") if inicio is not None else ""
+        ultimo = pd.Timestamp(fim).strftime("%Y-%m") if fim is not None else "9999-99"
+        return [nome for nome in nomes if nome != SEM_DATA and primeiro <= nome <= ultimo]
+
+    def arquivos(self):
+        """
+        Retorna os arquivos das partições, por nome da partição.
+        """
+        return {particao: self.caminho(particao) for particao in self.particoes()}
+
+    def registrar(self, linhas):
+        """
+        Acrescenta linhas às partições dos meses das suas DATAs, com uma gravação por partição.
+        """
+        grupos = self._agrupar(linhas)
+        with self.trava:
+            self._carregar()
+            for particao, grupo in grupos.items():
+                caminho = self.caminho(particao)
+                novo = not os.path.exists(caminho)
+                with open(caminho, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    if novo:
+                        writer.writerow(self.colunas)
+                    writer.writerows(grupo)
+
+                self.manifesto["particoes"].setdefault(particao, {"linhas": 0})["linhas"] += len(grupo)
+                if particao != SEM_DATA:
+                    self.manifesto["ultima"] = particao
+            self._gravar_manifesto()
+
+    def ultimo(self):
+        """
+        Retorna a última linha registrada, ou None.
+        """
+        with self.trava:
+            self._carregar()
+            particao = self.manifesto.get("ultima")
+        if particao is None:
+            return None
+        return ultima_linha_csv(self.caminho(particao), self.colunas)
+
+    def _historico(self, particao):
+        if particao not in self.historicos:
+            self.historicos[particao] = HistoricoColunar(
+                os.path.join(self.pasta_colunar, particao), self.caminho(particao), self.colunas
+            )
+        return self.historicos[particao]
+
+    def ler(self, particoes, campos=None):
+        """
+        Lê as partições informadas em um único DataFrame, na ordem em que foram passadas.
+        """
+        partes = []
+        for particao in particoes:
+            caminho = self.caminho(particao)
+            if not os.path.exists(caminho):
+                continue
+            if self.pasta_colunar:
+                partes.append(self._historico(particao).ler(campos, texto=self.tipos is not None))
+            else:
+                dtype = tipos_leitura(self.tipos) if self.tipos is not None else None
+                partes.append(pd.read_csv(caminho, encoding="utf-8", usecols=campos, dtype=dtype))
+        if not partes:
+            df = pd.DataFrame(columns=list(campos or self.colunas))
+        else:
+            df = pd.concat(partes, ignore_index=True)
+        if self.tipos is not None:
+            df = aplicar_esquema(df, self.tipos)
+        return df
+
+    def fonte(self, particoes):
+        """
+        Retorna uma fonte paginada que percorre as partições informadas como uma só planilha.
+        """
+        fontes = []
+        for particao in particoes:
+            if particao not in self.fontes:
+                self.fontes[particao] = FonteCSVPaginada(self.caminho(particao), self.colunas, self.tipos)
+            fontes.append(self.fontes[particao])
+        return FontePartes(fontes, self.colunas)
+
+    def _descartar_copias(self, particao):
+        if particao in self.historicos:
+            self.historicos[particao].invalidar()
+        if particao in self.fontes:
+            self.fontes[particao].invalidar()
+
+    def salvar(self, df, somente=None):
+        """
+        Regrava as partições a partir do DataFrame, agrupando as linhas pelo mês da DATA.
+        Com somente (lista de partições), só essas são substituídas; linhas de outros meses
+        são acrescentadas às partições deles.
+        """
+        df = preparar_gravacao(df.reindex(columns=self.colunas))
+        meses = meses_movimento(df["DATA"]).to_numpy()
+        with self.trava:
+            self._carregar()
+            particoes = self.manifesto["particoes"]
+            substituir = set(particoes if somente is None else somente)
+
+            for particao in substituir - set(meses):
+                if os.path.exists(self.caminho(particao)):
+                    os.remove(self.caminho(particao))
+                particoes.pop(particao, None)
+                self._descartar_copias(particao)
+
+            for mes, grupo in df.groupby(meses, sort=True):
+                caminho = self.caminho(mes)
+                acrescentar = mes not in substituir and os.path.exists(caminho)
+                grupo.to_csv(caminho, mode="a" if acrescentar else "w", header=not acrescentar, index=False, encoding="utf-8")
+                linhas = particoes.get(mes, {"linhas": 0})["linhas"] if acrescentar else 0
+                particoes[mes] = {"linhas": linhas + len(grupo)}
+                self._descartar_copias(mes)
+
+            if self.manifesto.get("ultima") not in particoes:
+                datadas = sorted(particao for particao in particoes if particao != SEM_DATA)
+                self.manifesto["ultima"] = datadas[-1] if datadas else None
+            self._gravar_manifesto()
@@ -0,0 +1,531 @@
+import re
+import heapq
+import shlex
+import bisect
+import difflib
+import functools
+import threading
+import itertools
+import collections
+import unicodedata
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from esquema import FORMATO_DATA, converter_datas, formatos_datas, tipos_colunas
+
+
+# Separa as células no texto de pesquisa de cada linha, para que uma pesquisa não encontre
+# um trecho que começa em uma coluna e termina na seguinte
+SEPARADOR = "\x1f"
+
+# Pesquisas que começam com este prefixo são expressões regulares ("re:^LUVA")
+PREFIXO_REGEX = "re:"
+
+# Pesquisas que começam com este prefixo são aproximadas, ordenadas pela semelhança ("~parafuzo")
+PREFIXO_APROXIMADO = "~"
+
+# Nomes curtos dos campos nas pesquisas por campo ("loc:A3 qtd<5"); o nome da coluna, em
+# minúsculas e com "_" no lugar dos espaços ("valor_un"), também é aceito
+CAMPOS = {coluna.lower().replace(" ", "_"): coluna for coluna in tipos_colunas} | {
+    "cod": "CODIGO",
+    "desc": "DESCRICAO",
+    "qtd": "QUANTIDADE",
+    "valor": "VALOR UN",
+    "total": "VALOR TOTAL",
+    "loc": "LOCALIZACAO",
+    "sol": "SOLICITANTE",
+    "operador": "ID"
+}
+
+_TERMO_CAMPO = re.compile(r"^([a-z_]+)(>=|<=|!=|:|=|<|>)(.*)$", re.IGNORECASE | re.DOTALL)
+
+# Formatos aceitos nos valores de datas: só o dia ou dia e hora
+_FORMATOS_DIA = ("%Y-%m-%d", "%d/%m/%Y")
+_FORMATOS_HORA = ("%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%d/%m/%Y %H:%M", FORMATO_DATA)
+
+
+class ErroConsulta(ValueError):
+    """
+    Pesquisa por campo inválida ou incompleta ("qtd<", "valor>abc"). A mensagem é a que pode
+    ser mostrada ao usuário.
+    """
+
+
+def _tipo_campo(coluna):
+    tipo = tipos_colunas.get(coluna, "object")
+    if tipo in formatos_datas:
+        return "data"
+    if tipo in ("Int32", "float32", "float64"):
+        return "numero"
+    return "texto"
+
+
+def _periodo(texto):
+    """
+    Retorna o período [inicio, fim) de uma data digitada: o dia inteiro ou o minuto informado.
+    """
+    for formatos, duracao in ((_FORMATOS_DIA, timedelta(days=1)), (_FORMATOS_HORA, timedelta(minutes=1))):
+        for formato in formatos:
+            try:
+                inicio = datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+            return np.datetime64(inicio, "ns"), np.datetime64(inicio + duracao, "ns")
+    raise ErroConsulta(f"Data inválida: {texto}")
+
+
+def _condicao(coluna, operador, valor):
+    tipo = _tipo_campo(coluna)
+    if not valor:
+        raise ErroConsulta(f"Falta o valor de {coluna}.")
+    if tipo == "numero":
+        try:
+            return coluna, tipo, operador, float(valor.replace(",", "."))
+        except ValueError:
+            raise ErroConsulta(f"{coluna} deve ser um número: {valor}")
+    if tipo == "data":
+        return coluna, tipo, operador, _periodo(valor)
+    if operador not in (":", "=", "!="):
+        raise ErroConsulta(f"{coluna} é texto: use {coluna.lower()}:, = ou !=.")
+    return coluna, tipo, operador, valor.lower()
+
+
+@functools.lru_cache(maxsize=256)
+def compilar_consulta(consulta):
+    """
+    Compila uma pesquisa por campo ("loc:A3 qtd<5 valor>100 desc:luva",
+    'solicitante:JOAO data>=2026-09-01 desc:"luva nitr"') em uma tupla de condições, todas
+    obrigatórias: (coluna, tipo, operador, valor), com o valor já convertido. Operadores:
+    ":" (texto contém, número ou data igual), "=", "!=", "<", "<=", ">" e ">="; uma data
+    sem hora vale pelo dia inteiro. Palavras sem campo são procuradas em todas as colunas
+    (coluna None). Retorna None se a consulta não tem nenhum campo conhecido (é uma
+    pesquisa simples) e lança ErroConsulta se algum termo é inválido.
+    O resultado fica guardado: a mesma consulta não é analisada de novo.
+    """
+    try:
+        termos = shlex.split(consulta)
+    except ValueError:
+        # Aspas ainda não fechadas enquanto a pesquisa é digitada
+        raise ErroConsulta("Aspas não fechadas.")
+    condicoes, campos = [], False
+    for termo in termos:
+        encontrado = _TERMO_CAMPO.match(termo)
+        if encontrado and encontrado.group(1).lower() in CAMPOS:
+            campos = True
+            campo, operador, valor = encontrado.groups()
+            condicoes.append(_condicao(CAMPOS[campo.lower()], operador, valor.strip()))
+        else:
+            condicoes.append((None, "texto", ":", termo.lower()))
+    return tuple(condicoes) if campos else None
+
+
+def _comparar(valores, operador, valor):
+    if operador in (":", "="):
+        return valores == valor
+    if operador == "!=":
+        return valores != valor
+    if operador == "<":
+        return valores < valor
+    if operador == "<=":
+        return valores <= valor
+    if operador == ">":
+        return valores > valor
+    return valores >= valor
+
+
+def _comparar_datas(datas, operador, periodo):
+    inicio, fim = periodo
+    if operador in (":", "="):
+        return (datas >= inicio) & (datas < fim)
+    if operador == "!=":
+        return ~((datas >= inicio) & (datas < fim))
+    if operador == "<":
+        return datas < inicio
+    if operador == "<=":
+        return datas < fim
+    if operador == ">":
+        return datas >= fim
+    return datas >= inicio
+
+
+class CachePesquisa:
+    """
+    Texto de pesquisa de uma tabela (DataFrame), montado uma vez e reaproveitado a cada tecla:
+    cada coluna convertida para texto em minúsculas e, para as pesquisas simples, todas as
+    colunas de cada linha juntas em um único texto. É refeito quando a tabela pesquisada é
+    outra (um DataFrame novo) ou depois de invalidar(), que deve ser chamado quando a tabela
+    é alterada no próprio lugar.
+    Guarda também o resultado da última pesquisa simples: se a próxima contiver o texto dela
+    ("luv" e depois "luva"), só as linhas já encontradas são testadas de novo. Nas pesquisas por
+    campo (veja compilar_consulta), guarda as colunas convertidas para número ou data e a máscara
+    de cada condição, reaproveitadas quando a pesquisa muda só em parte ("loc:A3" e depois
+    "loc:A3 qtd<5").
+    Pode ser usado por várias threads; uma pesquisa de cada vez.
+    """
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.df = None
+        self.colunas = None
+        self.linhas = None
+        self.ultima = None
+        self.tipadas = {}
+        self.mascaras = {}
+
+    def invalidar(self):
+        with self.trava:
+            self.df = None
+            self.colunas = None
+            self.linhas = None
+            self.ultima = None
+            self.tipadas = {}
+            self.mascaras = {}
+
+    def _preparar(self, df, cancelado):
+        if self.df is df:
+            return True
+        colunas = []
+        for coluna in df.columns:
+            if cancelado():
+                return False
+            colunas.append(df[coluna].astype(str).str.lower())
+        self.df, self.colunas, self.linhas, self.ultima = df, colunas, None, None
+        self.tipadas, self.mascaras = {}, {}
+        return True
+
+    def _texto_linhas(self):
+        if self.linhas is None:
+            linhas = self.colunas[0]
+            for coluna in self.colunas[1:]:
+                linhas = linhas + SEPARADOR + coluna
+            self.linhas = linhas
+        return self.linhas
+
+    def _valores(self, df, coluna, tipo):
+        if tipo == "texto":
+            return self.colunas[df.columns.get_loc(coluna)]
+        valores = self.tipadas.get(coluna)
+        if valores is None:
+            if tipo == "data":
+                formato = formatos_datas.get(tipos_colunas.get(coluna), FORMATO_DATA)
+                valores = converter_datas(df[coluna], formato).to_numpy(dtype="datetime64[ns]")
+            else:
+                valores = pd.to_numeric(df[coluna], errors="coerce").to_numpy(dtype=np.float64)
+            self.tipadas[coluna] = valores
+        return valores
+
+    def _mascara(self, df, condicao):
+        mascara = self.mascaras.get(condicao)
+        if mascara is not None:
+            return mascara
+        coluna, tipo, operador, valor = condicao
+        if coluna is None:
+            mascara = self._texto_linhas().str.contains(valor, regex=False).to_numpy()
+        elif coluna not in df.columns:
+            raise ErroConsulta(f"Esta tabela não tem a coluna {coluna}.")
+        elif tipo == "data":
+            mascara = _comparar_datas(self._valores(df, coluna, tipo), operador, valor)
+        elif tipo == "texto" and operador == ":":
+            mascara = self._valores(df, coluna, tipo).str.contains(valor, regex=False).to_numpy()
+        else:
+            mascara = np.asarray(_comparar(self._valores(df, coluna, tipo), operador, valor))
+        if len(self.mascaras) >= 64:
+            self.mascaras.clear()
+        self.mascaras[condicao] = mascara
+        return mascara
+
+    def filtrar(self, df, consulta, cancelado=lambda: False, indice=None):
+        """
+        Retorna as linhas de df em que alguma célula contém a consulta, sem diferenciar
+        maiúsculas de minúsculas. Com indice (o IndiceInvertido do estoque), as linhas dos
+        produtos com todas as palavras da consulta, em qualquer ordem, também entram no
+        resultado. Com PREFIXO_REGEX, a consulta é uma expressão regular, testada em cada
+        célula; uma expressão inválida lança re.error. Uma pesquisa por campo ("loc:A3 qtd<5",
+        veja compilar_consulta) retorna as linhas que atendem todas as condições; uma pesquisa
+        por campo inválida lança ErroConsulta.
+        cancelado() é consultada entre as etapas; se retornar True, a pesquisa é
+        interrompida e filtrar retorna None.
+        """
+        with self.trava:
+            if not self._preparar(df, cancelado) or cancelado():
+                return None
+            if df.empty:
+                return df
+
+            if consulta.startswith(PREFIXO_REGEX):
+                padrao = re.compile(consulta[len(PREFIXO_REGEX):], re.IGNORECASE)
+                mascara = self.colunas[0].str.contains(padrao, regex=True)
+                for coluna in self.colunas[1:]:
+                    if cancelado():
+                        return None
+                    mascara |= coluna.str.contains(padrao, regex=True)
+                return df[mascara.to_numpy()]
+
+            condicoes = compilar_consulta(consulta)
+            if condicoes is not None:
+                mascara = np.ones(len(df), dtype=bool)
+                for condicao in condicoes:
+                    if cancelado():
+                        return None
+                    mascara &= self._mascara(df, condicao)
+                return df.iloc[mascara.nonzero()[0]]
+
+            consulta = consulta.lower()
+            linhas = self._texto_linhas()
+            if self.ultima is not None and self.ultima[0] in consulta:
+                # A consulta estende a anterior: as linhas que não tinham a anterior também não têm esta
+                posicoes = self.ultima[1]
+                posicoes = posicoes[linhas.iloc[posicoes].str.contains(consulta, regex=False).to_numpy()]
+            else:
+                posicoes = linhas.str.contains(consulta, regex=False).to_numpy().nonzero()[0]
+            self.ultima = (consulta, posicoes)
+            if indice is not None:
+                posicoes = np.union1d(posicoes, indice.buscar_posicoes(df, consulta))
+            return df.iloc[posicoes]
+
+
+def normalizar(texto):
+    """
+    Texto em minúsculas e sem acentos ("Máscara" -> "mascara"), como é guardado no índice.
+    """
+    return unicodedata.normalize("NFKD", str(texto).lower()).encode("ascii", "ignore").decode("ascii")
+
+
+def _normalizar_serie(serie):
+    return serie.astype(str).str.lower().str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+
+
+def _chave(codigo):
+    try:
+        return str(int(float(codigo)))
+    except (TypeError, ValueError):
+        return str(codigo).strip()
+
+
+def trigramas(palavra):
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+
+def _palavras_aproximadas(texto):
+    return [palavra for palavra in (palavra.strip(".,;:-") for palavra in normalizar(texto).split()) if palavra]
+
+
+def semelhanca(palavras, documento):
+    """
+    Nota entre 0 e 1 de quanto o documento (texto normalizado) se parece com as palavras da
+    pesquisa: para cada palavra, a nota da palavra mais parecida do documento, e a média delas.
+    Uma palavra que é o início da outra é uma abreviação ("paraf" e "parafuso") e vale quase 1;
+    nas demais vale a proporção de letras em comum na mesma ordem (difflib), que tolera letras
+    trocadas, faltando ou sobrando ("parafuzo").
+    """
+    termos = _palavras_aproximadas(documento)
+    total = 0.0
+    for palavra in palavras:
+        melhor = 0.0
+        comparador = difflib.SequenceMatcher(None, b=palavra)
+        for termo in termos:
+            if termo.startswith(palavra) or (len(termo) >= 3 and palavra.startswith(termo)):
+                melhor = max(melhor, 0.9 + 0.1 * min(len(palavra), len(termo)) / max(len(palavra), len(termo)))
+                continue
+            # Limite superior da proporção, pelo tamanho das palavras: evita comparar à toa
+            if 2 * min(len(palavra), len(termo)) / (len(palavra) + len(termo)) <= melhor:
+                continue
+            comparador.set_seq1(termo)
+            if comparador.quick_ratio() > melhor:
+                melhor = max(melhor, comparador.ratio())
+        total += melhor
+    return total / len(palavras) if palavras else 0.0
+
+
+def ranquear(consulta, documentos, limite=20, minimo=0.6):
+    """
+    Retorna as até limite chaves mais parecidas com a consulta, da mais para a menos parecida:
+    [(chave, nota)], só com as de nota a partir de minimo. documentos é uma sequência de
+    (chave, texto); use em listas pequenas ou depois de escolher candidatos, como
+    IndiceInvertido.aproximados faz.
+    """
+    palavras = _palavras_aproximadas(consulta)
+    if not palavras:
+        return []
+    notas = ((chave, semelhanca(palavras, normalizar(texto))) for chave, texto in documentos)
+    return heapq.nlargest(limite, (item for item in notas if item[1] >= minimo), key=lambda item: item[1])
+
+
+class IndiceInvertido:
+    """
+    Índice invertido do estoque para a pesquisa por trechos ("LUVA NITR", "PARAF 3/8"): para cada
+    palavra e cada trigrama (três letras seguidas de uma palavra) de DESCRICAO, LOCALIZACAO e
+    CODIGO, o conjunto de códigos de produto em que aparece. Uma pesquisa é dividida em
+    palavras e cada uma delas precisa aparecer em algum desses campos: os candidatos vêm da
+    interseção dos conjuntos dos trigramas dela (palavras com menos de 3 letras são procuradas
+    como início de palavra) e só eles são conferidos, então o tempo de uma pesquisa depende
+    de quantos produtos têm os trechos procurados, não do tamanho do estoque.
+    É atualizado produto a produto (atualizar, remover) ou comparando com a tabela (sincronizar).
+    Também faz a pesquisa aproximada (aproximados), com os mesmos trigramas escolhendo os candidatos.
+    """
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.documentos = {}
+        self.trigramas = collections.defaultdict(set)
+        self.palavras = collections.defaultdict(set)
+        self.vocabulario = None
+        self.df = None
+        self.posicoes = None
+
+    def _retirar(self, chave):
+        documento = self.documentos.pop(chave, None)
+        if documento is None:
+            return
+        for palavra in set(documento.split()):
+            self._descartar(self.palavras, palavra, chave)
+            for trigrama in trigramas(palavra):
+                self._descartar(self.trigramas, trigrama, chave)
+
+    def _descartar(self, postagens, termo, chave):
+        codigos = postagens.get(termo)
+        if codigos is not None:
+            codigos.discard(chave)
+            if not codigos:
+                del postagens[termo]
+                self.vocabulario = None
+
+    def _incluir(self, chave, documento):
+        self.documentos[chave] = documento
+        for palavra in set(documento.split()):
+            if palavra not in self.palavras:
+                self.vocabulario = None
+            self.palavras[palavra].add(chave)
+            for trigrama in trigramas(palavra):
+                self.trigramas[trigrama].add(chave)
+
+    def atualizar(self, codigo, descricao, localizacao):
+        """
+        Inclui ou atualiza um produto no índice.
+        """
+        chave = _chave(codigo)
+        documento = normalizar(f"{descricao or ''} {localizacao or ''} {chave}")
+        with self.trava:
+            if self.documentos.get(chave) != documento:
+                self._retirar(chave)
+                self._incluir(chave, documento)
+
+    def remover(self, codigo):
+        with self.trava:
+            self._retirar(_chave(codigo))
+
+    def sincronizar(self, df):
+        """
+        Deixa o índice igual à tabela de estoque df: só os produtos novos, alterados ou
+        excluídos desde a última vez são reindexados.
+        """
+        if df.empty or "CODIGO" not in df.columns:
+            chaves, documentos = [], []
+        else:
+            validos = df[df["CODIGO"].notna()]
+            chaves = [_chave(codigo) for codigo in validos["CODIGO"]]
+            documentos = _normalizar_serie(
+                validos["DESCRICAO"].fillna("").astype(str) + " " + validos["LOCALIZACAO"].fillna("").astype(str)
+                + " " + pd.Series(chaves, index=validos.index, dtype=object)
+            )
+        with self.trava:
+            atuais = set(chaves)
+            for chave in [chave for chave in self.documentos if chave not in atuais]:
+                self._retirar(chave)
+            for chave, documento in zip(chaves, documentos):
+                if self.documentos.get(chave) != documento:
+                    self._retirar(chave)
+                    self._incluir(chave, documento)
+
+    def _prefixo(self, palavra):
+        if self.vocabulario is None:
+            self.vocabulario = sorted(self.palavras)
+        codigos = set()
+        inicio = bisect.bisect_left(self.vocabulario, palavra)
+        for termo in itertools.islice(self.vocabulario, inicio, None):
+            if not termo.startswith(palavra):
+                break
+            codigos |= self.palavras[termo]
+        return codigos
+
+    def _candidatos(self, palavra):
+        if len(palavra) < 3:
+            return self._prefixo(palavra), False
+        postagens = sorted((self.trigramas.get(trigrama, set()) for trigrama in trigramas(palavra)), key=len)
+        return set(postagens[0]).intersection(*postagens[1:]), True
+
+    def buscar(self, consulta):
+        """
+        Retorna o conjunto de códigos (texto) dos produtos que têm todas as palavras da consulta.
+        """
+        palavras = normalizar(consulta).split()
+        if not palavras:
+            return set()
+        with self.trava:
+            resultado = None
+            for candidatos, conferir, palavra in sorted(
+                (self._candidatos(palavra) + (palavra,) for palavra in palavras), key=lambda item: len(item[0])
+            ):
+                candidatos = candidatos if resultado is None else candidatos & resultado
+                if conferir:
+                    # Os trigramas só indicam candidatos: a palavra inteira precisa aparecer no produto
+                    candidatos = {chave for chave in candidatos if palavra in self.documentos[chave]}
+                resultado = candidatos
+                if not resultado:
+                    break
+            return resultado
+
+    def aproximados(self, consulta, limite=20, minimo=0.6, candidatos=500):
+        """
+        Pesquisa tolerante a erros de digitação e abreviações ("PARAFUZO", "PARAF."): retorna
+        os até limite códigos mais parecidos com a consulta, do mais para o menos parecido,
+        [(codigo, nota)] (veja semelhanca). Só os produtos com mais trigramas em comum
+        com a consulta são comparados, então um produto precisa ter ao menos um trigrama
+        de alguma das palavras (ou começar como elas, nas de menos de 3 letras).
+        """
+        palavras = _palavras_aproximadas(consulta)
+        if not palavras:
+            return []
+        with self.trava:
+            contagem = collections.Counter()
+            for palavra in palavras:
+                if len(palavra) < 3:
+                    contagem.update(self._prefixo(palavra))
+                for trigrama in trigramas(palavra):
+                    contagem.update(self.trigramas.get(trigrama, ()))
+            escolhidos = heapq.nlargest(candidatos, contagem.items(), key=lambda item: item[1])
+            documentos = [(chave, self.documentos[chave]) for chave, _ in escolhidos]
+        return ranquear(consulta, documentos, limite, minimo)
+
+    def _posicoes(self, df):
+        if self.df is not df:
+            self.df = df
+            self.posicoes = {_chave(codigo): posicao for posicao, codigo in enumerate(df["CODIGO"]) if pd.notna(codigo)}
+        return self.posicoes
+
+    def buscar_posicoes(self, df, consulta):
+        """
+        Retorna as posições (em ordem) das linhas da tabela de estoque df cujos produtos têm
+        todas as palavras da consulta.
+        """
+        codigos = self.buscar(consulta)
+        with self.trava:
+            posicoes = self._posicoes(df)
+            return np.array(sorted(posicoes[codigo] for codigo in codigos if codigo in posicoes), dtype=np.intp)
+
+    def filtrar(self, df, consulta):
+        """
+        Retorna as linhas da tabela de estoque df cujos produtos têm todas as palavras da consulta.
+        """
+        return df.iloc[self.buscar_posicoes(df, consulta)]
+
+    def filtrar_aproximado(self, df, consulta, limite=20, minimo=0.6):
+        """
+        Retorna as linhas da tabela de estoque df dos produtos mais parecidos com a consulta,
+        na ordem da semelhança (veja aproximados).
+        """
+        codigos = self.aproximados(consulta, limite, minimo)
+        with self.trava:
+            posicoes = self._posicoes(df)
+            posicoes = [posicoes[codigo] for codigo, _ in codigos if codigo in posicoes]
+        return df.iloc[posicoes]
@@ -0,0 +1,52 @@
+import os
+from travas import TravaArquivo
+
+
+class SequenciaCodigos:
+    """
+    Sequência persistente de códigos de produto, guardada em um arquivo de texto.
+    O acesso é protegido por um arquivo de trava, então vários processos podem usá-la.
+    Se o arquivo não existir, a sequência é iniciada uma única vez a partir do maior CODIGO do estoque.
+    """
+
+    tempo_limite = 10
+    trava_abandonada = 30
+
+    def __init__(self, caminho, maior_codigo):
+        self.caminho = caminho
+        self.maior_codigo = maior_codigo
+        self.trava = TravaArquivo(caminho + ".lock", self.tempo_limite, self.trava_abandonada)
+
+    def _ler(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            maior = self.maior_codigo()
+            return maior + 1 if maior is not None else 3
+
+    def _gravar(self, valor):
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(str(valor))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho)
+
+    def reservar(self, quantidade):
+        """
+        Reserva um bloco de códigos consecutivos e retorna a faixa reservada.
+        """
+        if quantidade < 1:
+            raise ValueError("A quantidade de códigos deve ser maior que zero.")
+
+        with self.trava:
+            inicio = self._ler()
+            self._gravar(inicio + quantidade)
+        return range(inicio, inicio + quantidade)
+
+    def proximo(self):
+        """
+        Reserva e retorna o próximo código disponível.
+        """
+        return self.reservar(1)[0]
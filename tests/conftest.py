@@ -0,0 +1,35 @@
+import pytest
+import armazenamento
+import configuracao
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    """
+    Executa o teste em uma pasta vazia, com as planilhas criadas pelo armazenamento CSV
+    e as camadas opcionais (diário, eventos, partições, cópia colunar) desligadas.
+    """
+    monkeypatch.chdir(tmp_path)
+    for opcao in ("COLUNAR", "PARTICOES", "DIARIO", "EVENTOS"):
+        monkeypatch.setattr(configuracao, opcao, False)
+    monkeypatch.setattr(configuracao, "BACKEND", "csv")
+    monkeypatch.setattr(configuracao, "COORDENADOR", None)
+    monkeypatch.setattr(armazenamento, "_armazenamento", None)
+    return tmp_path
+
+
+@pytest.fixture
+def repositorio(pasta):
+    repositorio = armazenamento.obter_armazenamento()
+    with repositorio.travar():
+        repositorio.criar()
+    return repositorio
+
+
+@pytest.fixture
+def produto(repositorio):
+    """
+    Cadastra um produto com 10 unidades a 2,50 e retorna o código dele.
+    """
+    import operacoes
+    return operacoes.cadastrar_produto(repositorio, "PARAFUSO", 10, 2.5, "A1")
@@ -0,0 +1,54 @@
+import almoxarifado
+
+
+def test_lote_com_entradas_e_saidas_misturadas(repositorio, produto, pasta, capsys):
+    (pasta / "comandos.txt").write_text(
+        "# requisição do dia\n"
+        f"entrada --codigo {produto} --qtd 5\n"
+        f"saida --codigo {produto} --qtd 3 --solicitante JOAO\n"
+        "\n"
+        f"entrada --codigo {produto} --qtd 2\n",
+        encoding="utf-8",
+    )
+
+    assert almoxarifado.main(["lote", "comandos.txt"]) == 0
+    assert "3 de 3 comando(s) registrado(s)" in capsys.readouterr().out
+    assert float(repositorio.buscar_produto(produto)[4]) == 14
+
+
+def test_lote_informa_as_linhas_com_erro(repositorio, produto, pasta, capsys):
+    (pasta / "comandos.txt").write_text(
+        f"saida --codigo {produto} --qtd 30 --solicitante JOAO\n"
+        f"entrada --codigo {produto}\n"
+        f"entrada --codigo {produto} --qtd 1\n",
+        encoding="utf-8",
+    )
+
+    assert almoxarifado.main(["lote", "comandos.txt"]) == 1
+    erros = capsys.readouterr().err
+    assert "Linha 1: Quantidade insuficiente" in erros
+    assert "Linha 2:" in erros
+    assert float(repositorio.buscar_produto(produto)[4]) == 11
+
+
+def test_comando_avulso(repositorio, produto, capsys):
+    assert almoxarifado.main(["saida", "--codigo", produto, "--qtd", "4", "--solicitante", "ana"]) == 0
+    assert "Quantidade: 6" in capsys.readouterr().out
+
+
+def test_lote_com_falha_na_gravacao(repositorio, produto, pasta, capsys, monkeypatch):
+    def movimentar_lote(tabela, movimentos, versoes=None):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(repositorio, "movimentar_lote", movimentar_lote)
+    (pasta / "comandos.txt").write_text(
+        "cadastrar --descricao PORCA --qtd 1 --valor 1\n"
+        f"entrada --codigo {produto} --qtd 5\n",
+        encoding="utf-8",
+    )
+
+    assert almoxarifado.main(["lote", "comandos.txt"]) == 1
+    erros = capsys.readouterr().err
+    assert "Linha 2: Não gravado: disco cheio" in erros
+    assert "1 cadastro(s) e registro(s) de EPI sem erro foram gravados e mantidos." in erros
+    assert float(repositorio.buscar_produto(produto)[4]) == 10
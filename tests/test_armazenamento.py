@@ -0,0 +1,30 @@
+import os
+from armazenamento import acrescentar_versao, colunas
+
+
+def test_acrescentar_versao_a_estoque_antigo(tmp_path):
+    caminho = tmp_path / "Estoque.csv"
+    caminho.write_text(
+        "CODIGO,DESCRICAO,VALOR UN,VALOR TOTAL,QUANTIDADE,DATA,LOCALIZACAO\n"
+        "1,PARAFUSO,2.5,25.0,10,10:30 05/01/2026,A1\n"
+        "2,PORCA,1,3,3,10:30 05/01/2026\n",
+        encoding="utf-8",
+    )
+
+    assert acrescentar_versao(str(caminho))
+    linhas = caminho.read_text(encoding="utf-8").splitlines()
+    assert linhas[0] == ",".join(colunas["estoque"])
+    assert linhas[1].endswith(",A1,0")
+    assert linhas[2].endswith(",,0")
+    assert not acrescentar_versao(str(caminho))
+
+
+def test_estoque_com_versao_so_tem_o_cabecalho_lido(tmp_path):
+    caminho = tmp_path / "Estoque.csv"
+    # Bytes inválidos depois do cabeçalho: a leitura do arquivo inteiro falharia
+    caminho.write_bytes(",".join(colunas["estoque"]).encode() + b"\n" + b"1,X,1,1,1,,,0\n" * 5000 + b"\xff\xfe")
+    modificado = os.path.getmtime(caminho)
+
+    assert not acrescentar_versao(str(caminho))
+    assert os.path.getmtime(caminho) == modificado
+    assert not acrescentar_versao(str(tmp_path / "inexistente.csv"))
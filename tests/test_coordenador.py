@@ -0,0 +1,116 @@
+import threading
+import pytest
+import armazenamento
+import operacoes
+from coordenador import ClienteCoordenador, Comando, Coordenador, ErroCoordenador, iniciar_servidor
+
+
+def _gravar(coordenador, *comandos):
+    comandos = [Comando(operacao, dados) for operacao, dados in comandos]
+    coordenador._gravar_lote(comandos)
+    return comandos
+
+
+def test_lote_misto_de_varias_estacoes(repositorio, produto):
+    coordenador = Coordenador(repositorio)
+    comandos = _gravar(
+        coordenador,
+        ("entrada", {"codigo": produto, "quantidade": 5}),
+        ("saida", {"codigo": produto, "quantidade": 3, "solicitante": "JOAO"}),
+        ("entrada", {"codigo": produto, "quantidade": 2}),
+    )
+
+    assert [comando.erro for comando in comandos] == [None, None, None]
+    assert float(repositorio.buscar_produto(produto)[4]) == 14
+    assert coordenador.alteracoes_desde(0)[1][-1]["linha"][4] == "14.0"
+
+
+def test_grupo_misto_depois_dos_comandos_avulsos(repositorio, produto):
+    coordenador = Coordenador(repositorio)
+    avulsa, grupo = _gravar(
+        coordenador,
+        ("saida", {"codigo": produto, "quantidade": 4, "solicitante": "ANA"}),
+        ("grupo", {"comandos": [
+            ["entrada", {"codigo": produto, "quantidade": 10}],
+            ["saida", {"codigo": produto, "quantidade": 15, "solicitante": "ANA"}],
+            ["entrada", {"codigo": produto, "quantidade": 1}],
+        ]}),
+    )
+
+    assert avulsa.erro is None and grupo.erro is None
+    assert [resultado["quantidade"] for resultado in grupo.resultado["resultados"]] == [16, 1, 2]
+    assert float(repositorio.buscar_produto(produto)[4]) == 2
+
+
+@pytest.fixture
+def servidor(repositorio):
+    servidor = iniciar_servidor(repositorio, porta=0, intervalo=0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _cliente(servidor):
+    return ClienteCoordenador(f"127.0.0.1:{servidor.server_address[1]}", tempo_limite=5)
+
+
+def test_cliente_http(servidor, produto):
+    cliente = _cliente(servidor)
+
+    codigo = cliente.cadastrar("porca", 3, 1)["codigo"]
+    assert cliente.saida(produto, 4, "ana")["quantidade"] == 6
+    with pytest.raises(ErroCoordenador, match="insuficiente"):
+        cliente.saida(codigo, 5, "ana")
+    assert cliente.buscar_produto(codigo)[1] == "PORCA"
+    assert cliente.buscar_produto("999") is None
+    sequencia, linhas = cliente.tabela("estoque")
+    assert sequencia == 2 and sorted(linha[1] for linha in linhas) == ["PARAFUSO", "PORCA"]
+
+
+def test_trava_indisponivel_recusa_todos_os_comandos(servidor, repositorio, produto, monkeypatch):
+    def travar():
+        raise TimeoutError("trava ocupada")
+
+    monkeypatch.setattr(repositorio, "travar", travar)
+    cliente = _cliente(servidor)
+    with pytest.raises(ErroCoordenador, match="trava ocupada"):
+        cliente.cadastrar("porca", 3, 1)
+    with pytest.raises(ErroCoordenador, match="trava ocupada"):
+        cliente.epi("1", "LUVA", 3)
+    with pytest.raises(ErroCoordenador, match="trava ocupada"):
+        cliente.entrada(produto, 1)
+
+
+def test_resposta_vazia_do_coordenador(servidor, monkeypatch):
+    monkeypatch.setattr(servidor.coordenador, "executar", lambda operacao, dados: None)
+
+    with pytest.raises(ErroCoordenador, match="Resposta inválida"):
+        _cliente(servidor).cadastrar("porca", 3, 1)
+
+
+def test_leituras_vem_da_memoria(repositorio, produto, monkeypatch):
+    coordenador = Coordenador(repositorio)
+    _gravar(coordenador, ("saida", {"codigo": produto, "quantidade": 4, "solicitante": "ANA"}))
+
+    def buscar_produto(codigo):
+        raise AssertionError("leitura das planilhas")
+
+    monkeypatch.setattr(repositorio, "buscar_produto", buscar_produto)
+    assert coordenador.buscar_produto(produto)[4] == "6.0"
+    assert coordenador.buscar_produto(f"{produto}.0")[1] == "PARAFUSO"
+    assert coordenador.buscar_produto("999") is None
+    sequencia, linhas = coordenador.tabela("estoque")
+    assert sequencia == 1 and [linha[1] for linha in linhas] == ["PARAFUSO"]
+
+
+def test_alteracao_de_outra_estacao_e_relida(repositorio, produto):
+    coordenador = Coordenador(repositorio)
+    _gravar(coordenador, ("epi", {"ca": "123", "descricao": "LUVA", "quantidade": 2}))
+    assert coordenador.tabela("epis")[1] == [["123", "LUVA", "2.0"]]
+
+    # Outra estação, com a própria trava, grava direto nas planilhas
+    outra = armazenamento.ArmazenamentoCSV()
+    operacoes.registrar_entrada(outra, produto, 5)
+
+    assert coordenador.buscar_produto(produto)[4] == "15.0"
@@ -0,0 +1,164 @@
+import json
+import threading
+import pytest
+import armazenamento
+import configuracao
+from diario import ArmazenamentoComDiario, Diario
+
+
+def _linha(codigo, quantidade, solicitante="JOAO"):
+    return [codigo, "PARAFUSO", quantidade, solicitante, "10:30 05/01/2026", "", "2026-01-05 10:30:00"]
+
+
+@pytest.fixture
+def estacao(pasta):
+    """
+    Uma estação com o diário, sem a aplicação em segundo plano (para simular quedas).
+    """
+    def nova():
+        estacao = ArmazenamentoComDiario(armazenamento.ArmazenamentoCSV(), configuracao.ARQUIVO_DIARIO)
+        with estacao.travar():
+            estacao.armazenamento.criar()
+        return estacao
+
+    estacao = nova()
+    with estacao.travar():
+        estacao.armazenamento.inserir_produto([1, "PARAFUSO", 2.5, 25.0, 10, "10:30 05/01/2026", "A1", 0])
+    estacao.nova = nova
+    return estacao
+
+
+def _quantidade(repositorio):
+    return float(repositorio.armazenamento.buscar_produto("1")[4])
+
+
+def _saidas(repositorio):
+    return repositorio.armazenamento.ler_tabela("saida")
+
+
+def _gravar_diario(registros, aplicado=None):
+    diario = Diario(configuracao.ARQUIVO_DIARIO)
+    for registro in registros:
+        diario.anexar(registro)
+    if aplicado is not None:
+        with open(diario.caminho_aplicado, "w", encoding="utf-8") as f:
+            f.write(aplicado)
+
+
+def test_movimentacao_fica_pendente_ate_ser_aplicada(estacao):
+    with estacao.travar():
+        estacao.movimentar_lote("saida", [(_linha("1", 3), "1", 7)])
+
+    assert _quantidade(estacao) == 10
+    assert estacao.buscar_produto("1")[4] == "7"
+    assert len(estacao.ler_tabela("saida")) == 1
+    assert _quantidade(estacao) == 7
+    assert not estacao.fila and not estacao.pendentes
+
+
+def test_liberar_a_trava_nao_espera_a_aplicacao(estacao, monkeypatch):
+    liberar = threading.Event()
+    original = estacao.armazenamento.movimentar_lote
+
+    def movimentar_lote(tabela, movimentos, versoes=None):
+        liberar.wait(10)
+        original(tabela, movimentos, versoes)
+
+    monkeypatch.setattr(estacao.armazenamento, "movimentar_lote", movimentar_lote)
+    estacao.criar()
+    with estacao.travar():
+        estacao.movimentar_lote("saida", [(_linha("1", 3), "1", 7)])
+    assert estacao.fila
+
+    liberar.set()
+    estacao.aguardar()
+    assert _quantidade(estacao) == 7
+
+
+def test_recuperar_aplica_as_pendentes(estacao):
+    _gravar_diario([
+        {"seq": 1, "tabela": "saida", "movimentos": [[_linha("1", 3), "1", 7]]},
+        {"seq": 2, "tabela": "entrada", "linha": ["1", "PARAFUSO", 5, 2.5, 12.5, "10:30 05/01/2026", "", ""],
+         "codigo": "1", "nova_quantidade": 12},
+    ])
+
+    with estacao.travar():
+        aplicadas = estacao.recuperar()
+
+    assert [registro["seq"] for registro in aplicadas] == [1, 2]
+    assert _quantidade(estacao) == 12
+    assert Diario(configuracao.ARQUIVO_DIARIO).ler_aplicado() == (2, 2)
+    assert Diario(configuracao.ARQUIVO_DIARIO).registros() == []
+
+
+def test_recuperar_nao_duplica_a_movimentacao_interrompida(estacao):
+    # Queda depois de gravar a planilha de saída e antes de atualizar o estoque e o ".aplicado"
+    estacao.armazenamento.registrar_movimentos("saida", [_linha("1", 3)])
+    _gravar_diario([
+        {"seq": 1, "tabela": "saida", "movimentos": [[_linha("1", 3), "1", 7]]},
+        {"seq": 2, "tabela": "saida", "movimentos": [[_linha("1", 2), "1", 5]]},
+    ], aplicado="0 1")
+
+    with estacao.travar():
+        aplicadas = estacao.recuperar()
+
+    assert [registro["seq"] for registro in aplicadas] == [2]
+    assert list(_saidas(estacao)["QUANTIDADE"]) == [3, 2]
+    assert _quantidade(estacao) == 5
+
+
+def test_recuperar_confere_todas_as_pendentes_de_um_aplicado_antigo(estacao):
+    estacao.armazenamento.movimentar_lote("saida", [(_linha("1", 3), "1", 7)])
+    estacao.armazenamento.registrar_movimentos("entrada", [["1", "PARAFUSO", 5, 2.5, 12.5, "10:30 05/01/2026", ""]])
+    _gravar_diario([
+        {"seq": 1, "tabela": "saida", "movimentos": [[_linha("1", 3), "1", 7]]},
+        {"seq": 2, "tabela": "entrada", "movimentos": [[["1", "PARAFUSO", 5, 2.5, 12.5, "10:30 05/01/2026", ""], "1", 12]]},
+        {"seq": 3, "tabela": "saida", "movimentos": [[_linha("1", 4), "1", 8]]},
+    ], aplicado="0")
+
+    with estacao.travar():
+        aplicadas = estacao.recuperar()
+
+    assert [registro["seq"] for registro in aplicadas] == [3]
+    assert list(_saidas(estacao)["QUANTIDADE"]) == [3, 4]
+    assert len(estacao.armazenamento.ler_tabela("entrada")) == 1
+    assert _quantidade(estacao) == 8
+
+
+def test_movimentacoes_iguais_nao_sao_confundidas(estacao):
+    # Duas saídas idênticas no mesmo minuto: a segunda não pode ser tomada como já aplicada
+    with estacao.travar():
+        estacao.movimentar_lote("saida", [(_linha("1", 1), "1", 9)])
+    estacao.aguardar()
+    with estacao.travar():
+        estacao.movimentar_lote("saida", [(_linha("1", 1), "1", 8)])
+    estacao.aguardar()
+
+    assert list(_saidas(estacao)["QUANTIDADE"]) == [1, 1]
+    assert _quantidade(estacao) == 8
+
+
+def test_outra_estacao_aplica_as_pendentes_ao_obter_a_trava(estacao):
+    outra = estacao.nova()
+    with estacao.travar():
+        estacao.movimentar_lote("saida", [(_linha("1", 3), "1", 7)])
+
+    with outra.travar():
+        assert _quantidade(outra) == 7
+        outra.movimentar_lote("saida", [(_linha("1", 2, "ANA"), "1", 5)])
+    outra.aguardar()
+
+    with open(configuracao.ARQUIVO_DIARIO + ".aplicado", encoding="utf-8") as f:
+        assert f.read() == "2 2"
+    assert list(_saidas(estacao)["SOLICITANTE"]) == ["JOAO", "ANA"]
+    with estacao.travar():
+        assert estacao.buscar_produto("1")[4] == "5"
+        assert not estacao.fila
+
+
+def test_diario_com_linha_incompleta(pasta):
+    _gravar_diario([{"seq": 1, "tabela": "saida", "linha": [], "codigo": "1", "nova_quantidade": 1}])
+    with open(configuracao.ARQUIVO_DIARIO, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"seq": 2})[:5])
+
+    assert [registro["seq"] for registro in Diario(configuracao.ARQUIVO_DIARIO).registros()] == [1]
@@ -0,0 +1,56 @@
+import pandas as pd
+from armazenamento import colunas, esquema
+from esquema import aplicar_esquema, data_iso, montar_esquema, para_edicao, preparar_gravacao, tipos_leitura
+
+
+def _estoque(**valores):
+    linha = {"CODIGO": "1", "DESCRICAO": "PARAFUSO", "VALOR UN": "0.1", "VALOR TOTAL": "0.3",
+             "QUANTIDADE": "3", "DATA": "10:30 05/01/2026", "LOCALIZACAO": "A1", "VERSAO": "0"}
+    return pd.DataFrame([linha | valores])
+
+
+def test_tipos_do_estoque():
+    df = aplicar_esquema(_estoque(), esquema["estoque"])
+
+    assert str(df["CODIGO"].dtype) == "Int32"
+    assert df["QUANTIDADE"].dtype == "float64"
+    assert isinstance(df["LOCALIZACAO"].dtype, pd.CategoricalDtype)
+    assert df.loc[0, "DATA"] == pd.Timestamp(2026, 1, 5, 10, 30)
+
+
+def test_valor_total_sem_ruido_de_precisao():
+    df = aplicar_esquema(pd.concat([_estoque(), _estoque(**{"VALOR UN": "1.1", "QUANTIDADE": "12345.67"})]),
+                         esquema["estoque"])
+
+    total = df["VALOR UN"] * df["QUANTIDADE"]
+
+    assert list(total.astype(str)) == [str(0.1 * 3), str(1.1 * 12345.67)]
+    assert df["QUANTIDADE"].iloc[1] == 12345.67
+
+
+def test_coluna_fora_do_tipo_fica_como_esta():
+    df = aplicar_esquema(_estoque(CODIGO="A12", DATA="ontem"), esquema["estoque"])
+
+    assert df.loc[0, "CODIGO"] == "A12"
+    assert df.loc[0, "DATA"] == "ontem"
+
+
+def test_texto_lido_sem_conversao():
+    tipos = tipos_leitura(esquema["epis"])
+
+    assert tipos["CA"] is str
+    assert montar_esquema({"saida": colunas["saida"]})["saida"]["DESCRICAO"] == "category"
+
+
+def test_gravacao_e_edicao_voltam_ao_formato_das_planilhas():
+    df = aplicar_esquema(_estoque(), esquema["estoque"])
+
+    assert preparar_gravacao(df).loc[0, "DATA"] == "10:30 05/01/2026"
+    edicao = para_edicao(df)
+    assert edicao["CODIGO"].dtype == "int64"
+    assert edicao["LOCALIZACAO"].dtype == object
+
+
+def test_data_iso():
+    assert data_iso("10:30 05/01/2026") == "2026-01-05 10:30:00"
+    assert data_iso("inválida") == ""
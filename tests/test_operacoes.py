@@ -0,0 +1,120 @@
+import pytest
+import operacoes
+from operacoes import ErroOperacao, Lote, executar_comandos, executar_juntos
+
+
+def _quantidade(repositorio, codigo):
+    return float(repositorio.buscar_produto(codigo)[4])
+
+
+def test_lote_misto_grava_a_quantidade_final(repositorio, produto):
+    respostas = executar_comandos(repositorio, [
+        ("entrada", {"codigo": produto, "quantidade": 5}),
+        ("saida", {"codigo": produto, "quantidade": 3, "solicitante": "JOAO"}),
+        ("entrada", {"codigo": produto, "quantidade": 2}),
+    ])
+
+    assert [erro for _, erro in respostas] == [None, None, None]
+    assert [resultado["quantidade"] for resultado, _ in respostas] == [15, 12, 14]
+    assert _quantidade(repositorio, produto) == 14
+    entradas = repositorio.ler_tabela("entrada")
+    saidas = repositorio.ler_tabela("saida")
+    assert list(entradas["QUANTIDADE"]) == [5, 2]
+    assert list(saidas["QUANTIDADE"]) == [3]
+    assert list(saidas["SOLICITANTE"]) == ["JOAO"]
+
+
+def test_lote_misto_com_varios_produtos(repositorio, produto):
+    outro = operacoes.cadastrar_produto(repositorio, "PORCA", 4, 1, "A2")
+    executar_comandos(repositorio, [
+        ("saida", {"codigo": produto, "quantidade": 10, "solicitante": "ANA"}),
+        ("entrada", {"codigo": outro, "quantidade": 6}),
+        ("entrada", {"codigo": produto, "quantidade": 1}),
+        ("saida", {"codigo": outro, "quantidade": 9, "solicitante": "ANA"}),
+    ])
+
+    assert _quantidade(repositorio, produto) == 1
+    assert _quantidade(repositorio, outro) == 1
+
+
+def test_saida_conta_com_as_entradas_anteriores_do_lote(repositorio, produto):
+    respostas = executar_comandos(repositorio, [
+        ("saida", {"codigo": produto, "quantidade": 12, "solicitante": "JOAO"}),
+        ("entrada", {"codigo": produto, "quantidade": 5}),
+        ("saida", {"codigo": produto, "quantidade": 12, "solicitante": "JOAO"}),
+    ])
+
+    assert "insuficiente" in respostas[0][1]
+    assert respostas[2] == ({"codigo": produto, "descricao": "PARAFUSO", "quantidade": 3}, None)
+    assert _quantidade(repositorio, produto) == 3
+
+
+def test_comando_com_erro_nao_impede_os_outros(repositorio, produto):
+    respostas = executar_comandos(repositorio, [
+        ("entrada", {"codigo": "999", "quantidade": 1}),
+        ("entrada", {"codigo": produto, "quantidade": "abc"}),
+        ("desconhecida", {}),
+        ("entrada", {"codigo": produto, "quantidade": 1}),
+    ])
+
+    assert [erro is None for _, erro in respostas] == [False, False, False, True]
+    assert _quantidade(repositorio, produto) == 11
+
+
+def test_falha_na_gravacao_marca_so_o_que_nao_foi_gravado(repositorio, produto, monkeypatch):
+    original = repositorio.movimentar_lote
+
+    def movimentar_lote(tabela, movimentos, versoes=None):
+        if tabela == "saida":
+            raise OSError("disco cheio")
+        original(tabela, movimentos, versoes)
+
+    monkeypatch.setattr(repositorio, "movimentar_lote", movimentar_lote)
+    respostas = executar_comandos(repositorio, [
+        ("cadastrar", {"descricao": "PORCA", "quantidade": 1, "valor_un": 1}),
+        ("entrada", {"codigo": produto, "quantidade": 5}),
+        ("saida", {"codigo": produto, "quantidade": 3, "solicitante": "JOAO"}),
+        ("entrada", {"codigo": produto, "quantidade": 2}),
+    ])
+
+    assert [erro for _, erro in respostas[:2]] == [None, None]
+    assert respostas[2][1] == respostas[3][1] == "Não gravado: disco cheio"
+    assert _quantidade(repositorio, produto) == 15
+
+
+def test_epis_e_retiradas_no_mesmo_lote(repositorio, pasta):
+    respostas = executar_comandos(repositorio, [
+        ("epi", {"ca": "123", "descricao": "LUVA", "quantidade": 10}),
+        ("retirada", {"colaborador": "ANA", "identificador": "LUVA", "quantidade": 4}),
+        ("epi", {"ca": "123", "quantidade": 2}),
+        ("retirada", {"colaborador": "BIA", "identificador": "123", "quantidade": 9}),
+    ])
+
+    assert [erro is None for _, erro in respostas] == [True, True, True, False]
+    epis = repositorio.ler_tabela("epis")
+    assert float(epis.loc[0, "QUANTIDADE"]) == 8
+    assert len(list((pasta / "Colaboradores" / "ANA").iterdir())) == 1
+
+
+def test_executar_juntos_nao_grava_nada_se_um_item_for_recusado(repositorio, produto):
+    with repositorio.travar(), pytest.raises(ErroOperacao, match="Item 2"):
+        executar_juntos(repositorio, [
+            ("entrada", {"codigo": produto, "quantidade": 5}),
+            ("saida", {"codigo": produto, "quantidade": 50, "solicitante": "JOAO"}),
+        ], "01/01/2026", "2026-01-01 00:00:00")
+
+    assert _quantidade(repositorio, produto) == 10
+    assert repositorio.ler_tabela("entrada").empty
+
+
+def test_executar_juntos_misto(repositorio, produto):
+    with repositorio.travar():
+        lote, resultados = executar_juntos(repositorio, [
+            ("saida", {"codigo": produto, "quantidade": 8, "solicitante": "JOAO"}),
+            ("entrada", {"codigo": produto, "quantidade": 5}),
+            ("saida", {"codigo": produto, "quantidade": 4, "solicitante": "JOAO"}),
+        ], "01/01/2026", "2026-01-01 00:00:00")
+
+    assert [resultado["quantidade"] for resultado in resultados] == [2, 7, 3]
+    assert _quantidade(repositorio, produto) == 3
+    assert isinstance(lote, Lote)
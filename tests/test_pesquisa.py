@@ -0,0 +1,121 @@
+import re
+import pandas as pd
+import pytest
+from armazenamento import esquema
+from esquema import aplicar_esquema, para_edicao
+from pesquisa import CachePesquisa, ErroConsulta, IndiceInvertido, compilar_consulta, normalizar, ranquear, semelhanca
+
+
+@pytest.fixture
+def estoque():
+    df = pd.DataFrame([
+        ["1", "LUVA NITRILICA", "12.5", "25", "2", "10:30 05/09/2026", "A3", "0"],
+        ["2", "PARAFUSO SEXTAVADO M6", "0.5", "50", "100", "08:00 01/10/2026", "B1", "0"],
+        ["3", "MÁSCARA PFF2", "4", "12", "3", "17:45 01/10/2026", "A3", "0"],
+        ["4", "LUVA DE RASPA", "9", "90", "10", "09:00 15/10/2026", "C2", "0"],
+    ], columns=list(esquema["estoque"]))
+    return para_edicao(aplicar_esquema(df, esquema["estoque"]))
+
+
+def _codigos(df):
+    return list(df["CODIGO"])
+
+
+def test_pesquisa_simples_em_todas_as_colunas(estoque):
+    cache = CachePesquisa()
+
+    assert _codigos(cache.filtrar(estoque, "luva")) == [1, 4]
+    assert _codigos(cache.filtrar(estoque, "luva d")) == [4]
+    assert _codigos(cache.filtrar(estoque, "a3")) == [1, 3]
+    # Um trecho que começa em uma coluna e termina na seguinte não é encontrado
+    assert _codigos(cache.filtrar(estoque, "pff2 4")) == []
+
+
+def test_pesquisa_regex(estoque):
+    cache = CachePesquisa()
+
+    assert _codigos(cache.filtrar(estoque, "re:^luva")) == [1, 4]
+    with pytest.raises(re.error):
+        cache.filtrar(estoque, "re:(")
+
+
+@pytest.mark.parametrize("consulta, codigos", [
+    ("loc:A3", [1, 3]),
+    ("loc:a3 qtd<5", [1, 3]),
+    ("qtd>=10", [2, 4]),
+    ("valor>5 desc:luva", [1, 4]),
+    ("valor_un<=0,5", [2]),
+    ("cod!=2 loc:a", [1, 3]),
+    ('desc:"de raspa"', [4]),
+    ("data:2026-10-01", [2, 3]),
+    ("data>=01/10/2026", [2, 3, 4]),
+    ("data<2026-10-01", [1]),
+    ("data>2026-10-01", [4]),
+    ("data=2026-10-01 17:45", [3]),
+    ("luva loc:c2", [4]),
+])
+def test_pesquisa_por_campo(estoque, consulta, codigos):
+    assert _codigos(CachePesquisa().filtrar(estoque, consulta)) == codigos
+
+
+@pytest.mark.parametrize("consulta", ["qtd<", "valor>abc", "data:ontem", "loc>A", 'desc:"luva'])
+def test_pesquisa_por_campo_invalida(estoque, consulta):
+    with pytest.raises(ErroConsulta):
+        CachePesquisa().filtrar(estoque, consulta)
+
+
+def test_coluna_que_a_tabela_nao_tem(estoque):
+    with pytest.raises(ErroConsulta, match="SOLICITANTE"):
+        CachePesquisa().filtrar(estoque, "sol:joao")
+
+
+def test_compilar_consulta():
+    assert compilar_consulta("luva") is None
+    assert compilar_consulta("http://x") is None
+    assert compilar_consulta("QTD<5 luva") == (("QUANTIDADE", "numero", "<", 5.0), (None, "texto", ":", "luva"))
+    assert compilar_consulta("loc:A3") is compilar_consulta("loc:A3")
+
+
+def test_cache_refeito_para_outra_tabela(estoque):
+    cache = CachePesquisa()
+    assert _codigos(cache.filtrar(estoque, "qtd<5")) == [1, 3]
+
+    alterado = estoque.copy()
+    alterado.loc[1, "QUANTIDADE"] = 1
+    assert _codigos(cache.filtrar(alterado, "qtd<5")) == [1, 2, 3]
+
+    estoque.loc[0, "QUANTIDADE"] = 50
+    cache.invalidar()
+    assert _codigos(cache.filtrar(estoque, "qtd<5")) == [3]
+
+
+def test_pesquisa_cancelada(estoque):
+    assert CachePesquisa().filtrar(estoque, "luva", cancelado=lambda: True) is None
+
+
+def test_indice_encontra_palavras_em_qualquer_ordem(estoque):
+    indice = IndiceInvertido()
+    indice.sincronizar(estoque)
+
+    assert _codigos(indice.filtrar(estoque, "raspa luva")) == [4]
+    assert _codigos(indice.filtrar(estoque, "mascara")) == [3]
+    # A pesquisa simples soma as linhas do índice às que contêm o texto
+    assert _codigos(CachePesquisa().filtrar(estoque, "sextavado parafuso", indice=indice)) == [2]
+    assert _codigos(CachePesquisa().filtrar(estoque, "b1", indice=indice)) == [2]
+
+
+def test_pesquisa_aproximada(estoque):
+    indice = IndiceInvertido()
+    indice.sincronizar(estoque)
+
+    assert _codigos(indice.filtrar_aproximado(estoque, "parafuzo")) == [2]
+    assert _codigos(indice.filtrar_aproximado(estoque, "luvas"))[:2] in ([1, 4], [4, 1])
+    assert indice.filtrar_aproximado(estoque, "xyzw").empty
+
+
+def test_ranquear_e_semelhanca():
+    documentos = [("1", "LUVA NITRILICA"), ("2", "PARAFUSO SEXTAVADO"), ("3", "PORCA")]
+
+    assert [codigo for codigo, _ in ranquear("parafuzo", documentos)] == ["2"]
+    assert semelhanca(["paraf"], normalizar("PARAFUSO")) > 0.9
+    assert normalizar("MÁSCARA Ç") == "mascara c"
@@ -0,0 +1,111 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+import operacoes
+from esquema import para_edicao
+from versoes import ConflitoVersao, comparar_versoes, mesclar_estoque, repetir_em_conflito, versao_produto
+
+
+def _tabela(*linhas):
+    return pd.DataFrame(
+        [[codigo, descricao, 2.5, 2.5 * quantidade, quantidade, "10:30 05/01/2026", "A1", versao]
+         for codigo, descricao, quantidade, versao in linhas],
+        columns=["CODIGO", "DESCRICAO", "VALOR UN", "VALOR TOTAL", "QUANTIDADE", "DATA", "LOCALIZACAO", "VERSAO"],
+    )
+
+
+def _codigos(inicio=100):
+    contador = itertools.count(inicio)
+    return lambda: next(contador)
+
+
+def test_mescla_so_as_linhas_editadas():
+    carregado = _tabela((1, "PARAFUSO", 10, 0), (2, "PORCA", 5, 0))
+    editado = carregado.copy()
+    editado.loc[0, "DESCRICAO"] = "PARAFUSO M6"
+    # Outra estação movimentou a porca, que não foi editada aqui
+    atual = _tabela((1, "PARAFUSO", 10, 0), (2, "PORCA", 3, 1))
+
+    mesclado, conflitos, novos = mesclar_estoque(atual, carregado, editado, _codigos())
+
+    assert conflitos == [] and novos == []
+    assert list(mesclado["DESCRICAO"]) == ["PARAFUSO M6", "PORCA"]
+    assert list(mesclado["VERSAO"]) == [1, 1]
+    assert mesclado.loc[1, "QUANTIDADE"] == 3
+
+
+def test_conflito_mantem_a_alteracao_da_outra_estacao():
+    carregado = _tabela((1, "PARAFUSO", 10, 0))
+    editado = carregado.copy()
+    editado.loc[0, "QUANTIDADE"] = 50
+    atual = _tabela((1, "PARAFUSO", 7, 1))
+
+    mesclado, conflitos, _ = mesclar_estoque(atual, carregado, editado, _codigos())
+
+    assert conflitos == [1]
+    assert mesclado.loc[0, "QUANTIDADE"] == 7
+
+
+def test_produto_excluido_por_outra_estacao_e_conflito():
+    carregado = _tabela((1, "PARAFUSO", 10, 0), (2, "PORCA", 5, 0))
+    editado = carregado.copy()
+    editado.loc[1, "QUANTIDADE"] = 6
+
+    mesclado, conflitos, _ = mesclar_estoque(_tabela((1, "PARAFUSO", 10, 0)), carregado, editado, _codigos())
+
+    assert conflitos == [2]
+    assert len(mesclado) == 1
+
+
+def test_linhas_acrescentadas_ganham_codigo_novo():
+    carregado = para_edicao(_tabela((1, "PARAFUSO", 10, 0)))
+    editado = carregado.copy()
+    editado.loc[1] = [np.nan, "ARRUELA", 1.0, 4.0, 4, "", "B2", np.nan]
+    editado.loc[2] = [np.nan, "", np.nan, np.nan, np.nan, " ", "", np.nan]
+
+    mesclado, conflitos, novos = mesclar_estoque(carregado, carregado, editado, _codigos())
+
+    # As células vazias da linha nova não fazem a linha carregada parecer editada
+    assert conflitos == [] and novos == [100]
+    assert list(mesclado["CODIGO"]) == [1, 100]
+    assert list(mesclado["VERSAO"]) == [0, 0]
+    assert mesclado.loc[1, "DESCRICAO"] == "ARRUELA"
+
+
+def test_comparar_versoes(repositorio, produto):
+    versao = versao_produto(repositorio.buscar_produto(produto))
+    with comparar_versoes(repositorio, {produto: versao}):
+        repositorio.atualizar_estoque(produto, 9)
+
+    with pytest.raises(ConflitoVersao) as erro, comparar_versoes(repositorio, {produto: versao}):
+        pass
+    assert erro.value.codigos == [produto]
+
+
+def test_repetir_em_conflito_rele_o_produto(repositorio, produto, monkeypatch):
+    tentativas = []
+    original = repositorio.buscar_produto
+
+    def buscar_produto(codigo):
+        linha = original(codigo)
+        if not tentativas:
+            # Na primeira leitura, outra estação movimenta o produto logo depois
+            tentativas.append(linha)
+            repositorio.atualizar_estoque(produto, 20)
+        return linha
+
+    with monkeypatch.context() as substituicao:
+        substituicao.setattr(repositorio, "buscar_produto", buscar_produto)
+        _, nova_quantidade = operacoes.registrar_entrada(repositorio, produto, 5)
+
+    assert nova_quantidade == 25
+    assert float(repositorio.buscar_produto(produto)[4]) == 25
+
+
+def test_repetir_em_conflito_desiste():
+    def sempre():
+        raise ConflitoVersao(["1"])
+
+    with pytest.raises(ConflitoVersao):
+        repetir_em_conflito(sempre, tentativas=2)
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import socket
+import threading
+from datetime import datetime
+
+
+class TravaArquivo:
+    """
+    Trava entre processos, inclusive em computadores diferentes que usam a mesma pasta
+    compartilhada, feita com um arquivo criado de forma exclusiva.
+    Enquanto a trava é mantida, o arquivo é renovado periodicamente; se ele ficar sem
+    renovação por mais de validade segundos (estação travada ou desligada), a trava é
+    considerada abandonada e pode ser tomada. O tempo é medido pelo relógio de quem espera,
+    então diferenças entre os relógios dos computadores não atrapalham. A tomada é feita com
+    o arquivo caminho + ".tomada", também criado de forma exclusiva: só quem o cria confere
+    e remove a trava abandonada, então duas estações esperando não tomam a trava ao mesmo tempo.
+    A mesma thread pode obtê-la de novo (as obtenções internas não esperam). O tempo de
+    espera de cada obtenção fica em ultima_espera e em estatisticas(); esperas a partir de
+    aviso segundos são anotadas em arquivo_log.
+    Com geracao=True, outra_estacao indica, a cada obtenção, se outra estação teve a trava
+    desde a última vez que esta a liberou (e pode ter alterado os dados protegidos), e
+    outras_estacoes conta as obtenções em que isso aconteceu.
+    """
+
+    def __init__(self, caminho, tempo_limite=30, validade=20, aviso=None, arquivo_log=None, geracao=False):
+        self.caminho = caminho
+        self.caminho_geracao = caminho + ".geracao" if geracao else None
+        self.caminho_tomada = caminho + ".tomada"
+        self.tomada_vista = None
+        self.tempo_limite = tempo_limite
+        self.validade = validade
+        self.aviso = aviso
+        self.arquivo_log = arquivo_log
+        self.estacao = f"{socket.gethostname()}:{os.getpid()}"
+        self.trava = threading.RLock()
+        self.nivel = 0
+        self.fd = None
+        self.parar = None
+        self.renovador = None
+        self.geracao = None
+        self.outra_estacao = True
+        self.outras_estacoes = 0
+        self.obtencoes = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.ultima_espera = 0.0
+
+    def __enter__(self):
+        self.obter()
+        return self
+
+    def __exit__(self, *excecao):
+        self.liberar()
+
+    def _ler(self):
+        try:
+            with open(self.caminho, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _ocupante(conteudo):
+        try:
+            return json.loads(conteudo)["estacao"]
+        except (ValueError, KeyError, TypeError):
+            return "desconhecida"
+
+    def _escrever(self, renovacao):
+        dados = json.dumps({"estacao": self.estacao, "renovacao": renovacao}).encode("utf-8")
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, dados.ljust(128))
+
+    def _renovar(self, parar):
+        renovacao = 0
+        while not parar.wait(self.validade / 4):
+            renovacao += 1
+            try:
+                self._escrever(renovacao)
+            except OSError:
+                pass
+
+    def obter(self):
+        """
+        Obtém a trava, esperando até tempo_limite segundos. Lança TimeoutError se não conseguir.
+        """
+        self.trava.acquire()
+        self.nivel += 1
+        if self.nivel > 1:
+            return
+        try:
+            self._obter_arquivo()
+        except BaseException:
+            self.nivel -= 1
+            self.trava.release()
+            raise
+
+    def _obter_arquivo(self):
+        inicio = time.monotonic()
+        visto, desde, ocupante = None, inicio, None
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        while True:
+            try:
+                self.fd = os.open(self.caminho, os.O_CREAT | os.O_EXCL | os.O_RDWR)
+                break
+            except FileExistsError:
+                conteudo = self._ler()
+                if conteudo is None:
+                    continue
+                agora = time.monotonic()
+                ocupante = self._ocupante(conteudo)
+                if conteudo != visto:
+                    visto, desde = conteudo, agora
+                elif agora - desde > self.validade:
+                    self._remover_abandonada(visto, ocupante)
+                    continue
+                if agora - inicio > self.tempo_limite:
+                    raise TimeoutError(
+                        f"Não foi possível obter a trava {self.caminho}: em uso por {ocupante} "
+                        f"há mais de {self.tempo_limite} segundos."
+                    )
+                time.sleep(0.05)
+
+        self._escrever(0)
+        self.parar = threading.Event()
+        self.renovador = threading.Thread(target=self._renovar, args=(self.parar,), daemon=True)
+        self.renovador.start()
+        if self.caminho_geracao:
+            self._atualizar_geracao()
+        self._registrar_espera(time.monotonic() - inicio, ocupante)
+
+    def _remover_abandonada(self, visto, ocupante):
+        """
+        Remove a trava abandonada, se ela ainda tiver o conteúdo visto. A conferência e a remoção
+        são feitas com o arquivo de tomada: outra estação que também viu a trava abandonada
+        espera e, ao conferir de novo, encontra a trava nova de quem a tomou.
+        """
+        try:
+            fd = os.open(self.caminho_tomada, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self._remover_tomada_abandonada()
+            time.sleep(0.05)
+            return
+        try:
+            if self._ler() == visto:
+                os.remove(self.caminho)
+                print(f"Trava {self.caminho} abandonada por {ocupante} removida.")
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+            os.remove(self.caminho_tomada)
+
+    def _remover_tomada_abandonada(self):
+        # A tomada dura só o tempo de conferir e remover a trava: se o mesmo arquivo de tomada
+        # continuar lá por mais de validade segundos, a estação que o criou parou no meio
+        try:
+            estado = os.stat(self.caminho_tomada)
+        except FileNotFoundError:
+            return
+        identidade, agora = (estado.st_ino, estado.st_mtime_ns), time.monotonic()
+        if self.tomada_vista is None or self.tomada_vista[0] != identidade:
+            self.tomada_vista = (identidade, agora)
+        elif agora - self.tomada_vista[1] > self.validade:
+            try:
+                os.remove(self.caminho_tomada)
+            except FileNotFoundError:
+                pass
+            self.tomada_vista = None
+
+    def _ler_geracao(self):
+        try:
+            with open(self.caminho_geracao, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def alterada(self):
+        """
+        Diz, sem obter a trava, se outra estação a obteve depois da última obtenção desta.
+        """
+        return self._ler_geracao() != self.geracao
+
+    def _atualizar_geracao(self):
+        # A geração muda a cada obtenção; se não for a gravada por esta estação na última vez,
+        # outra estação teve a trava nesse meio tempo (e pode ter alterado as planilhas).
+        atual = self._ler_geracao()
+        self.outra_estacao = atual != self.geracao
+        self.outras_estacoes += self.outra_estacao
+        self.geracao = atual + 1
+        temporario = f"{self.caminho_geracao}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(str(self.geracao))
+        os.replace(temporario, self.caminho_geracao)
+
+    def _registrar_espera(self, espera, ocupante):
+        self.obtencoes += 1
+        self.espera_total += espera
+        self.espera_maxima = max(self.espera_maxima, espera)
+        self.ultima_espera = espera
+        if self.aviso is None or espera < self.aviso:
+            return
+
+        mensagem = (
+            f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {self.estacao} esperou {espera:.3f} s "
+            f"pela trava (em uso por {ocupante})"
+        )
+        print(mensagem)
+        if self.arquivo_log:
+            try:
+                with open(self.arquivo_log, "a", encoding="utf-8") as f:
+                    f.write(mensagem + "\n")
+            except OSError:
+                pass
+
+    def liberar(self):
+        """
+        Libera a trava (só de fato quando a última obtenção da thread for liberada).
+        """
+        try:
+            self.nivel -= 1
+            if self.nivel > 0:
+                return
+            self.parar.set()
+            self.renovador.join()
+            os.close(self.fd)
+            self.fd = None
+            try:
+                os.remove(self.caminho)
+            except FileNotFoundError:
+                pass
+        finally:
+            self.trava.release()
+
+    def estatisticas(self):
+        """
+        Retorna o número de obtenções e os tempos de espera (total, máximo e último, em segundos).
+        """
+        with self.trava:
+            return {
+                "obtencoes": self.obtencoes,
+                "espera_total": self.espera_total,
+                "espera_maxima": self.espera_maxima,
+                "ultima_espera": self.ultima_espera
+            }
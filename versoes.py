@@ -0,0 +1,136 @@
+import time
+import random
+import contextlib
+import pandas as pd
+
+
+# Posição da coluna VERSAO nas linhas do estoque. A versão de um produto aumenta a cada
+# gravação dele; comparando-a, uma estação sabe se outra alterou o produto depois que ela o leu.
+POSICAO_VERSAO = 7
+
+
+class ConflitoVersao(Exception):
+    """
+    Um ou mais produtos foram alterados por outra estação depois de lidos.
+    codigos guarda os códigos em conflito.
+    """
+
+    def __init__(self, codigos):
+        self.codigos = list(codigos)
+        super().__init__(
+            f"Produto(s) alterado(s) por outra estação depois de lido(s): {', '.join(map(str, self.codigos))}"
+        )
+
+
+def _versao(valor):
+    try:
+        return 0 if pd.isna(valor) else int(float(valor or 0))
+    except (ValueError, TypeError):
+        return 0
+
+
+def versao_produto(produto):
+    """
+    Retorna a versão de uma linha do estoque (0 se ela ainda não tiver a coluna VERSAO).
+    """
+    return _versao(produto[POSICAO_VERSAO]) if len(produto) > POSICAO_VERSAO else 0
+
+
+def nova_versao(produto, versao):
+    """
+    Grava a versão na linha do estoque (uma lista), acrescentando a coluna se ela faltar.
+    """
+    if len(produto) <= POSICAO_VERSAO:
+        produto.extend([""] * (POSICAO_VERSAO + 1 - len(produto)))
+    produto[POSICAO_VERSAO] = str(versao)
+    return produto
+
+
+@contextlib.contextmanager
+def comparar_versoes(repositorio, versoes):
+    """
+    Bloco de gravação com compare-and-swap das versões. Sem versoes, não faz nada. Com versoes
+    ({codigo: versão lida}), obtém a trava entre estações e lança ConflitoVersao, sem gravar nada,
+    se algum desses produtos tiver mudado de versão.
+    """
+    if not versoes:
+        yield
+        return
+
+    with repositorio.travar():
+        conflitos = []
+        for codigo, versao in versoes.items():
+            produto = repositorio.buscar_produto(codigo)
+            if produto is None or versao_produto(produto) != versao:
+                conflitos.append(codigo)
+        if conflitos:
+            raise ConflitoVersao(conflitos)
+        yield
+
+
+def repetir_em_conflito(operacao, tentativas=5):
+    """
+    Executa operacao() e, enquanto ela lançar ConflitoVersao, executa de novo (relendo os
+    produtos), até tentativas vezes. A última ConflitoVersao é relançada.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return operacao()
+        except ConflitoVersao:
+            if tentativa == tentativas:
+                raise
+            # Espera um pouco, para que as estações em conflito não tentem juntas de novo
+            time.sleep(random.uniform(0, 0.05 * tentativa))
+
+
+def mesclar_estoque(atual, carregado, editado, novo_codigo):
+    """
+    Junta à tabela de estoque atual as linhas alteradas na tela (editado) em relação a como
+    foram carregadas (carregado). Uma linha editada só é aplicada se o produto continuar com
+    a versão carregada, e ganha uma nova versão; se outra estação o alterou nesse meio tempo,
+    a alteração dela é mantida e o código volta na lista de conflitos.
+    As linhas acrescentadas na tela (que não estavam em carregado) são incluídas no fim da
+    tabela com um código novo, obtido com novo_codigo(), e versão 0; linhas acrescentadas
+    e deixadas vazias são ignoradas.
+    As linhas não editadas ficam como estão na tabela atual.
+    Retorna (tabela mesclada, códigos em conflito, códigos das linhas incluídas).
+    """
+    atual = atual.copy()
+    acrescentadas = editado.index.difference(carregado.index, sort=False)
+    existentes = editado.drop(index=acrescentadas)
+    for coluna, tipo in carregado.dtypes.items():
+        # Uma linha acrescentada com células vazias transforma as colunas de inteiros em
+        # float; as linhas carregadas são comparadas com os tipos de quando foram carregadas
+        if coluna in existentes.columns and existentes[coluna].dtype != tipo:
+            try:
+                existentes[coluna] = existentes[coluna].astype(tipo)
+            except (ValueError, TypeError):
+                pass
+    carregado = carregado.reindex(existentes.index)
+    alteradas = (existentes.astype(str) != carregado.astype(str)).any(axis=1)
+
+    posicoes = {str(codigo): posicao for posicao, codigo in zip(atual.index, atual["CODIGO"])}
+    conflitos = []
+    for indice in existentes.index[alteradas]:
+        codigo = carregado.at[indice, "CODIGO"]
+        if pd.isna(codigo):
+            continue
+        posicao = posicoes.get(str(codigo))
+        versao = _versao(carregado.at[indice, "VERSAO"])
+        if posicao is None or _versao(atual.at[posicao, "VERSAO"]) != versao:
+            conflitos.append(codigo)
+            continue
+        linha = existentes.loc[indice].copy()
+        linha["VERSAO"] = versao + 1
+        atual.loc[posicao, linha.index] = linha.values
+
+    novas = editado.loc[acrescentadas]
+    novas = novas[~(novas.isna() | (novas.astype(str).apply(lambda coluna: coluna.str.strip()) == "")).all(axis=1)]
+    codigos = []
+    if not novas.empty:
+        novas = novas.copy()
+        codigos = [int(novo_codigo()) for _ in range(len(novas))]
+        novas["CODIGO"] = codigos
+        novas["VERSAO"] = 0
+        atual = pd.concat([atual, novas.reindex(columns=atual.columns)], ignore_index=True)
+    return atual, conflitos, codigos